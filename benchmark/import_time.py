@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+# modules imported by the command line tools
+modules = ["crseg.segmentation", "crseg.batch", "crseg.cmd"]
+
+# dependencies that are long to import, and that should only be loaded when needed
+heavy_modules = ["osmnx", "pandas", "geopandas", "shapely", "requests", "matplotlib"]
+
+root_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# import the given module in a new interpreter, and return the import time (in seconds) and the heavy modules loaded
+def measure(module):
+    code = "import sys, time; t = time.perf_counter(); import %s; t = time.perf_counter() - t; " \
+           "print(t); print(' '.join([m for m in %s if m in sys.modules]))" % (module, repr(heavy_modules))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root_directory] + ([os.environ["PYTHONPATH"]] if "PYTHONPATH" in os.environ else [])))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        return None, result.stderr.strip().split("\n")[-1]
+    lines = result.stdout.split("\n")
+    return float(lines[0]), lines[1].split()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the import time of the modules used by the command line tools (in a new interpreter for each run), and check that the dependencies that are long to import are not loaded.")
+    parser.add_argument('--modules', nargs='+', help='Measured modules. Default: %s.' % " ".join(modules), default=modules)
+    parser.add_argument('--repeat', help='Number of runs for each module. Default: 5.', type=int, default=5)
+    parser.add_argument('--max-time', help='Exit with an error if a module takes more than this time (in seconds) to import.', type=float)
+    parser.add_argument('-o', '--output', help='Output JSON file. Default: standard output.', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+    for module in args.modules:
+        runs = [measure(module) for i in range(args.repeat)]
+        times = [t for t, loaded in runs if t != None]
+        if len(times) == 0:
+            # the module cannot be imported (missing dependency)
+            results.append({ "module": module, "error": runs[0][1] })
+            print("%s: %s" % (module, runs[0][1]), file=sys.stderr)
+            continue
+        loaded = runs[0][1]
+        # the minimum is the least noisy estimation of the import time
+        results.append({ "module": module, "time": min(times), "runs": times, "heavy_modules": loaded })
+        print("%s: %.3fs%s" % (module, min(times), (" (loads %s)" % ", ".join(loaded)) if len(loaded) != 0 else ""), file=sys.stderr)
+        if len(loaded) != 0 or (args.max_time != None and min(times) > args.max_time):
+            failed = True
+
+    json.dump({ "python": sys.version, "repeat": args.repeat, "modules": results }, args.output, indent=1)
+    if failed:
+        exit(1)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import osmnx as ox
+
+import crseg.segmentation as cs
+import crseg.osm_reader as osm
+import crseg.simple_graph as sg
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticNetwork
+
+
+# directory of the bundled OSM XML snapshots
+data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+# stages that are not part of the pipeline
+reference_stages = ["loading_osmnx"]
+
+
+# run the complete pipeline on an OSM XML file, as the command line tool does, and return the time spent
+# in each stage. The loading using OSMnx is also timed, as a reference.
+def run_once(filename):
+    timings = {}
+
+    t = time.perf_counter()
+    ox.graph_from_xml(filename, simplify=False)
+    timings["loading_osmnx"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    G = osm.OSMReader.read_graph(filename)
+    timings["loading"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    G = cs.Segmentation.prepare_network(G)
+    timings["prepare_network"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    G = ox.utils_graph.get_undirected(G)
+    timings["undirected"] = time.perf_counter() - t
+
+    # the segmentation runs on a simple graph
+    t = time.perf_counter()
+    G = sg.SimpleGraph.from_graph(G)
+    timings["simple_graph"] = time.perf_counter() - t
+
+    # the initialisation computes the reliability scores
+    t = time.perf_counter()
+    seg = cs.Segmentation(G)
+    timings["init"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    seg.process()
+    timings["process"] = time.perf_counter() - t
+    stats = seg.get_stats()
+    for stage in stats["timers"]:
+        if stage != "reliability":
+            timings["process." + stage] = stats["timers"][stage]
+
+    size = { "nodes": len(G.nodes), "edges": len(G.edges),
+             "crossroads": len([rid for rid in seg.regions if seg.regions[rid].is_crossroad()]),
+             "inner_regions": len(seg.inner_regions),
+             "counters": stats["counters"] }
+    return timings, size
+
+
+def run_case(case, filename, repeat):
+    runs = []
+    for i in range(repeat):
+        timings, size = run_once(filename)
+        runs.append(timings)
+    case.update(size)
+    # the minimum is the least noisy estimation of the running time
+    case["timings"] = { stage: min([r[stage] for r in runs]) for stage in runs[0] }
+    case["median"] = { stage: statistics.median([r[stage] for r in runs]) for stage in runs[0] }
+    case["runs"] = runs
+    return case
+
+
+def get_environment():
+    return { "date": datetime.datetime.now().isoformat(),
+             "python": platform.python_version(),
+             "platform": platform.platform(),
+             "osmnx": ox.__version__ }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the running time of each stage of the segmentation on synthetic networks and on OSM XML snapshots. Results are saved in a JSON file.")
+    parser.add_argument('--kinds', nargs='+', help='Kinds of synthetic networks. Default: all.', choices=SyntheticNetwork.kinds, default=SyntheticNetwork.kinds)
+    parser.add_argument('--radius', nargs='+', help='Half size (in meter) of the synthetic networks. Default: 150 500 1000 2000 5000.', type=float, default=[150, 500, 1000, 2000, 5000])
+    parser.add_argument('--osm', nargs='*', help='OSM XML snapshots. Default: the files of the benchmark/data directory.')
+    parser.add_argument('--no-synthetic', help='Only use the OSM XML snapshots', action='store_true')
+    parser.add_argument('--repeat', help='Number of runs for each network. Default: 3.', type=int, default=3)
+    parser.add_argument('--seed', help='Seed used to generate the synthetic networks. Default: 1.', type=int, default=1)
+    parser.add_argument('-o', '--output', help='Output JSON file. Default: standard output.', type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument('-v', '--verbose', help='Verbose messages', action='store_true')
+    args = parser.parse_args()
+
+    # same tags as the command line tool
+    ox.settings.useful_tags_way = ox.settings.useful_tags_way + ["cycleway", "cycleway:right", "cycleway:left", "psv"]
+
+    cases = []
+    snapshots = args.osm if args.osm != None else sorted(glob.glob(os.path.join(data_directory, "*.osm")))
+    for filename in snapshots:
+        cases.append(({ "name": os.path.basename(filename), "source": "snapshot" }, filename))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if not args.no_synthetic:
+            for radius in args.radius:
+                for kind in args.kinds:
+                    filename = os.path.join(tmpdir, "%s-%d.osm" % (kind, radius))
+                    SyntheticNetwork(kind, radius, seed = args.seed).to_osm_xml(filename)
+                    cases.append(({ "name": "%s-%d" % (kind, radius), "source": "synthetic", "kind": kind, "radius": radius }, filename))
+
+        results = []
+        for case, filename in cases:
+            if args.verbose:
+                print("=== %s ===" % case["name"], file=sys.stderr)
+            results.append(run_case(case, filename, args.repeat))
+            if args.verbose:
+                print(" nodes: %d, total: %.3fs" % (results[-1]["nodes"], sum([results[-1]["timings"][s] for s in results[-1]["timings"] if not s.startswith("process.") and not s in reference_stages])), file=sys.stderr)
+
+    json.dump({ "environment": get_environment(), "repeat": args.repeat, "cases": results }, args.output, indent=1)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import math
+import random
+from xml.sax.saxutils import quoteattr
+
+
+class SyntheticNetwork:
+
+    # approximated length of a degree of latitude (in meters)
+    meters_by_degree = 111320
+
+    kinds = ["grid", "roundabouts", "dual_carriageways", "ring_junctions"]
+
+    highways = ["primary", "secondary", "tertiary", "residential", "residential", "unclassified"]
+
+    # a street network covering the square of half size radius (in meters) around the given coordinates,
+    # made of a grid of streets (one intersection every spacing meters, one node every step meters).
+    # Depending on the kind, some intersections are replaced by roundabouts or ring junctions, or some
+    # avenues are dual carriageways. The generation is deterministic for a given seed.
+    def __init__(self, kind, radius, latitude = 45.77, longitude = 3.08, spacing = 100, step = 20, seed = 1):
+        if not kind in SyntheticNetwork.kinds:
+            raise ValueError("Unknown network kind: %s" % kind)
+        self.kind = kind
+        self.radius = radius
+        self.latitude = latitude
+        self.longitude = longitude
+        self.spacing = spacing
+        self.step = step
+        self.random = random.Random(seed)
+
+        # node id -> (x, y, tags), with (x, y) in meters from the center
+        self.nodes = {}
+        # list of (node ids, tags)
+        self.ways = []
+        self.next_id = 1
+
+        self.build()
+
+    def add_node(self, x, y, tags = None):
+        self.nodes[self.next_id] = (x, y, tags if tags != None else {})
+        self.next_id += 1
+        return self.next_id - 1
+
+    def add_way(self, ids, tags):
+        self.ways.append((ids, tags))
+
+    # add a way between two existing nodes, with intermediate nodes. Nodes close to
+    # the extremities can be crossings, traffic signals or stops.
+    def add_street(self, a, b, tags):
+        xa, ya, _ = self.nodes[a]
+        xb, yb, _ = self.nodes[b]
+        nb = max(1, int(math.hypot(xb - xa, yb - ya) // self.step))
+        ids = [a]
+        for i in range(1, nb):
+            t = {}
+            if i == 1 or i == nb - 1:
+                r = self.random.random()
+                if r < 0.3:
+                    t = {"highway": "crossing"}
+                elif r < 0.4:
+                    t = {"highway": "traffic_signals"}
+                elif r < 0.45:
+                    t = {"highway": "stop"}
+            ids.append(self.add_node(xa + i * (xb - xa) / nb, ya + i * (yb - ya) / nb, t))
+        ids.append(b)
+        self.add_way(ids, tags)
+        return ids
+
+    # add a ring of nb nodes, and return its nodes
+    def add_ring(self, x, y, radius, nb, tags, oneway):
+        ring = [self.add_node(x + radius * math.cos(2 * math.pi * k / nb), y + radius * math.sin(2 * math.pi * k / nb)) for k in range(nb)]
+        if oneway:
+            self.add_way(ring + [ring[0]], dict(tags, oneway = "yes"))
+        else:
+            # a ring junction is made of two-way segments
+            for k in range(nb):
+                self.add_way([ring[k], ring[(k + 1) % nb]], dict(tags))
+        return ring
+
+    def is_roundabout(self, i, j):
+        return self.kind == "roundabouts" and (i + j) % 3 == 0
+
+    def is_ring_junction(self, i, j):
+        return self.kind == "ring_junctions" and i % 4 == 2 and j % 4 == 2
+
+    def is_dual_carriageway(self, i):
+        return self.kind == "dual_carriageways" and i % 4 == 1
+
+    # build the intersection (i, j), and return the node where each street (east, north, west, south) is attached.
+    # For dual carriageways, north and south are pairs of nodes (one by carriageway).
+    def build_intersection(self, i, j, x, y):
+        if self.is_roundabout(i, j):
+            ring = self.add_ring(x, y, 15, 12, {"highway": "secondary", "junction": "roundabout"}, True)
+            return {"E": ring[0], "N": ring[3], "W": ring[6], "S": ring[9]}
+        elif self.is_ring_junction(i, j):
+            ring = self.add_ring(x, y, 40, 8, {"highway": "tertiary", "name": "Ring %d %d" % (i, j)}, False)
+            return {"E": ring[0], "N": ring[2], "W": ring[4], "S": ring[6]}
+        elif self.is_dual_carriageway(i):
+            left = self.add_node(x - 5, y)
+            right = self.add_node(x + 5, y)
+            self.add_way([left, right], {"highway": "secondary", "name": "Rue %d" % j})
+            return {"E": right, "N": (left, right), "W": left, "S": (left, right)}
+        else:
+            n = self.add_node(x + self.random.uniform(-5, 5), y + self.random.uniform(-5, 5))
+            return {"E": n, "N": n, "W": n, "S": n}
+
+    def build(self):
+        nb = int(2 * self.radius // self.spacing) + 1
+        start = -(nb - 1) * self.spacing / 2
+        ports = {}
+        for i in range(nb):
+            for j in range(nb):
+                ports[(i, j)] = self.build_intersection(i, j, start + i * self.spacing, start + j * self.spacing)
+
+        # east-west streets
+        for j in range(nb):
+            tags = {"highway": SyntheticNetwork.highways[j % len(SyntheticNetwork.highways)], "name": "Rue %d" % j}
+            for i in range(nb - 1):
+                self.add_street(ports[(i, j)]["E"], ports[(i + 1, j)]["W"], dict(tags))
+
+        # north-south avenues
+        for i in range(nb):
+            tags = {"highway": SyntheticNetwork.highways[(i + 2) % len(SyntheticNetwork.highways)], "name": "Avenue %d" % i}
+            for j in range(nb - 1):
+                if self.is_dual_carriageway(i):
+                    self.add_street(ports[(i, j)]["N"][0], ports[(i, j + 1)]["S"][0], dict(tags, oneway = "yes"))
+                    self.add_street(ports[(i, j + 1)]["S"][1], ports[(i, j)]["N"][1], dict(tags, oneway = "yes"))
+                else:
+                    self.add_street(ports[(i, j)]["N"], ports[(i, j + 1)]["S"], dict(tags))
+
+        # elements removed by the preprocessing: footways, cycleways and parking aisles
+        for k in range(nb * nb // 4):
+            i = self.random.randrange(nb - 1)
+            j = self.random.randrange(nb - 1)
+            tags = self.random.choice([{"highway": "footway"}, {"highway": "cycleway"}, {"highway": "service", "service": "parking_aisle"}])
+            a = ports[(i, j)]["E"]
+            b = ports[(i + 1, j + 1)]["W"]
+            self.add_street(a, b, tags)
+
+    def to_osm_xml(self, filename):
+        scale_x = SyntheticNetwork.meters_by_degree * math.cos(math.radians(self.latitude))
+        with open(filename, "w") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="crseg synthetic network">\n')
+            for n, (x, y, tags) in self.nodes.items():
+                f.write(' <node id="%d" lat="%.7f" lon="%.7f" version="1"' % (n, self.latitude + y / SyntheticNetwork.meters_by_degree, self.longitude + x / scale_x))
+                if len(tags) == 0:
+                    f.write('/>\n')
+                else:
+                    f.write('>\n')
+                    for k in tags:
+                        f.write('  <tag k=%s v=%s/>\n' % (quoteattr(k), quoteattr(tags[k])))
+                    f.write(' </node>\n')
+            for i, (ids, tags) in enumerate(self.ways):
+                f.write(' <way id="%d" version="1">\n' % (i + 1))
+                for n in ids:
+                    f.write('  <nd ref="%d"/>\n' % n)
+                for k in tags:
+                    f.write('  <tag k=%s v=%s/>\n' % (quoteattr(k), quoteattr(tags[k])))
+                f.write(' </way>\n')
+            f.write('</osm>\n')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic street network in OSM XML.")
+    parser.add_argument('kind', help='Kind of network', choices=SyntheticNetwork.kinds)
+    parser.add_argument('radius', help='Half size (in meter) of the generated region', type=float)
+    parser.add_argument('output', help='OSM XML file')
+    parser.add_argument('--seed', help='Seed of the random generator. Default: 1.', type=int, default=1)
+    args = parser.parse_args()
+
+    SyntheticNetwork(args.kind, args.radius, seed = args.seed).to_osm_xml(args.output)
@@ -0,0 +1,122 @@
+import weakref
+import numpy as np
+import networkx as nx
+
+
+from . import simple_graph as sg
+from . import graph_core as gc
+
+
+class AttributeStore:
+
+    # one store per graph, built on first use
+    stores = weakref.WeakKeyDictionary()
+
+    # the last used store, to avoid a lookup in stores for successive queries on the same graph
+    last = None
+
+    # node and edge attributes (reliability scores, region labels) stored in numpy arrays
+    # indexed by the contiguous ids of the graph core. During the processing, the store is the reference:
+    # the values are written back in the graph attributes only by write_to_graph (before an export)
+    def __init__(self, G):
+        self.graph = weakref.ref(G)
+        core = gc.GraphCore.get(G)
+        self.nodes = core.nodes
+        self.node_index = core.index
+
+        # edges of the (simple) graph, indexed in both directions
+        core.build_edges()
+        self.edges = core.edges
+        self.edge_index = core.edge_index
+        self.edge_ends = core.edge_ends
+
+        self.node_columns = {}
+        self.edge_columns = {}
+        # memoryviews on the columns, faster than numpy for single element access
+        self.node_values = {}
+        self.edge_values = {}
+
+    def get(G):
+        store = AttributeStore.last
+        if store != None and store.graph() is G and len(store.nodes) == len(G._node):
+            return store
+        store = AttributeStore.stores.get(G)
+        if store == None or len(store.nodes) != len(G._node):
+            store = AttributeStore(G)
+            AttributeStore.stores[G] = store
+        AttributeStore.last = store
+        return store
+
+    # float values are stored in float32 arrays, integer values in int32 arrays
+    def get_dtype(values):
+        if all([isinstance(v, (int, np.integer)) for v in values]):
+            return np.int32
+        else:
+            return np.float32
+
+    # indices of the two nodes of each edge
+    def get_edge_ends(self):
+        return self.edge_ends
+
+    ######################### columns ########################
+
+    def set_node_column(self, name, column):
+        self.node_columns[name] = column
+        self.node_values[name] = memoryview(column)
+
+    def set_edge_column(self, name, column):
+        self.edge_columns[name] = column
+        self.edge_values[name] = memoryview(column)
+
+    def init_node_column(self, name, value, dtype = np.float32):
+        self.set_node_column(name, np.full(len(self.nodes), value, dtype=dtype))
+
+    def init_edge_column(self, name, value, dtype = np.float32):
+        self.set_edge_column(name, np.full(len(self.edges), value, dtype=dtype))
+
+    # a column that is not yet in the store is loaded from the graph attributes
+    # (for example when the graph has been loaded from a GraphML file)
+    def load_node_column(self, name):
+        G = self.graph()
+        values = [G.nodes[n][name] for n in self.nodes]
+        self.set_node_column(name, np.array(values, dtype=AttributeStore.get_dtype(values)))
+
+    def load_edge_column(self, name):
+        G = self.graph()
+        values = [sg.SimpleGraph.edge(G, e[0], e[1])[name] for e in self.edges]
+        self.set_edge_column(name, np.array(values, dtype=AttributeStore.get_dtype(values)))
+
+    ######################### single element access ########################
+
+    def get_node(self, name, n):
+        if not name in self.node_values:
+            self.load_node_column(name)
+        return self.node_values[name][self.node_index[n]]
+
+    def set_node(self, name, n, value):
+        if not name in self.node_values:
+            self.load_node_column(name)
+        self.node_values[name][self.node_index[n]] = value
+
+    # edges are given as (u, v)
+    def get_edge(self, name, e):
+        if not name in self.edge_values:
+            self.load_edge_column(name)
+        return self.edge_values[name][self.edge_index[tuple(e)]]
+
+    def set_edge(self, name, e, value):
+        if not name in self.edge_values:
+            self.load_edge_column(name)
+        self.edge_values[name][self.edge_index[tuple(e)]] = value
+
+    ######################### export ########################
+
+    # write all the columns in the attributes of the graph
+    def write_to_graph(self, G):
+        for name in self.node_columns:
+            nx.set_node_attributes(G, dict(zip(self.nodes, self.node_columns[name].tolist())), name)
+        for name in self.edge_columns:
+            nx.set_edge_attributes(G, dict(zip(self.edges, self.edge_columns[name].tolist())), name)
+
+
+gc.GraphCore.register(AttributeStore, AttributeStore.stores)
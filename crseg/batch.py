@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import concurrent.futures
+import networkx as nx
+
+
+from . import segmentation as cs
+from . import region as rg
+from . import utils as u
+from . import geometry as geo
+from . import simple_graph as sg
+
+
+class Batch:
+
+    # graph (and its ways) used by the queries processed in a worker process
+    worker_graph = None
+    worker_ways = None
+
+    # a list of queries (name, latitude, longitude) processed using a single graph covering all of them.
+    # Each query is segmented on the part of this graph given by its own region (the square of half size
+    # radius) as the OSM API does: the ways with at least one node in the region, with all their nodes,
+    # then the largest connected component, as a single run of the command line tool would do.
+    def __init__(self, queries, radius = 150, multiscale = False, parameters = {}):
+        self.queries = queries
+        self.radius = radius
+        self.multiscale = multiscale
+        self.parameters = parameters
+        self.G = None
+        self.ways = None
+        self.timings = {}
+
+    # load queries from a JSON file (a dictionary name -> {latitude, longitude} as in crossroads-by-name.json,
+    # or a list of [latitude, longitude]), or from a text file (one "latitude longitude [name]" by line)
+    def load_queries(filename):
+        with open(filename) as f:
+            content = f.read()
+        if os.path.splitext(filename)[1] == ".json":
+            data = json.loads(content)
+            if isinstance(data, dict):
+                return [(name, data[name]["latitude"], data[name]["longitude"]) for name in data]
+            else:
+                return [(str(i), q[0], q[1]) for i, q in enumerate(data)]
+        result = []
+        for line in content.splitlines():
+            fields = line.replace(",", " ").split()
+            if len(fields) < 2 or fields[0].startswith("#"):
+                continue
+            name = " ".join(fields[2:]) if len(fields) > 2 else str(len(result))
+            result.append((name, float(fields[0]), float(fields[1])))
+        return result
+
+    # bounding box (west, south, east, north) containing the regions of all the queries
+    def get_bbox(self):
+        bboxes = [u.Util.get_bbox(q[1], q[2], self.radius) for q in self.queries]
+        return (min([b[0] for b in bboxes]), min([b[1] for b in bboxes]), max([b[2] for b in bboxes]), max([b[3] for b in bboxes]))
+
+    # download (if G is not given) and prepare the covering graph
+    def load_graph(self, G = None, overpass = False, cache = None):
+        import osmnx as ox
+
+        t = time.time()
+        if G == None:
+            G = u.Util.get_osm_data_by_bbox(self.get_bbox(), overpass, ["cycleway", "cycleway:right", "cycleway:left", "psv"], cache = cache)
+            if G == None:
+                return False
+        self.timings["loading"] = time.time() - t
+
+        t = time.time()
+        G = cs.Segmentation.prepare_network(G, keep_all_components=True)
+        self.G = sg.SimpleGraph.from_graph(ox.utils_graph.get_undirected(G))
+        self.ways = Batch.get_ways(self.G)
+        self.timings["preprocessing"] = time.time() - t
+        return True
+
+    # ways of the graph, given by the edges of each osmid, and the osmids of the ways of each node
+    def get_ways(G):
+        edges = {}
+        node_ways = {}
+        for u, v, osmid in G.edges(data="osmid"):
+            for o in osmid if isinstance(osmid, list) else [osmid]:
+                edges.setdefault(o, []).append((u, v))
+                node_ways.setdefault(u, set()).add(o)
+                node_ways.setdefault(v, set()).add(o)
+        return edges, node_ways
+
+    # return the largest connected component of the ways with at least one node in the given bounding box
+    def extract_graph(G, ways, bbox):
+        edges, node_ways = ways
+        geometry = geo.Geometry.get(G)
+        inside = (geometry.x >= bbox[0]) & (geometry.y >= bbox[1]) & (geometry.x <= bbox[2]) & (geometry.y <= bbox[3])
+        osmids = set([o for n, i in zip(geometry.nodes, inside) if i for o in node_ways.get(n, [])])
+        kept = set([e for o in osmids for e in edges[o]])
+        H = Batch.get_subgraph(G, lambda u, v: (u, v) in kept or (v, u) in kept)
+        if len(H) == 0:
+            return H
+        component = max(nx.connected_components(H), key=len)
+        if len(component) == len(H):
+            return H
+        return Batch.get_subgraph(H, lambda u, v: u in component)
+
+    # a copy of the graph restricted to the edges accepted by the given function (and their nodes). As in the
+    # graph built for a single run, the nodes and the neighbours of each node are kept in the order of the graph
+    # (the subgraph views of networkx iterate over the set of nodes when it is small)
+    def get_subgraph(G, accept):
+        result = nx.Graph()
+        result.graph.update(G.graph)
+        # the two directions of an edge share the same attributes
+        data = {}
+        for n in G._node:
+            adjacency = {nb: data.setdefault(id(d), dict(d)) for nb, d in G._adj[n].items() if accept(n, nb)}
+            if len(adjacency) != 0:
+                result._node[n] = dict(G._node[n])
+                result._adj[n] = adjacency
+        return result
+
+    def process_query(G, ways, query, radius, multiscale, parameters):
+        name, latitude, longitude = query
+        result = {"name": name, "latitude": latitude, "longitude": longitude, "timings": {}}
+        start = time.time()
+
+        G = Batch.extract_graph(G, ways, u.Util.get_bbox(latitude, longitude, radius))
+        result["timings"]["extraction"] = time.time() - start
+        if len(G) == 0:
+            result["error"] = "There is no street in this region"
+            return result
+
+        # region ids are the same as in a single run. The counter is restored afterwards
+        id_region = rg.Region.id_region
+        rg.Region.id_region = 0
+        try:
+            t = time.time()
+            seg = cs.Segmentation(G, **parameters)
+            result["timings"]["initialisation"] = time.time() - t
+
+            t = time.time()
+            seg.process()
+            result["timings"]["segmentation"] = time.time() - t
+        finally:
+            rg.Region.id_region = id_region
+
+        if len([rid for rid in seg.regions if seg.regions[rid].is_crossroad()]) == 0:
+            result["error"] = "There is no crossroad in this region"
+        else:
+            result["crossroads"] = [x.to_json_data() for x in seg.get_crossroad(longitude, latitude, multiscale)]
+        result["timings"]["total"] = time.time() - start
+        return result
+
+    def init_worker(G, ways):
+        Batch.worker_graph = G
+        Batch.worker_ways = ways
+
+    def process_query_in_worker(query, radius, multiscale, parameters):
+        return Batch.process_query(Batch.worker_graph, Batch.worker_ways, query, radius, multiscale, parameters)
+
+    # process all the queries, using a pool of worker processes if workers is greater than 1.
+    # Results are given in the order of the queries.
+    def process(self, workers = None):
+        t = time.time()
+        nb = len(self.queries)
+        if workers == None or workers <= 1:
+            results = [Batch.process_query(self.G, self.ways, q, self.radius, self.multiscale, self.parameters) for q in self.queries]
+        else:
+            # the graph is sent only once to each worker
+            with concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = Batch.init_worker, initargs = (self.G, self.ways)) as executor:
+                results = list(executor.map(Batch.process_query_in_worker, self.queries, [self.radius] * nb, [self.multiscale] * nb, [self.parameters] * nb))
+        self.timings["queries"] = time.time() - t
+        return results
+
+    def to_json(self, filename, results):
+        with open(filename, 'w') as outfile:
+            json.dump({"timings": self.timings, "queries": results}, outfile)
@@ -0,0 +1,128 @@
+import weakref
+
+
+from . import geometry as geo
+from . import graph_core as gc
+from . import instrumentation as ins
+
+
+class Chain:
+
+    # a polyline starting from a node and following middle nodes (nodes with two neighbors)
+    # until a biffurcation (or a dead end) is reached
+    def __init__(self, path, lengths):
+        self.path = path
+        # lengths[i] is the length of the polyline path[0..i], accumulated in the path order
+        self.lengths = lengths
+        # position of the first middle node that is a weak boundary (-1 if none, None if not yet computed)
+        self.boundary = None
+
+    def end(self):
+        return self.path[-1]
+
+    def length(self):
+        return self.lengths[-1]
+
+
+class ChainIndex:
+
+    # one index per graph, built on first use
+    indices = weakref.WeakKeyDictionary()
+
+    # the last used index, to avoid a lookup in indices for successive queries on the same graph
+    last = None
+
+    # chains are indexed by their (node, neighbor) start
+    def __init__(self, G):
+        self.graph = weakref.ref(G)
+        self.nb_nodes = len(G._node)
+        self.chains = {}
+
+    def get(G):
+        index = ChainIndex.last
+        if index != None and index.graph() is G and index.nb_nodes == len(G._node):
+            return index
+        index = ChainIndex.indices.get(G)
+        if index == None or index.nb_nodes != len(G._node):
+            index = ChainIndex(G)
+            ChainIndex.indices[G] = index
+        ChainIndex.last = index
+        return index
+
+    # compute all the chains starting from a non-middle node
+    def build(self, G):
+        core = gc.GraphCore.get(G)
+        for n, nbs in zip(core.nodes, core.neighbours):
+            if len(nbs) != 2:
+                for nb in nbs:
+                    self.get_chain(G, n, nb)
+
+    # weak boundaries depend on the reliability, that can be recomputed
+    def clear_boundaries(self):
+        for c in self.chains.values():
+            c.boundary = None
+
+    # the walk is done on the contiguous ids of the graph core, the path is given with the node ids
+    def walk(G, n1, n2):
+        ins.Instrumentation.count("chain_walks")
+        core = gc.GraphCore.get(G)
+        geometry = geo.Geometry.get(G)
+        adjacency = core.adjacency
+        first = core.index[n1]
+        path = [first, core.index[n2]]
+        length = geometry.distance_by_index(first, path[1])
+        lengths = [0, length]
+        # stop if the polyline is a loop going back to the first node
+        while len(adjacency[path[-1]]) == 2 and path[-1] != first:
+            nb1, nb2 = adjacency[path[-1]]
+            path.append(nb1 if nb1 != path[-2] else nb2)
+            length += geometry.distance_by_index(path[-2], path[-1])
+            lengths.append(length)
+        return Chain([core.nodes[i] for i in path], lengths)
+
+    def get_chain(self, G, n1, n2):
+        key = (n1, n2)
+        if not key in self.chains:
+            chain = ChainIndex.walk(G, n1, n2)
+            self.chains[key] = chain
+            # the reversed chain is the same polyline if it starts from a non-middle node
+            core = gc.GraphCore.get(G)
+            if core.degree(n1) != 2 and core.degree(chain.end()) != 2:
+                rkey = (chain.path[-1], chain.path[-2])
+                if not rkey in self.chains:
+                    self.chains[rkey] = ChainIndex.walk(G, rkey[0], rkey[1])
+        return self.chains[key]
+
+    # return the polyline starting from n1 and n2 until a biffurcation, stopping
+    # after the first node reaching the given maximum length (if max >= 0)
+    def get_path(self, G, n1, n2, max = -1):
+        chain = self.get_chain(G, n1, n2)
+        if max < 0:
+            return list(chain.path)
+        last = 1
+        while last < len(chain.path) - 1 and chain.lengths[last] < max:
+            last += 1
+        return chain.path[:last + 1]
+
+    def get_length(self, G, n1, n2):
+        return self.get_chain(G, n1, n2).length()
+
+    # return the polyline starting from n1 and n2 until a middle node that is a weak boundary,
+    # or an empty path if a biffurcation (or the maximum length if max >= 0) is reached before.
+    def get_path_to_boundary(self, G, n1, n2, is_boundary, max = -1):
+        chain = self.get_chain(G, n1, n2)
+        if chain.boundary == None:
+            chain.boundary = -1
+            core = gc.GraphCore.get(G)
+            for i in range(1, len(chain.path)):
+                if core.degree(chain.path[i]) != 2:
+                    break
+                if is_boundary(G, chain.path[i]):
+                    chain.boundary = i
+                    break
+        if chain.boundary == -1 or (max >= 0 and chain.lengths[chain.boundary] >= max):
+            return []
+        return chain.path[:chain.boundary + 1]
+
+
+gc.GraphCore.register(ChainIndex, ChainIndex.indices)
@@ -1,5 +1,4 @@
 
-import osmnx as ox
 import itertools
 
 
@@ -7,6 +6,11 @@ from . import reliability as rl
 from . import region as r
 from . import utils as u
 from . import lane_description as ld
+from . import spatial_index as si
+from . import geometry as geo
+from . import chain_index as ci
+from . import disjoint_set as ds
+from . import simple_graph as sg
 
 
 class Crossroad(r.Region):
@@ -103,45 +107,12 @@ class Crossroad(r.Region):
 
         # the center is the node closest to the mean of the node coordinates
         center = u.Util.centroid(self.G, self.nodes)
-        distance = -1
-        self.center = None
-        for n in self.nodes:
-            d = u.Util.distance_to(self.G, n, center)
-            if distance < 0 or d < distance:
-                distance = d
-                self.center = n
-
-
-    def set_graph_attributes(self, crossroad_attr, branch_attr = None):
-        rid = self.id
-        # set crossroad attribute
-        for n in self.nodes:
-            if len(self.G.nodes[n][crossroad_attr]) == 0:
-                self.G.nodes[n][crossroad_attr] = str(rid)
-            else:
-                self.G.nodes[n][crossroad_attr] += ";" + str(rid)
-        
-        for e in self.edges:
-            if len(self.G[e[0]][e[1]][0][crossroad_attr]) == 0:
-                self.G[e[0]][e[1]][0][crossroad_attr] = str(rid)
-            else:
-                self.G[e[0]][e[1]][0][crossroad_attr] += ";" + str(rid)
-
-        if branch_attr != None:
-            for bid, branch in enumerate(self.branches):
-                cid = str(rid) + "-" + str(bid)
-                for lane in branch:
-                    if len(self.G[lane.edge[0]][lane.edge[1]][0][branch_attr]) == 0:
-                        self.G[lane.edge[0]][lane.edge[1]][0][branch_attr] = cid
-                    else:
-                        self.G[lane.edge[0]][lane.edge[1]][0][branch_attr] += ";" + cid
-
- 
+        self.center = geo.Geometry.get(self.G).closest(self.nodes, center)
 
 
     def get_lane_description_from_edge(self, edge, use_inner_node, use_center):
 
-        e = self.G[edge[0]][edge[1]][0]
+        e = sg.SimpleGraph.edge(self.G, edge[0], edge[1])
         # build the path starting from this edge
         path = u.Util.get_path_to_biffurcation(self.G, edge[0], edge[1])
 
@@ -158,7 +129,7 @@ class Crossroad(r.Region):
 
             # if one of the edges has a name, it's the name of the lane
             for p1, p2 in zip(path, path[1:]):
-                 e = self.G[p1][p2][0]
+                 e = sg.SimpleGraph.edge(self.G, p1, p2)
                  if "name" in e:
                      name = e["name"]
                      break
@@ -169,11 +140,11 @@ class Crossroad(r.Region):
                 end = path[-1]
                 # and check if it exists other paths between this end and the crossroad
                 other_names = []
-                for nb in self.G.neighbors(end):
+                for nb in u.Util.neighbors(self.G, end):
                     op = u.Util.get_path_to_biffurcation(self.G, end, nb)
                     if self.has_node(op[-1]):
                         # TODO: check if they are parallel
-                        o_e = self.G[op[0]][op[1]][0]
+                        o_e = sg.SimpleGraph.edge(self.G, op[0], op[1])
                         name = o_e["name"] if "name" in o_e else None
                         if not name is None:
                             other_names.append(name)
@@ -184,7 +155,7 @@ class Crossroad(r.Region):
         return ld.LaneDescription(angle, name, edge)
 
     def get_lanes_description_from_node(self, border, use_center):
-        edges = [(border, nb) for nb in self.G.neighbors(border) if not self.has_edge((nb, border))]
+        edges = [(border, nb) for nb in u.Util.neighbors(self.G, border) if not self.has_edge((nb, border))]
         return [self.get_lane_description_from_edge(e, len(edges) == 1, use_center) for e in edges]
 
     # estimate the width of the given edge, and deduce the maximum
@@ -195,13 +166,16 @@ class Crossroad(r.Region):
 
     def get_max_lane_width_around_node(self, n):
         m = 0
-        for nb in self.G.neighbors(n):
+        for nb in u.Util.neighbors(self.G, n):
                 v = self.estimate_max_distance_to_boundary((n, nb))
                 if v > m:
                     m = v
         return m
 
     def get_max_lane_width(self):
+        return self.get_cached("max_lane_width", self.compute_max_lane_width)
+
+    def compute_max_lane_width(self):
         m = 0
         for n in self.nodes:
             v = self.get_max_lane_width_around_node(n)
@@ -213,7 +187,7 @@ class Crossroad(r.Region):
     def get_open_paths(self, point, radius):
         result = []
 
-        for nb in self.G.neighbors(point):
+        for nb in u.Util.neighbors(self.G, point):
             if not self.has_edge((nb, point)):    
                 result.append(u.Util.get_path_to_biffurcation(self.G, point, nb, radius))
 
@@ -253,7 +227,7 @@ class Crossroad(r.Region):
 
     def is_straight_crossing(self):
         for n in self.nodes:
-            if len(list(self.G.neighbors(n))) > 2:
+            if u.Util.degree(self.G, n) > 2:
                 return False
         
         return True
@@ -270,7 +244,7 @@ class Crossroad(r.Region):
         self.add_node(n)
         self.center = n
 
-        for nb in self.G.neighbors(n):
+        for nb in u.Util.neighbors(self.G, n):
             if self.unknown_region_edge((n, nb)):
                 paths = self.get_possible_paths(n, nb)
                 for path in paths[::-1]:
@@ -287,19 +261,20 @@ class Crossroad(r.Region):
     def get_closest_possible_biffurcation(self, point):
         result = -1
         length = -1
-        for nb in self.G.neighbors(point):
-            path = u.Util.get_path_to_biffurcation(self.G, point, nb)
-            l = u.Util.length(self.G, path)
+        index = ci.ChainIndex.get(self.G)
+        for nb in u.Util.neighbors(self.G, point):
+            chain = index.get_chain(self.G, point, nb)
+            l = chain.length()
             if length < 0 or l < length:
                 length = l
-                result = path[len(path) - 1]
+                result = chain.end()
 
         return result
 
 
     def is_inner_path_by_osmdata(self, path):
         for p1, p2 in zip(path, path[1:]):
-            if not "junction" in self.G[p1][p2][0]:
+            if not "junction" in sg.SimpleGraph.edge(self.G, p1, p2):
                 return False
         return True
 
@@ -319,7 +294,7 @@ class Crossroad(r.Region):
         if rl.Reliability.is_weakly_in_crossroad(self.G, first) and rl.Reliability.is_weakly_boundary(self.G, last):
             d =  u.Util.length(self.G, path)
             r = 1
-            if len(list(self.G.neighbors(first))) > 4: # a crossroad with many lanes is larger, thus 
+            if u.Util.degree(self.G, first) > 4: # a crossroad with many lanes is larger, thus 
                 r = 2
             dmax = self.get_max_lane_width_around_node(path[0])
             if d < dmax * r:
@@ -331,52 +306,42 @@ class Crossroad(r.Region):
     def get_possible_paths(self, n1, n2):
         results = []
 
-        path = [n1, n2]
+        # the polyline from n1 to the next biffurcation
+        chain = ci.ChainIndex.get(self.G).get_chain(self.G, n1, n2).path
+        last = 1
 
-        # check first for a boundary
-        while self.is_middle_path_node(path[len(path) - 1]):
-            next = self.get_next_node_along_polyline(path[len(path) - 1], path[len(path) - 2])                
-
-            if next == None:
-                print("ERROR: cannot follow a path")
-                return results
-            path.append(next)
+        # check first for a boundary
+        while last < len(chain) - 1 and self.is_middle_path_node(chain[last]):
+            last += 1
 
             # if we reach a known region, we stop the expension process
-            if not self.unknown_region_node(next):
+            if not self.unknown_region_node(chain[last]):
                 break
 
         # if we reach a point with cardinality > 2, we do not consider it
-        if len(list(self.G.neighbors(path[len(path) - 1]))) > 2:
+        if u.Util.degree(self.G, chain[last]) > 2:
             return results
 
-        results.append(path)
+        results.append(chain[:last + 1])
 
         # if we reach a strong boundary, we find our path
-        if not self.is_middle_path_node(path[len(path) - 1], True):
+        if not self.is_middle_path_node(chain[last], True):
             return results
 
-        path = path.copy()
-
         # if it's a weak border, we continue until we reach a strong one
-        while self.is_middle_path_node(path[len(path) - 1], True):
-            next = self.get_next_node_along_polyline(path[len(path) - 1], path[len(path) - 2])                
-
-            if next == None:
-                print("ERROR: cannot follow a path")
-                return results
-            path.append(next)
+        while last < len(chain) - 1 and self.is_middle_path_node(chain[last], True):
+            last += 1
 
             # if we reach a known region, we stop the expension process
-            if not self.unknown_region_node(next):
+            if not self.unknown_region_node(chain[last]):
                 break
 
-        results.append(path)
+        results.append(chain[:last + 1])
 
         return results
     
     def is_middle_path_node(self, node, strong = False):
-        if len(list(self.G.neighbors(node))) != 2:
+        if u.Util.degree(self.G, node) != 2:
             return False
 
         if strong:
@@ -387,20 +352,37 @@ class Crossroad(r.Region):
                     or rl.Reliability.is_weakly_in_crossroad(self.G, node))
 
     def get_next_node_along_polyline(self, current, pred):
-        for n in self.G.neighbors(current):
+        for n in u.Util.neighbors(self.G, current):
             if n != pred:
                 return n
         # cannot append
         return None
 
 
-    def get_crossroads_in_neighborhood(self, crossroads, scale = 3):
+    # build a spatial index of the crossroad centers, using the position of each crossroad in the given list as key
+    def build_centers_index(crossroads):
+        if len(crossroads) == 0:
+            return None
+        geometry = geo.Geometry.get(crossroads[0].G)
+        index = si.SpatialIndex(geometry.coordinates(crossroads[0].get_center())[1])
+        for i, c in enumerate(crossroads):
+            index.insert(i, geometry.coordinates(c.get_center()))
+        return index
+
+    # if an index of the crossroad centers (see build_centers_index) is given, only the
+    # crossroads close to the current one are considered
+    def get_crossroads_in_neighborhood(self, crossroads, scale = 3, index = None):
         result = []
 
         center = self.get_center()
         radius = self.get_max_lane_width() * scale
 
-        for c in crossroads:
+        if index == None:
+            candidates = crossroads
+        else:
+            candidates = [crossroads[i] for i in sorted(index.query(geo.Geometry.get(self.G).coordinates(center), radius))]
+
+        for c in candidates:
             if c.id != self.id and u.Util.distance(self.G, center, c.get_center()) < radius:
                 result.append(c)
 
@@ -409,7 +391,7 @@ class Crossroad(r.Region):
 
     def find_direct_path_to_possible_adjacent_biffurcation(self, point):
         center = self.get_center()
-        for nb in self.G.neighbors(center):
+        for nb in u.Util.neighbors(self.G, center):
             path = u.Util.get_path_to_biffurcation(self.G, center, nb)
             if path[len(path) - 1] == point:
                 return path
@@ -461,46 +443,27 @@ class Crossroad(r.Region):
     # merge crossroads if they are in a neigborhood defined by scale times the radius of the crossroad
     # and if they are considered as "in same cluster" (using branch similarities)
     def get_clusters(crossroads, scale = 2):
-        result = []
+        clusters = ds.DisjointSet()
+        # for each cluster (given by its representative), the last step where it was extended,
+        # used to sort the clusters
+        last_step = {}
 
-        visited = []
+        index = Crossroad.build_centers_index(crossroads)
 
-        for crossroad in crossroads:
-            if not crossroad.id in visited:
-                visited.append(crossroad.id)
-                cluster = [crossroad]
-            else:
-                cluster = [c for c in result if crossroad in c]
-                if len(cluster) != 1:
-                    cluster = [crossroad]
-                else:
-                    cluster = cluster[0]
-                    result = [c for c in result if not crossroad in c]
-
-            cr_in_neigborhood = crossroad.get_crossroads_in_neighborhood(crossroads, scale)
+        for step, crossroad in enumerate(crossroads):
+            clusters.add(crossroad)
+
+            cr_in_neigborhood = crossroad.get_crossroads_in_neighborhood(crossroads, scale, index)
             for cr in cr_in_neigborhood:
                 if crossroad.in_same_cluster(cr, scale):
-                    if not cr.id in visited:
-                        visited.append(cr.id)
-                        cluster.append(cr)
-                    else:
-                        # merge clusters
-                        other_cluster = [c for c in result if cr in c]
-                        if len(other_cluster) != 1:
-                            # we check if the merge wasn't processed before
-                            if not cr in cluster:
-                                print("Error while merging two clusters:", crossroad, cr)
-                                print("Other cluster", other_cluster)
-                                print("result", result)
-                        else:
-                            other_cluster = other_cluster[0]
-                            cluster = cluster + other_cluster
-                            result = [c for c in result if not cr in c]
-                        
-            if len(cluster) >= 1:
-                result.append(cluster)
-
-        # finally remove single clusters
+                    # add cr (or merge its cluster) to the cluster of the current crossroad
+                    clusters.union(crossroad, cr)
+
+            last_step[clusters.find(crossroad)] = step
+
+        result = [clusters.get_elements(c) for c in sorted(last_step, key=last_step.get) if clusters.find(c) == c]
+
+        # finally remove single clusters
         result = [r for r in result if len(r) > 1]
         return result
 
@@ -508,7 +471,7 @@ class Crossroad(r.Region):
     def add_direct_paths_between_nodes(self, points):
         # TODO: avoid too long paths
         for p1 in points:
-            for n in self.G.neighbors(p1):
+            for n in u.Util.neighbors(self.G, p1):
                 if not self.has_edge((p1, n)):
                     path = u.Util.get_path_to_biffurcation(self.G, p1, n)
                     if path[len(path) - 1] in points and u.Util.length_with_shortcut(self.G, path) < self.diameter():
@@ -527,11 +490,10 @@ class Crossroad(r.Region):
         while len(open) != 0:
             pt = open.pop()
             seen.append(pt)
-            for nb in self.G.neighbors(pt):
+            for nb in u.Util.neighbors(self.G, pt):
                 if not nb in seen and not self.has_edge((pt, nb)):
-                    if self.G[pt][nb][0][r.Region.label_region] == -1:
-                        nb_coord = (self.G.nodes[nb]["x"], self.G.nodes[nb]["y"])
-                        if u.Util.coords_distance(center, nb_coord) >= radius:
+                    if self.unknown_region_edge((pt, nb)):
+                        if u.Util.distance_to(self.G, nb, center) >= radius:
                             return None
                         else:
                             result.append((pt, nb))
@@ -571,13 +533,7 @@ class Crossroad(r.Region):
 
         # set a new center
         center = u.Util.centroid(self.G, old_centers)
-        distance = -1
-        new_center = None
-        for n in self.nodes:
-            d = u.Util.distance_to(self.G, n, center)
-            if distance < 0 or d < distance:
-                distance = d
-                new_center = n
+        new_center = geo.Geometry.get(self.G).closest(self.nodes, center)
         if new_center != None:
             self.center = new_center
         
@@ -597,11 +553,11 @@ class Crossroad(r.Region):
             # add paths to missing boundaries within the given scale
             max_length = scale * self.get_max_lane_width()
             for p1 in self.nodes:
-                if self.G.nodes[p1][rl.Reliability.boundary_reliability] <= rl.Reliability.uncertain:
-                    for n in self.G.neighbors(p1):
-                        if not self.has_edge((p1, n)) and self.G[p1][n][0][r.Region.label_region] == -1:
+                if rl.Reliability.get_node_reliability(self.G, p1, rl.Reliability.boundary_reliability) <= rl.Reliability.uncertain:
+                    for n in u.Util.neighbors(self.G, p1):
+                        if not self.has_edge((p1, n)) and self.unknown_region_edge((p1, n)):
                             path = rl.Reliability.get_path_to_boundary(self.G, p1, n)
-                            while len(path) > 2 and self.G[path[-2]][path[-1]][0][r.Region.label_region] != -1:
+                            while len(path) > 2 and not self.unknown_region_edge((path[-2], path[-1])):
                                 path.pop()
                             # find a boundary node inside the path and cut it
                             if len(path) > 0 and u.Util.length(self.G, path) < max_length:
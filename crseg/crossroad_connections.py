@@ -1,5 +1,6 @@
 from . import reliability as rel
 from . import utils as u
+from . import instrumentation as ins
 import math
 
 class CrossroadConnections:
@@ -77,6 +78,19 @@ class CrossroadConnections:
         
         self.connected_crossroads = new_list
 
+        # for each crossroad, the connected crossroads (see get_connected_crossroads), with
+        # data used by the cycle search: the length of the connection (see get_cycle_length),
+        # the nodes of each path, and the nodes of all the paths
+        self.connections = {}
+        for c in self.connected_crossroads:
+            length = u.Util.distance(self.G, c[2][0][0][0], c[2][0][0][-1])
+            paths_nodes = [set(x[0]) for x in c[2]]
+            nodes = set([n for x in c[2] for n in x[0]])
+            for cr1, cr2 in [(c[0], c[1]), (c[1], c[0])]:
+                if not cr1 in self.connections:
+                    self.connections[cr1] = []
+                self.connections[cr1].append(((cr2, c[2]), length, paths_nodes, nodes))
+
     def get_max_distance_connection(self, cr, cr2):
         result = max([self.crossroads_max_branch_width[cr], self.crossroads_max_branch_width[cr2]]) * self.connection_threshold
         if result > self.max_distance_connection:
@@ -123,7 +137,7 @@ class CrossroadConnections:
         # if we identify a node which was classified as a possible crossroad, the
         # probability that this path is probably an inner path of a crossroad increases.
         # We thus reduce the path length
-        lInside = [self.regions[l].G.nodes[p][rel.Reliability.crossroad_reliability] for p in path[0][1:-1]]
+        lInside = [rel.Reliability.get_node_reliability(self.regions[l].G, p, rel.Reliability.crossroad_reliability) for p in path[0][1:-1]]
         nbPossible = len([r for r in lInside if r <= rel.Reliability.strongly_yes and r > rel.Reliability.strongly_no])
         if nbPossible > 0:
             path = (path[0], path[1] / math.log(math.e * (nbPossible + 1)))
@@ -156,36 +170,33 @@ class CrossroadConnections:
     def get_pairs(self):
         return [connected for connected in self.connected_crossroads if len(connected[2]) >= 2 or (len(connected[2]) == 1 and connected[2][0][2])]
 
-    def get_cycles(self, max_length = 5):
+    # if max_work is given, the search from each crossroad stops after max_work extensions of a path
+    def get_cycles(self, max_length = 5, max_work = None):
         results = []
 
         for c in self.crossroads:
-            results += self.get_cycles_from_crossroad(c, max_length)
+            results += self.get_cycles_from_crossroad(c, max_length, max_work)
+        ins.Instrumentation.count("cycles_enumerated", len(results))
 
         results = self.get_unique_cycles(results)
+        ins.Instrumentation.count("unique_cycles", len(results))
 
         return results
 
     def get_unique_cycles(self, cycles):
         result = []
-        seen = []
+        seen = set()
 
         for c in cycles:
-            celems = set([e[0] for e in c])
+            celems = frozenset([e[0] for e in c])
             if not celems in seen:
                 result.append(c)
-                seen.append(celems)
+                seen.add(celems)
 
         return result
 
     def get_connected_crossroads(self, cr):
-        result = []
-        for connected in self.connected_crossroads:
-            if connected[0] == cr:
-                result.append((connected[1], connected[2]))
-            elif connected[1] == cr:
-                result.append((connected[0], connected[2]))
-        return result
+        return [c[0] for c in self.connections.get(cr, [])]
 
     def get_cycle_length(self, cycle, direct):
         result = 0
@@ -199,37 +210,43 @@ class CrossroadConnections:
 
         return result
 
-    def get_cycles_from_crossroad(self, cr, max_length):
-        paths = [ [(cr, [])] ]
+    def get_cycles_from_crossroad(self, cr, max_length, max_work = None):
+        # each path is given with its length (see get_cycle_length), and the nodes of its connections
+        paths = [ ([(cr, [])], 0, []) ]
         results = []
+        work = 0
 
         max_perimeter = self.get_max_loop_distance(cr)
         # increase step by step the possible paths
         for l in range(0, max_length):
             new_paths = []
             # for each existing path, compute all possible extensions (without backward)
-            for p in paths:
-                # check all possible next steps
-                for next in self.get_connected_crossroads(p[-1][0]):
-                    if len(p) == 1 or p[-2][0] != next[0] and not self.intersects_path_link(next[1], p):
+            for p, length, paths_nodes in paths:
+                # check all possible next steps
+                for next, next_length, next_paths_nodes, next_nodes in self.connections.get(p[-1][0], []):
+                    if len(p) == 1 or p[-2][0] != next[0] and not self.intersects_path_nodes(next_nodes, paths_nodes):
+                        work += 1
+                        if max_work != None and work > max_work:
+                            ins.Instrumentation.count("cycle_searches_stopped")
+                            return results
+                        # the length of a path can only increase with the next steps
+                        new_length = length + next_length
+                        if new_length >= max_perimeter:
+                            continue
                         if next[0] == p[0][0]:
                             # loop detection
-                            new = p + [next]
-                            if self.get_cycle_length(new, True) < max_perimeter:
-                                results.append(new)
+                            results.append(p + [next])
                         else:
                             # ongoing loop
-                            new_paths.append(p + [next])
+                            new_paths.append((p + [next], new_length, paths_nodes + next_paths_nodes))
             paths = new_paths
 
         return results
 
-    def intersects_path_link(self, nextpathlinks, path):
-        n_links = set([n for c in nextpathlinks for n in c[0]])
-
-        for p in path:
-            for l in p[1]:
-                if len(set.intersection(set(l[0]), n_links)) > 1:
-                    return True
+    # return true if one of the paths of a connection (given by their nodes) shares more than
+    # one node with the given nodes of the next connection
+    def intersects_path_nodes(self, next_nodes, paths_nodes):
+        for nodes in paths_nodes:
+            if len(nodes & next_nodes) > 1:
+                return True
         return False
-
@@ -0,0 +1,78 @@
+class DisjointSet:
+
+    # a union-find structure (union by size, path compression) over hashable elements.
+    # Each set is identified by a representative, that is kept by union(x, y) from the set of x,
+    # and keeps its elements in order (elements of the set of x, then the ones of the set of y).
+    # The elements of each set are a linked list (first and last element of each root, next element
+    # of each element), concatenated in constant time by union.
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+        self.representatives = {}
+        self.first = {}
+        self.last = {}
+        self.next = {}
+
+    def __contains__(self, x):
+        return x in self.parent
+
+    def add(self, x):
+        if not x in self.parent:
+            self.parent[x] = x
+            self.size[x] = 1
+            self.representatives[x] = x
+            self.first[x] = x
+            self.last[x] = x
+            self.next[x] = None
+
+    def get_root(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # path compression
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    # representative of the set containing x (x itself if it has never been added)
+    def find(self, x):
+        if not x in self.parent:
+            return x
+        return self.representatives[self.get_root(x)]
+
+    def same(self, x, y):
+        return self.find(x) == self.find(y)
+
+    # elements of the set containing x
+    def get_elements(self, x):
+        if not x in self.parent:
+            return [x]
+        result = []
+        e = self.first[self.get_root(x)]
+        while e != None:
+            result.append(e)
+            e = self.next[e]
+        return result
+
+    # merge the set containing y into the set containing x
+    def union(self, x, y):
+        self.add(x)
+        self.add(y)
+        rx = self.get_root(x)
+        ry = self.get_root(y)
+        if rx == ry:
+            return
+        representative = self.representatives.pop(rx)
+        self.representatives.pop(ry)
+        # the elements of the set of y follow the ones of the set of x
+        self.next[self.last.pop(rx)] = self.first[ry]
+        first = self.first.pop(rx)
+        last = self.last.pop(ry)
+        self.first.pop(ry)
+        if self.size[rx] < self.size[ry]:
+            rx, ry = ry, rx
+        self.parent[ry] = rx
+        self.size[rx] += self.size.pop(ry)
+        self.representatives[rx] = representative
+        self.first[rx] = first
+        self.last[rx] = last
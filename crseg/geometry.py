@@ -0,0 +1,218 @@
+import math
+import weakref
+import numpy as np
+
+
+from . import graph_core as gc
+
+
+class Geometry:
+
+    # same radius as OSMnx great circle distance (in meters)
+    earth_radius = 6371009
+
+    # approximated length of a degree of latitude (in meters)
+    meters_by_degree = 111320
+
+    # under this size, a python loop is faster than a numpy call
+    min_batch_size = 16
+
+    # one geometry per graph, built on first use
+    geometries = weakref.WeakKeyDictionary()
+
+    # the last used geometry, to avoid a lookup in geometries for successive queries on the same graph
+    last = None
+
+    # node coordinates stored in contiguous arrays (degrees and radians), indexed
+    # by the contiguous ids of the graph core
+    def __init__(self, G):
+        self.graph = weakref.ref(G)
+        core = gc.GraphCore.get(G)
+        self.nodes = core.nodes
+        self.index = core.index
+        self.x = core.x
+        self.y = core.y
+        self.lng = np.radians(self.x)
+        self.lat = np.radians(self.y)
+        self.cos_lat = np.cos(self.lat)
+
+        # python floats, for single queries (by index or by node id)
+        self.points = list(zip(self.x.tolist(), self.y.tolist(), self.lng.tolist(), self.lat.tolist(), self.cos_lat.tolist()))
+        self.coords = dict(zip(self.nodes, self.points))
+
+        self.px = None
+        self.py = None
+
+    def get(G):
+        geometry = Geometry.last
+        if geometry != None and geometry.graph() is G and len(geometry.nodes) == len(G._node):
+            return geometry
+        geometry = Geometry.geometries.get(G)
+        if geometry == None or len(geometry.nodes) != len(G._node):
+            geometry = Geometry(G)
+            Geometry.geometries[G] = geometry
+        Geometry.last = geometry
+        return geometry
+
+    # project the coordinates in a local metric coordinate system (equirectangular projection
+    # around the mean latitude), computed only once
+    def projected(self):
+        if self.px is None:
+            scale_x = Geometry.meters_by_degree * math.cos(math.radians(float(np.mean(self.y))))
+            self.px = (self.x - self.x.min()) * scale_x
+            self.py = (self.y - self.y.min()) * Geometry.meters_by_degree
+        return self.px, self.py
+
+    def get_indices(self, nodes):
+        return np.fromiter((self.index[n] for n in nodes), dtype=np.intp, count=len(nodes))
+
+    ######################### single queries ########################
+
+    # great circle distance (same formula as OSMnx) from radians and cosinus of the latitudes
+    def haversine_rad(lng1, lat1, cos1, lng2, lat2, cos2):
+        a = math.sin((lat2 - lat1) / 2)
+        b = math.sin((lng2 - lng1) / 2)
+        h = a * a + cos1 * cos2 * (b * b)
+        if h > 1:
+            h = 1
+        return 2 * math.asin(math.sqrt(h)) * Geometry.earth_radius
+
+    # points are given as (longitude, latitude)
+    def haversine(point1, point2):
+        lat1 = math.radians(point1[1])
+        lat2 = math.radians(point2[1])
+        return Geometry.haversine_rad(math.radians(point1[0]), lat1, math.cos(lat1), math.radians(point2[0]), lat2, math.cos(lat2))
+
+    def distance(self, n1, n2):
+        c1 = self.coords[n1]
+        c2 = self.coords[n2]
+        return Geometry.haversine_rad(c1[2], c1[3], c1[4], c2[2], c2[3], c2[4])
+
+    def distance_by_index(self, i1, i2):
+        c1 = self.points[i1]
+        c2 = self.points[i2]
+        return Geometry.haversine_rad(c1[2], c1[3], c1[4], c2[2], c2[3], c2[4])
+
+    def distance_to(self, n, point):
+        c = self.coords[n]
+        lat = math.radians(point[1])
+        return Geometry.haversine_rad(c[2], c[3], c[4], math.radians(point[0]), lat, math.cos(lat))
+
+    # bearing (same formula as OSMnx) between two points given as (longitude, latitude)
+    def bearing_points(point1, point2):
+        lat1 = math.radians(point1[1])
+        lat2 = math.radians(point2[1])
+        d_lng = math.radians(point2[0] - point1[0])
+        y = math.sin(d_lng) * math.cos(lat2)
+        x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(d_lng)
+        return math.degrees(math.atan2(y, x)) % 360
+
+    # nodes can be given by their id or by their coordinates (longitude, latitude)
+    def bearing(self, node1, node2):
+        p1 = node1 if isinstance(node1, (list, tuple)) else self.coords[node1][0:2]
+        p2 = node2 if isinstance(node2, (list, tuple)) else self.coords[node2][0:2]
+        return Geometry.bearing_points(p1, p2)
+
+    def coordinates(self, n):
+        return self.coords[n][0:2]
+
+    ######################### batched queries ########################
+
+    # great circle distances between two sets of nodes given by their indices (arrays of the same size)
+    def distances_by_indices(self, idx1, idx2):
+        a = np.sin((self.lat[idx2] - self.lat[idx1]) / 2)
+        b = np.sin((self.lng[idx2] - self.lng[idx1]) / 2)
+        h = np.minimum(1, a * a + self.cos_lat[idx1] * self.cos_lat[idx2] * (b * b))
+        return 2 * np.arcsin(np.sqrt(h)) * Geometry.earth_radius
+
+    # great circle distances from each given node to the given point (longitude, latitude)
+    def distances_to(self, nodes, point):
+        idx = self.get_indices(nodes)
+        lat = math.radians(point[1])
+        a = np.sin((lat - self.lat[idx]) / 2)
+        b = np.sin((math.radians(point[0]) - self.lng[idx]) / 2)
+        h = np.minimum(1, a * a + self.cos_lat[idx] * math.cos(lat) * (b * b))
+        return 2 * np.arcsin(np.sqrt(h)) * Geometry.earth_radius
+
+    # length of the polyline defined by the given nodes
+    def length(self, path):
+        if len(path) < Geometry.min_batch_size:
+            return sum([self.distance(p1, p2) for p1, p2 in zip(path, path[1:])])
+        idx = self.get_indices(path)
+        # cumulative sum to preserve the summation order
+        return float(np.cumsum(self.distances_by_indices(idx[:-1], idx[1:]))[-1])
+
+    # return the node closest to the given point (the first one in case of equality)
+    def closest(self, nodes, point):
+        if len(nodes) == 0:
+            return None
+        if len(nodes) < Geometry.min_batch_size:
+            return min(nodes, key=lambda n: self.distance_to(n, point))
+        return nodes[int(np.argmin(self.distances_to(nodes, point)))]
+
+    def min_distance_to(self, nodes, point):
+        if len(nodes) < Geometry.min_batch_size:
+            return min([self.distance_to(n, point) for n in nodes])
+        return float(np.min(self.distances_to(nodes, point)))
+
+    def max_distance_to(self, nodes, point):
+        if len(nodes) == 0:
+            return 0
+        if len(nodes) < Geometry.min_batch_size:
+            return max([self.distance_to(n, point) for n in nodes])
+        return float(np.max(self.distances_to(nodes, point)))
+
+    # vertices of the convex hull of the given nodes (Andrew's monotone chain). The coordinates are
+    # first projected using a gnomonic projection centered on the first node, where great circles
+    # are straight lines: the farthest nodes of the set are vertices of this hull.
+    def convex_hull(self, nodes):
+        idx = self.get_indices(nodes)
+        d_lng = self.lng[idx] - self.lng[idx[0]]
+        sin0 = math.sin(self.lat[idx[0]])
+        cos0 = self.cos_lat[idx[0]]
+        sin_lat = np.sin(self.lat[idx])
+        cos_d_lng = self.cos_lat[idx] * np.cos(d_lng)
+        cos_c = sin0 * sin_lat + cos0 * cos_d_lng
+        x = (self.cos_lat[idx] * np.sin(d_lng) / cos_c).tolist()
+        y = ((cos0 * sin_lat - sin0 * cos_d_lng) / cos_c).tolist()
+
+        points = sorted(range(len(idx)), key=lambda i: (x[i], y[i]))
+        def cross(o, a, b):
+            return (x[a] - x[o]) * (y[b] - y[o]) - (y[a] - y[o]) * (x[b] - x[o])
+        lower = []
+        for p in points:
+            while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+                lower.pop()
+            lower.append(p)
+        upper = []
+        for p in points[::-1]:
+            while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+                upper.pop()
+            upper.append(p)
+        return [nodes[i] for i in lower[:-1] + upper[:-1]]
+
+    # maximum distance between two of the given nodes. Only the vertices of the convex hull
+    # are compared if there are many nodes
+    def max_distance(self, nodes):
+        if len(nodes) == 0:
+            return 0
+        if len(nodes) < Geometry.min_batch_size:
+            return max([self.distance(n1, n2) for n1 in nodes for n2 in nodes])
+        idx = self.get_indices(self.convex_hull(nodes))
+        return float(np.max(self.distances_by_indices(np.repeat(idx, len(idx)), np.tile(idx, len(idx)))))
+
+    # mean of the coordinates of the given nodes
+    def centroid(self, nodes):
+        idx = self.get_indices(nodes)
+        # cumulative sums to preserve the summation order
+        return (float(np.cumsum(self.x[idx])[-1]) / len(nodes), float(np.cumsum(self.y[idx])[-1]) / len(nodes))
+
+    # bearings from the first nodes to the second ones, given by their indices
+    def bearings_by_indices(self, idx1, idx2):
+        d_lng = np.radians(self.x[idx2] - self.x[idx1])
+        y = np.sin(d_lng) * self.cos_lat[idx2]
+        x = self.cos_lat[idx1] * np.sin(self.lat[idx2]) - np.sin(self.lat[idx1]) * self.cos_lat[idx2] * np.cos(d_lng)
+        return np.degrees(np.arctan2(y, x)) % 360
+
+
+gc.GraphCore.register(Geometry, Geometry.geometries)
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+
+from . import attribute_store as st
+from . import simple_graph as sg
+
+
+class GeoPackage:
+
+    # export of a segmentation in a GeoPackage file, without modifying the graph. The nodes
+    # and edges layers contain the attributes of the graph, the columns of the attribute store
+    # (reliability scores, region labels) and the ids of the regions containing each element
+    # (separated by ";"). The crossroads and sub_crossroads layers contain one geometry collection
+    # (the edges and the nodes, since a crossroad can have no edge) by region, and the branches
+    # layer the edges of each branch.
+    def __init__(self, G, regions, inner_regions):
+        self.G = G
+        self.store = st.AttributeStore.get(G)
+        self.crs = G.graph.get("crs")
+        self.crossroads = [regions[rid] for rid in regions if regions[rid].is_crossroad()]
+        self.inner_regions = [inner_regions[rid] for rid in inner_regions]
+
+        # ids of the regions containing each node and each edge (first edge between two nodes)
+        self.node_members = { "crossroad": {}, "sub_crossroad": {} }
+        self.edge_members = { "crossroad": {}, "sub_crossroad": {}, "branch": {} }
+        for attr, crossroads in [("crossroad", self.crossroads), ("sub_crossroad", self.inner_regions)]:
+            for c in crossroads:
+                for n in c.nodes:
+                    self.node_members[attr].setdefault(self.store.node_index[n], []).append(str(c.id))
+                for e in c.edges:
+                    self.edge_members[attr].setdefault(self.store.edge_index[(e[0], e[1])], []).append(str(c.id))
+        for c in self.crossroads:
+            for bid, branch in enumerate(c.branches):
+                for lane in branch:
+                    self.edge_members["branch"].setdefault(self.store.edge_index[(lane.edge[0], lane.edge[1])], []).append(GeoPackage.get_branch_id(c, bid))
+
+        self.lines = None
+
+    def get_branch_id(crossroad, bid):
+        return str(crossroad.id) + "-" + str(bid)
+
+    # list of the ids of the regions containing each element, as a column
+    def get_members_column(members, nb):
+        return [";".join(members[i]) if i in members else "" for i in range(nb)]
+
+    # columns of the store are saved with the types of the graph attributes (64 bits values),
+    # float32 columns are not supported by all the engines
+    def get_column(column):
+        return column.astype(np.float64 if np.issubdtype(column.dtype, np.floating) else np.int64)
+
+    # as osmnx, non numerical values (lists, etc.) are saved as strings
+    def stringify(gdf):
+        for col in gdf.columns:
+            if col != "geometry" and not pd.api.types.is_numeric_dtype(gdf[col]):
+                gdf[col] = gdf[col].fillna("").astype(str)
+        return gdf
+
+    # geometry of each edge (a line between its two nodes if it has no geometry)
+    def get_lines(self):
+        from shapely.geometry import LineString
+
+        if self.lines == None:
+            self.lines = []
+            for u, v in self.store.edges:
+                data = sg.SimpleGraph.edge(self.G, u, v)
+                if "geometry" in data:
+                    self.lines.append(data["geometry"])
+                else:
+                    self.lines.append(LineString([(self.G.nodes[u]["x"], self.G.nodes[u]["y"]), (self.G.nodes[v]["x"], self.G.nodes[v]["y"])]))
+        return self.lines
+
+    def get_nodes(self):
+        import geopandas as gp
+
+        nodes = self.store.nodes
+        df = pd.DataFrame.from_records([self.G.nodes[n] for n in nodes], index=pd.Index(nodes, name="osmid"))
+        for name in self.store.node_columns:
+            df[name] = GeoPackage.get_column(self.store.node_columns[name])
+        for attr in self.node_members:
+            df[attr] = GeoPackage.get_members_column(self.node_members[attr], len(nodes))
+        return GeoPackage.stringify(gp.GeoDataFrame(df, geometry=gp.points_from_xy(df["x"], df["y"]), crs=self.crs))
+
+    def get_edges(self):
+        import geopandas as gp
+
+        edges = self.store.edges
+        # edges are identified by (u, v, key) as in the layers saved by OSMnx
+        df = pd.DataFrame.from_records([{k: v for k, v in sg.SimpleGraph.edge(self.G, e[0], e[1]).items() if k != "geometry"} for e in edges],
+                                       index=pd.MultiIndex.from_tuples([(e[0], e[1], 0) for e in edges], names=["u", "v", "key"]))
+        for name in self.store.edge_columns:
+            df[name] = GeoPackage.get_column(self.store.edge_columns[name])
+        for attr in self.edge_members:
+            df[attr] = GeoPackage.get_members_column(self.edge_members[attr], len(edges))
+        return GeoPackage.stringify(gp.GeoDataFrame(df, geometry=self.get_lines(), crs=self.crs))
+
+    # one row by region, with the union of its edges as geometry. If the nodes of the regions are given,
+    # the geometry is a collection of the edges and of the nodes
+    def get_regions(self, ids, edges, data = {}, nodes = None):
+        import geopandas as gp
+        from shapely.geometry import MultiLineString, GeometryCollection, Point
+
+        lines = self.get_lines()
+        geometries = [[lines[self.store.edge_index[(e[0], e[1])]] for e in el] for el in edges]
+        if nodes == None:
+            geometries = [MultiLineString(g) for g in geometries]
+        else:
+            geometries = [GeometryCollection(g + [Point(self.G.nodes[n]["x"], self.G.nodes[n]["y"]) for n in nl]) for g, nl in zip(geometries, nodes)]
+        df = pd.DataFrame(dict(data, id=ids)).set_index("id")
+        return gp.GeoDataFrame(df, geometry=geometries, crs=self.crs)
+
+    def get_crossroads(self, crossroads):
+        return self.get_regions([c.id for c in crossroads], [c.edges for c in crossroads],
+                                { "center": [c.center for c in crossroads], "nb_nodes": [len(c.nodes) for c in crossroads] },
+                                [c.nodes for c in crossroads])
+
+    def get_branches(self):
+        branches = [(c, bid, branch) for c in self.crossroads for bid, branch in enumerate(c.branches)]
+        return self.get_regions([GeoPackage.get_branch_id(c, bid) for c, bid, branch in branches],
+                                [[lane.edge for lane in branch] for c, bid, branch in branches],
+                                { "crossroad": [c.id for c, bid, branch in branches] })
+
+    # pyogrio writes the layers faster than fiona (the default engine of geopandas before 1.0)
+    def get_engine():
+        try:
+            import pyogrio
+            return "pyogrio"
+        except ImportError:
+            return None
+
+    def save(self, filename, encoding = "utf-8"):
+        layers = { "nodes": self.get_nodes(),
+                   "edges": self.get_edges(),
+                   "crossroads": self.get_crossroads(self.crossroads),
+                   "sub_crossroads": self.get_crossroads(self.inner_regions),
+                   "branches": self.get_branches() }
+        for layer in layers:
+            if len(layers[layer]) != 0:
+                layers[layer].to_file(filename, layer=layer, driver="GPKG", index=True, encoding=encoding, engine=GeoPackage.get_engine())
@@ -0,0 +1,122 @@
+import weakref
+import numpy as np
+
+
+from . import simple_graph as sg
+
+
+class GraphCore:
+
+    # one core per graph, built on first use
+    cores = weakref.WeakKeyDictionary()
+
+    # the last used core, to avoid a lookup in cores for successive queries on the same graph
+    last = None
+
+    # classes of the caches built on the core of a graph, with their dictionary graph -> cache
+    dependents = []
+
+    # structure of a graph on contiguous integer ids: the node ids (OSM ids) are remapped to 0..N-1 (in the
+    # order of the graph), the adjacency is stored in CSR format (the neighbours of the i-th node are
+    # indices[indptr[i]:indptr[i + 1]], in the order of the graph), with the degree and the coordinates
+    # of each node. Edges (each pair of nodes once, in the order of G.edges) and tag columns are built
+    # on demand. The regions keep the OSM ids: the queries by id (neighbors, degree) are answered by the core.
+    def __init__(self, G):
+        self.graph = weakref.ref(G)
+        self.nodes = list(G._node)
+        self.index = {n: i for i, n in enumerate(self.nodes)}
+        nodes = G._node
+        self.x = np.fromiter((nodes[n]["x"] for n in self.nodes), dtype=np.float64, count=len(self.nodes))
+        self.y = np.fromiter((nodes[n]["y"] for n in self.nodes), dtype=np.float64, count=len(self.nodes))
+
+        # python tuples (OSM ids and indices of the neighbours of each node), for single queries
+        adjacency = G._adj
+        self.neighbours = [tuple(adjacency[n]) for n in self.nodes]
+        self.adjacency = [tuple([self.index[nb] for nb in nbs]) for nbs in self.neighbours]
+
+        self.degrees = np.fromiter((len(nbs) for nbs in self.neighbours), dtype=np.intp, count=len(self.nodes))
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.intp)
+        np.cumsum(self.degrees, out=self.indptr[1:])
+        self.indices = np.fromiter((i for nbs in self.adjacency for i in nbs), dtype=np.intp, count=int(self.indptr[-1]))
+
+        self.edges = None
+        self.edge_index = None
+        self.edge_ends = None
+        self.slot_edges = None
+
+        self.node_tags = {}
+        self.edge_tags = {}
+
+    def get(G):
+        core = GraphCore.last
+        if core != None and core.graph() is G and len(core.nodes) == len(G._node):
+            return core
+        core = GraphCore.cores.get(G)
+        if core == None or len(core.nodes) != len(G._node):
+            core = GraphCore(G)
+            GraphCore.cores[G] = core
+        GraphCore.last = core
+        return core
+
+    def register(cls, caches):
+        GraphCore.dependents.append((cls, caches))
+
+    # the caches are only rebuilt when the number of nodes changes: this function has to be called
+    # when the edges or the coordinates of a graph are modified after a first use. The core and the
+    # caches built on it (attribute store, geometry, chains) are then built again on next use
+    def invalidate(G):
+        for cls, caches in [(GraphCore, GraphCore.cores)] + GraphCore.dependents:
+            caches.pop(G, None)
+            if cls.last != None and cls.last.graph() is G:
+                cls.last = None
+
+    ######################### single queries (OSM ids) ########################
+
+    def neighbors(self, n):
+        return self.neighbours[self.index[n]]
+
+    def degree(self, n):
+        return len(self.neighbours[self.index[n]])
+
+    ######################### edges ########################
+
+    # edges of the (simple undirected) graph, in the order of G.edges(), the index of each edge in both directions,
+    # the indices of the two nodes of each edge, and the index of the edge of each entry of the adjacency
+    def build_edges(self):
+        if self.edges != None:
+            return
+        self.edges = []
+        self.edge_index = {}
+        ends = []
+        slots = []
+        for i, n in enumerate(self.nodes):
+            for j, nb in zip(self.adjacency[i], self.neighbours[i]):
+                # as networkx, an edge is listed from its first node
+                if j >= i:
+                    self.edge_index[(n, nb)] = len(self.edges)
+                    self.edge_index[(nb, n)] = len(self.edges)
+                    self.edges.append((n, nb))
+                    ends.append((i, j))
+                slots.append(self.edge_index[(n, nb)])
+        ends = np.array(ends, dtype=np.intp).reshape(-1, 2)
+        self.edge_ends = (ends[:, 0].copy(), ends[:, 1].copy())
+        self.slot_edges = np.array(slots, dtype=np.intp)
+
+    ######################### tag columns ########################
+
+    # values of a tag of the nodes or of the edges (None if missing), as object columns
+    def get_column(values, nb):
+        return np.fromiter(values, dtype=object, count=nb)
+
+    def get_node_tags(self, name):
+        if not name in self.node_tags:
+            nodes = self.graph()._node
+            self.node_tags[name] = GraphCore.get_column((nodes[n].get(name) for n in self.nodes), len(self.nodes))
+        return self.node_tags[name]
+
+    def get_edge_tags(self, name):
+        if not name in self.edge_tags:
+            G = self.graph()
+            self.build_edges()
+            self.edge_tags[name] = GraphCore.get_column((sg.SimpleGraph.edge(G, u, v).get(name) for u, v in self.edges), len(self.edges))
+        return self.edge_tags[name]
@@ -0,0 +1,84 @@
+import time
+
+
+class Observer:
+
+    # base class of the objects notified by an instrumentation. Subclasses only
+    # have to override the methods of the events they are interested in.
+    def stage_started(self, stage):
+        pass
+
+    def stage_finished(self, stage, duration):
+        pass
+
+    def counted(self, counter, value):
+        pass
+
+
+class Instrumentation:
+
+    # instrumentation of the running processing (None if there is no running processing)
+    current = None
+
+    # stage timers (in seconds) and counters of a processing, with observers
+    # notified at the beginning and the end of each stage, and for each count.
+    # Timers of nested stages are also included in the timer of the enclosing stage.
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self.observers = []
+        self.previous = []
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    # the instrumentation is the current one inside a with block
+    def __enter__(self):
+        self.previous.append(Instrumentation.current)
+        Instrumentation.current = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Instrumentation.current = self.previous.pop()
+
+    # increment the given counter of the current instrumentation (if any)
+    def count(counter, value = 1):
+        if Instrumentation.current != None:
+            Instrumentation.current.add(counter, value)
+
+    def add(self, counter, value = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+        for o in self.observers:
+            o.counted(counter, value)
+
+    # run the given function, and add its running time to the timer of the given stage
+    def stage(self, stage, function, *args, **kwargs):
+        for o in self.observers:
+            o.stage_started(stage)
+        start = time.perf_counter()
+        with self:
+            result = function(*args, **kwargs)
+        duration = time.perf_counter() - start
+        self.timers[stage] = self.timers.get(stage, 0) + duration
+        for o in self.observers:
+            o.stage_finished(stage, duration)
+        return result
+
+    def clear(self):
+        self.timers = {}
+        self.counters = {}
+
+    def to_dict(self):
+        return { "timers": dict(self.timers), "counters": dict(self.counters) }
+
+    def to_text(self):
+        result = "Stages (in seconds):\n"
+        for stage in self.timers:
+            result += " %s: %.4f\n" % (stage, self.timers[stage])
+        result += "Counters:\n"
+        for counter in sorted(self.counters):
+            result += " %s: %s\n" % (counter, self.counters[counter])
+        return result
@@ -1,5 +1,4 @@
 
-import osmnx as ox
 
 from . import reliability as rl
 from . import region as r
@@ -15,7 +14,7 @@ class Link(r.Region):
             self.add_node(node1)
             self.filled = False
             if node2 != None:
-                if G.nodes[node2][r.Region.label_region] != -1:
+                if not r.Region.unknown_region_node_in_graph(G, node2):
                     self.filled = True
                 self.add_node(node2)
                 self.add_edge((node1, node2))
@@ -29,11 +28,20 @@ class Link(r.Region):
             start = self.nodes[-1]
             self.propagate_from_node(start)
     
+    # depth-first traversal of the unlabeled edges, stopping on labeled nodes. The traversal
+    # is iterative (long streets may exceed the recursion limit), using a stack of the
+    # neighbour iterators, in the same order as a recursive traversal
     def propagate_from_node(self, start):
-        for nb in self.G.neighbors(start):
-            if self.G[start][nb][0][r.Region.label_region] == -1:
-                open = self.G.nodes[nb][r.Region.label_region] == -1
-                self.add_node(nb)
-                self.add_edge((start, nb))
-                if open:
-                    self.propagate_from_node(nb)
+        stack = [(start, iter(u.Util.neighbors(self.G, start)))]
+        while len(stack) != 0:
+            current, neighbors = stack[-1]
+            for nb in neighbors:
+                if self.unknown_region_edge((current, nb)):
+                    open = self.unknown_region_node(nb)
+                    self.add_node(nb)
+                    self.add_edge((current, nb))
+                    if open:
+                        stack.append((nb, iter(u.Util.neighbors(self.G, nb))))
+                        break
+            else:
+                stack.pop()
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class OSMCache:
+
+    # default location of the cache
+    default_directory = os.path.join(os.path.expanduser("~"), ".cache", "crseg")
+
+    # default maximum size of the cache (in bytes)
+    default_max_size = 512 * 1024 * 1024
+
+    index_filename = "index.json"
+
+    lock_filename = "index.lock"
+
+    # an on-disk cache of downloaded OSM data. Each entry is a file described in an index
+    # (creation and last access dates, size). The least recently used entries are removed when
+    # the cache exceeds max_size, and entries older than max_age (in seconds, if given) are ignored.
+    def __init__(self, directory = None, max_size = None, max_age = None):
+        self.directory = directory if directory != None else OSMCache.default_directory
+        self.max_size = max_size if max_size != None else OSMCache.default_max_size
+        self.max_age = max_age
+        os.makedirs(self.directory, exist_ok=True)
+
+    # entries are identified by the bounding box, the set of OSM tags kept in the graph, and the data source
+    def get_key(bbox, tags, source):
+        description = json.dumps({"bbox": [round(float(c), 7) for c in bbox], "tags": sorted(set(tags)), "source": source})
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def get_path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def load_index(self):
+        try:
+            with open(self.get_path(OSMCache.index_filename)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # exclusive lock of the cache directory, held by the read-modify-write of the index
+    # to support concurrent jobs sharing the same cache
+    @contextlib.contextmanager
+    def lock(self):
+        with open(self.get_path(OSMCache.lock_filename), "a+b") as f:
+            if fcntl != None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                # msvcrt retries for 10 seconds before raising an error
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+            try:
+                yield
+            finally:
+                if fcntl != None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    # the index is replaced atomically, so that it can be read without the lock
+    def save_index(self, index):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, self.get_path(OSMCache.index_filename))
+
+    def remove_entry(self, index, key):
+        entry = index.pop(key)
+        try:
+            os.remove(self.get_path(entry["file"]))
+        except OSError:
+            pass
+
+    def is_expired(self, entry, now):
+        return self.max_age != None and now - entry["created"] > self.max_age
+
+    # return the path of the file associated to the given key, or None if it is not in the cache.
+    # The file can be removed by a concurrent job once the lock is released: a failed read has to be
+    # handled as a missing entry
+    def get(self, key):
+        with self.lock():
+            index = self.load_index()
+            if not key in index:
+                return None
+            now = time.time()
+            if self.is_expired(index[key], now) or not os.path.exists(self.get_path(index[key]["file"])):
+                self.remove_entry(index, key)
+                self.save_index(index)
+                return None
+            index[key]["used"] = now
+            self.save_index(index)
+            return self.get_path(index[key]["file"])
+
+    # store the given content (bytes), and return the path of the corresponding file
+    def put(self, key, content, extension = ""):
+        filename = key + extension
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+
+        # the file is replaced under the lock, to not be removed by the eviction of an older version of the entry
+        with self.lock():
+            os.replace(tmp, self.get_path(filename))
+            index = self.load_index()
+            now = time.time()
+            index[key] = {"file": filename, "created": now, "used": now, "size": len(content)}
+            self.evict(index, key)
+            self.save_index(index)
+        return self.get_path(filename)
+
+    # remove expired entries, then the least recently used ones until the cache fits in max_size
+    # (the entry given as parameter is kept)
+    def evict(self, index, kept):
+        now = time.time()
+        for key in [k for k in index if k != kept and self.is_expired(index[k], now)]:
+            self.remove_entry(index, key)
+        size = sum([index[k]["size"] for k in index])
+        for key in sorted([k for k in index if k != kept], key=lambda k: index[k]["used"]):
+            if size <= self.max_size:
+                break
+            size -= index[key]["size"]
+            self.remove_entry(index, key)
+
+    def clear(self):
+        with self.lock():
+            index = self.load_index()
+            for key in list(index):
+                self.remove_entry(index, key)
+            self.save_index(index)
+
+    ######################### graphs ########################
+
+    def get_graph(self, key):
+        path = self.get(key)
+        if path == None:
+            return None
+        # the lock is released by get: a concurrent job can evict the entry before it is read
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except OSError:
+            return None
+
+    def put_graph(self, key, G):
+        self.put(key, pickle.dumps(G, protocol=pickle.HIGHEST_PROTOCOL), ".pickle")
@@ -0,0 +1,168 @@
+import bz2
+import time
+import itertools
+import xml.etree.ElementTree as ET
+import numpy as np
+import networkx as nx
+
+
+from . import segmentation as cs
+from . import geometry as geo
+
+
+class OSMReader:
+
+    # values of the oneway tag for one-way streets, and for the streets in the opposite direction of the nodes (as OSMnx)
+    oneway_values = {"yes", "true", "1", "-1", "reverse", "T", "F"}
+    reversed_values = {"-1", "reverse", "T"}
+
+    # number of ways filtered together
+    chunk_size = 10000
+
+    # a reader of OSM files (XML: .osm or .osm.bz2, PBF: .osm.pbf) that streams the file twice: first the ways,
+    # keeping only the ways used by cars (same filters as prepare_network) with the useful tags, then the
+    # nodes of these ways. The ways in construction are kept: prepare_network uses them to identify the
+    # supplementary highways before removing them. Neither the document nor the discarded elements are kept in memory. The result
+    # is the graph built by OSMnx graph_from_xml (not simplified, with all its components), restricted
+    # to the kept ways.
+    def __init__(self, useful_tags_way = None, useful_tags_node = None,
+                 remove_non_highway = True, remove_parking_aisle = True,
+                 remove_footways = True, remove_cycleways = True):
+        if useful_tags_way == None or useful_tags_node == None:
+            import osmnx as ox
+        self.useful_tags_way = useful_tags_way if useful_tags_way != None else ox.settings.useful_tags_way
+        self.useful_tags_node = useful_tags_node if useful_tags_node != None else ox.settings.useful_tags_node
+        self.remove_non_highway = remove_non_highway
+        self.remove_parking_aisle = remove_parking_aisle
+        self.remove_footways = remove_footways
+        self.remove_cycleways = remove_cycleways
+
+    def is_pbf(filename):
+        return str(filename).endswith(".pbf")
+
+    def open(filename):
+        if str(filename).endswith(".bz2"):
+            return bz2.open(filename, "rb")
+        else:
+            return open(filename, "rb")
+
+    ######################### streams of elements ########################
+
+    # top level elements of an XML file with the given tag. Elements are removed
+    # from the document once processed
+    def iterate_xml(filename, tag):
+        with OSMReader.open(filename) as f:
+            root = None
+            for event, element in ET.iterparse(f, events=("start", "end")):
+                if root == None:
+                    root = element
+                elif event == "end" and element.tag in ("node", "way", "relation"):
+                    if element.tag == tag:
+                        yield element
+                    root.clear()
+
+    def iterate_pbf(filename, entities):
+        try:
+            import osmium
+        except ImportError:
+            raise ImportError("pyosmium is required to read PBF files (pip install osmium)")
+        return osmium.FileProcessor(str(filename), entities)
+
+    # ways (id, list of nodes, tags) of the file
+    def read_ways(filename):
+        if OSMReader.is_pbf(filename):
+            import osmium
+            for w in OSMReader.iterate_pbf(filename, osmium.osm.WAY):
+                yield w.id, [n.ref for n in w.nodes], {t.k: t.v for t in w.tags}
+        else:
+            for w in OSMReader.iterate_xml(filename, "way"):
+                yield int(w.get("id")), [int(n.get("ref")) for n in w.iter("nd")], {t.get("k"): t.get("v") for t in w.iter("tag")}
+
+    # the given nodes (id, longitude, latitude, tags) of the file
+    def read_nodes(filename, nodes):
+        if OSMReader.is_pbf(filename):
+            import osmium
+            for n in OSMReader.iterate_pbf(filename, osmium.osm.NODE):
+                if n.id in nodes:
+                    yield n.id, n.location.lon, n.location.lat, {t.k: t.v for t in n.tags}
+        else:
+            for n in OSMReader.iterate_xml(filename, "node"):
+                nid = int(n.get("id"))
+                if nid in nodes:
+                    yield nid, float(n.get("lon")), float(n.get("lat")), {t.get("k"): t.get("v") for t in n.iter("tag")}
+
+    ######################### filters ########################
+
+    # a mask of the ways (list of (path, nodes)) removed by the filters, evaluated on the useful tags
+    # as prepare_network on a graph built by OSMnx
+    def get_removed(self, ways):
+        # the filters of prepare_network use tables of edges (u, v, key, data)
+        edges = [(None, None, None, w[0]) for w in ways]
+        removed = np.zeros(len(edges), dtype=bool)
+        if self.remove_non_highway:
+            removed |= np.fromiter(("highway" not in e[3] for e in edges), dtype=bool, count=len(edges))
+        if self.remove_footways or self.remove_cycleways or self.remove_parking_aisle:
+            removed |= cs.Segmentation.get_small_ways(edges, self.remove_parking_aisle, self.remove_footways, self.remove_cycleways)
+        return removed
+
+    # ways kept by the filters, as (path, nodes) where path contains the osmid and the useful tags
+    def get_ways(self, filename):
+        result = []
+        chunk = []
+        for osmid, nodes, tags in OSMReader.read_ways(filename):
+            path = {"osmid": osmid}
+            for t in self.useful_tags_way:
+                if t in tags:
+                    path[t] = tags[t]
+            # remove consecutive duplicated nodes
+            chunk.append((path, [group[0] for group in itertools.groupby(nodes)]))
+            if len(chunk) == OSMReader.chunk_size:
+                result += [w for w, r in zip(chunk, self.get_removed(chunk)) if not r]
+                chunk = []
+        if len(chunk) != 0:
+            result += [w for w, r in zip(chunk, self.get_removed(chunk)) if not r]
+        return result
+
+    ######################### graph ########################
+
+    # build the graph (a MultiDiGraph with the same nodes, edges and attributes as OSMnx)
+    def read(self, filename):
+        ways = [w for w in self.get_ways(filename) if len(w[1]) > 1]
+        needed = set([n for w in ways for n in w[1]])
+
+        nodes = {}
+        for nid, x, y, tags in OSMReader.read_nodes(filename, needed):
+            nodes[nid] = {"y": y, "x": x}
+            for t in self.useful_tags_node:
+                if t in tags:
+                    nodes[nid][t] = tags[t]
+        del needed
+
+        G = nx.MultiDiGraph(created_date = time.strftime("%Y-%m-%d %H:%M:%S"), crs = "epsg:4326")
+        G.add_nodes_from(nodes.items())
+        for path, way_nodes in ways:
+            is_one_way = path.get("oneway") in OSMReader.oneway_values or path.get("junction") == "roundabout"
+            if is_one_way and path.get("oneway") in OSMReader.reversed_values:
+                way_nodes.reverse()
+            path["oneway"] = is_one_way
+            # ways crossing the boundary of an extract have nodes missing from the file
+            edges = [(u, v) for u, v in zip(way_nodes[:-1], way_nodes[1:]) if u in nodes and v in nodes]
+            path["reversed"] = False
+            G.add_edges_from(edges, **path)
+            if not is_one_way:
+                path["reversed"] = True
+                G.add_edges_from([(v, u) for u, v in edges], **path)
+        del ways
+
+        # great circle length of the edges
+        if len(G.edges) != 0:
+            geometry = geo.Geometry(G)
+            ends = np.array([(geometry.index[u], geometry.index[v]) for u, v in G.edges()], dtype=np.intp)
+            lengths = geometry.distances_by_indices(ends[:, 0], ends[:, 1]).round(3)
+            lengths[np.isnan(lengths)] = 0
+            for (u, v, data), length in zip(G.edges(data=True), lengths):
+                data["length"] = length
+        return G
+
+    def read_graph(filename, useful_tags_way = None, useful_tags_node = None):
+        return OSMReader(useful_tags_way, useful_tags_node).read(filename)
@@ -0,0 +1,287 @@
+import math
+import concurrent.futures
+from multiprocessing import shared_memory
+import numpy as np
+import networkx as nx
+
+
+from . import attribute_store as st
+from . import crossroad as cr
+from . import region as rg
+from . import instrumentation as ins
+from . import simple_graph as sg
+from . import graph_core as gc
+
+
+class GraphSnapshot:
+
+    # edge attributes that are not stored in the snapshot
+    ignored_edge_attributes = ["geometry"]
+
+    # numerical edge attributes, stored in arrays (NaN if missing) rather than in the tables
+    float_edge_attributes = ["length"]
+
+    # a read-only copy of a graph in contiguous arrays (node ids and coordinates, adjacency in CSR format
+    # in the order of the graph, edges and columns of the attribute store), stored in a shared memory
+    # block that can be attached by worker processes. Tags are stored as indices in tables of distinct
+    # attribute dictionaries.
+    def __init__(self, G):
+        arrays, self.node_tables, self.edge_tables, self.graph_attributes = GraphSnapshot.get_arrays(G)
+
+        # position of each array in the shared memory block (aligned on 8 bytes)
+        self.layout = {}
+        size = 0
+        for name in arrays:
+            self.layout[name] = (size, arrays[name].dtype.str, arrays[name].shape)
+            size += (arrays[name].nbytes + 7) // 8 * 8
+
+        self.memory = shared_memory.SharedMemory(create=True, size=max(8, size))
+        self.attach_arrays()
+        for name in arrays:
+            self.arrays[name][...] = arrays[name]
+
+    # return the arrays describing the graph, the tables of node and edge attributes, and the graph attributes
+    def get_arrays(G):
+        store = st.AttributeStore.get(G)
+        core = gc.GraphCore.get(G)
+        arrays = {}
+        arrays["nodes"] = np.array(core.nodes, dtype=np.int64)
+        arrays["x"] = core.x
+        arrays["y"] = core.y
+        arrays["indptr"] = core.indptr.astype(np.int64)
+        arrays["indices"] = core.indices.astype(np.int64)
+        arrays["edge_u"], arrays["edge_v"] = store.get_edge_ends()
+
+        edges = [sg.SimpleGraph.edge(G, e[0], e[1]) for e in store.edges]
+        for name in GraphSnapshot.float_edge_attributes:
+            arrays["edge_attribute:" + name] = np.array([e[name] if name in e else np.nan for e in edges], dtype=np.float64)
+        node_tables, arrays["node_attributes"] = GraphSnapshot.encode([G.nodes[n] for n in store.nodes], ["x", "y"])
+        edge_tables, arrays["edge_attributes"] = GraphSnapshot.encode(edges, GraphSnapshot.ignored_edge_attributes + GraphSnapshot.float_edge_attributes)
+
+        for name in store.node_columns:
+            arrays["node:" + name] = store.node_columns[name]
+        for name in store.edge_columns:
+            arrays["edge:" + name] = store.edge_columns[name]
+
+        return arrays, node_tables, edge_tables, dict(G.graph)
+
+    # distinct attribute dictionaries (without the ignored keys), and the index of the dictionary of each element
+    def encode(attributes, ignored):
+        tables = []
+        index = {}
+        codes = np.empty(len(attributes), dtype=np.int32)
+        for i, a in enumerate(attributes):
+            a = {k: a[k] for k in a if not k in ignored}
+            key = repr(a)
+            if not key in index:
+                index[key] = len(tables)
+                tables.append(a)
+            codes[i] = index[key]
+        return tables, codes
+
+    def attach_arrays(self):
+        self.arrays = {}
+        for name, (offset, dtype, shape) in self.layout.items():
+            self.arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.memory.buf, offset=offset)
+
+    # description sent to the workers
+    def get_description(self):
+        return (self.memory.name, self.layout, self.node_tables, self.edge_tables, self.graph_attributes)
+
+    # attach the shared memory block of a snapshot built in another process
+    def attach(description):
+        result = GraphSnapshot.__new__(GraphSnapshot)
+        name, result.layout, result.node_tables, result.edge_tables, result.graph_attributes = description
+        result.memory = shared_memory.SharedMemory(name=name)
+        result.attach_arrays()
+        return result
+
+    # copy the current values of the columns of the attribute store in the snapshot
+    def update_columns(self, G):
+        store = st.AttributeStore.get(G)
+        for name in store.node_columns:
+            self.arrays["node:" + name][...] = store.node_columns[name]
+        for name in store.edge_columns:
+            self.arrays["edge:" + name][...] = store.edge_columns[name]
+
+    def to_graph(self):
+        return GraphSnapshot.build_graph(self.arrays, self.node_tables, self.edge_tables, self.graph_attributes)
+
+    # build the (simple) graph described by the given arrays, with the same order of nodes, neighbours and edges
+    # as the original graph. If subset is given (increasing indices of nodes), only the subgraph induced
+    # by these nodes is built, in the same order
+    def build_graph(arrays, node_tables, edge_tables, graph_attributes, subset = None):
+        if subset is None:
+            subset = np.arange(len(arrays["nodes"]))
+        kept = np.zeros(len(arrays["nodes"]), dtype=bool)
+        kept[subset] = True
+        all_nodes = arrays["nodes"].tolist()
+
+        G = nx.Graph()
+        G.graph.update(graph_attributes)
+        G.add_nodes_from((all_nodes[i], dict(node_tables[c], x=x, y=y)) for i, c, x, y in \
+                         zip(subset.tolist(), arrays["node_attributes"][subset].tolist(), arrays["x"][subset].tolist(), arrays["y"][subset].tolist()))
+
+        # data of the edge between each pair of nodes (shared by the two directions)
+        pairs = {}
+        edges = np.flatnonzero(kept[arrays["edge_u"]] & kept[arrays["edge_v"]])
+        floats = [(name, arrays["edge_attribute:" + name][edges].tolist()) for name in GraphSnapshot.float_edge_attributes]
+        for k, (a, b, c) in enumerate(zip(arrays["edge_u"][edges].tolist(), arrays["edge_v"][edges].tolist(), arrays["edge_attributes"][edges].tolist())):
+            data = dict(edge_tables[c])
+            for name, values in floats:
+                if not math.isnan(values[k]):
+                    data[name] = values[k]
+            pairs[(a, b) if a <= b else (b, a)] = data
+
+        # the adjacency is built directly, since adding the edges would change the order of the neighbours
+        indptr = arrays["indptr"].tolist()
+        indices = arrays["indices"].tolist()
+        kept = kept.tolist()
+        for i in subset.tolist():
+            G._adj[all_nodes[i]] = {all_nodes[j]: pairs[(i, j) if i <= j else (j, i)] for j in indices[indptr[i]:indptr[i + 1]] if kept[j]}
+        return G
+
+    def close(self, unlink = False):
+        self.arrays = {}
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class TrackedColumn:
+
+    # a column of the attribute store read from a shared array. Modifications are kept locally,
+    # and the indices of the read and written values are recorded
+    def __init__(self, values):
+        self.values = values
+        self.clear()
+
+    def clear(self):
+        self.modified = {}
+        self.read = set()
+
+    def __getitem__(self, i):
+        self.read.add(i)
+        if i in self.modified:
+            return self.modified[i]
+        return self.values[i]
+
+    def __setitem__(self, i, value):
+        self.modified[i] = value
+
+
+class RegionPool:
+
+    # snapshot, graph and tracked region labels of a worker process
+    worker_snapshot = None
+    worker_graph = None
+    worker_labels = None
+
+    # a pool of processes running the per-crossroad stages of the segmentation (lanes description,
+    # missing paths, branches). Workers build the graph from a shared snapshot. The crossroads use the
+    # networkx graph and its attributes, so each worker holds its own copy of the graph: only the
+    # coordinates, the adjacency and the columns of the store are read from the shared memory, and the
+    # tables of attributes are sent to each worker when it starts. The memory used by each worker is
+    # thus close to the one of the graph in the main process. Region labels are read from the snapshot
+    # at the beginning of a stage, and the changes of each crossroad are merged back in the order of a
+    # serial processing: a crossroad that has read labels modified by a previous one is processed again
+    # in the main process, thus the results are identical to the ones of a serial processing.
+    def __init__(self, G, workers = None):
+        self.G = G
+        self.workers = workers
+        self.snapshot = GraphSnapshot(G)
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = RegionPool.init_worker, initargs = (self.snapshot.get_description(),))
+
+    def close(self):
+        self.executor.shutdown()
+        self.snapshot.close(True)
+
+    def init_worker(description):
+        snapshot = GraphSnapshot.attach(description)
+        G = snapshot.to_graph()
+        store = st.AttributeStore.get(G)
+        for name in [n[5:] for n in snapshot.layout if n.startswith("node:")]:
+            store.set_node_column(name, snapshot.arrays["node:" + name])
+        for name in [n[5:] for n in snapshot.layout if n.startswith("edge:")]:
+            store.set_edge_column(name, snapshot.arrays["edge:" + name])
+        # region labels are only modified locally
+        RegionPool.worker_labels = (TrackedColumn(store.node_values[rg.Region.label_region]), TrackedColumn(store.edge_values[rg.Region.label_region]))
+        store.node_values[rg.Region.label_region], store.edge_values[rg.Region.label_region] = RegionPool.worker_labels
+        RegionPool.worker_snapshot = snapshot
+        RegionPool.worker_graph = G
+
+    def get_chunksize(self, nb):
+        return max(1, nb // (4 * (self.workers if self.workers != None else 4)))
+
+    def map(self, function, *args):
+        return self.executor.map(function, *args, chunksize = self.get_chunksize(len(args[0])))
+
+    ######################### crossroads ########################
+
+    def crossroad_to_data(crossroad):
+        return (crossroad.id, crossroad.nodes, crossroad.edges, crossroad.center, crossroad.ratio_boundary, crossroad.large_radius)
+
+    def crossroad_from_data(G, data):
+        rid, nodes, edges, center, ratio_boundary, large_radius = data
+        result = cr.Crossroad(G, target_id = rid, scale = ratio_boundary, large_radius = large_radius)
+        result.set_nodes_and_edges(nodes, edges)
+        result.center = center
+        return result
+
+    # run the given method on a crossroad in a worker, and return the new nodes and edges, the lanes,
+    # the read and modified region labels, and the counters
+    def run_in_worker(data, method, kwargs):
+        for labels in RegionPool.worker_labels:
+            labels.clear()
+        crossroad = RegionPool.crossroad_from_data(RegionPool.worker_graph, data)
+        with ins.Instrumentation() as instrumentation:
+            getattr(crossroad, method)(**kwargs)
+        return (crossroad.nodes[len(data[1]):], crossroad.edges[len(data[2]):], crossroad.lanes,
+                [(labels.read, labels.modified) for labels in RegionPool.worker_labels], instrumentation.counters)
+
+    # run the given method (that only modifies the crossroad and its region labels) on each crossroad,
+    # with the same result as a serial processing
+    def run(self, crossroads, method, **kwargs):
+        if len(crossroads) == 0:
+            return
+        self.snapshot.update_columns(self.G)
+        store = st.AttributeStore.get(self.G)
+        columns = (store.node_values[rg.Region.label_region], store.edge_values[rg.Region.label_region])
+        # labels modified by the crossroads already processed
+        modified = (set(), set())
+
+        results = self.map(RegionPool.run_in_worker, [RegionPool.crossroad_to_data(c) for c in crossroads], [method] * len(crossroads), [kwargs] * len(crossroads))
+        for crossroad, (nodes, edges, lanes, labels, counters) in zip(crossroads, results):
+            if any([not labels[i][0].isdisjoint(modified[i]) for i in range(2)]):
+                # the result may depend on a previous crossroad
+                getattr(crossroad, method)(**kwargs)
+                ins.Instrumentation.count("crossroads_processed_again")
+                modified[0].update([store.node_index[n] for n in crossroad.nodes])
+                modified[1].update([store.edge_index[tuple(e)] for e in crossroad.edges])
+            else:
+                for n in nodes:
+                    crossroad.insert_node(n)
+                for e in edges:
+                    crossroad.insert_edge(e)
+                crossroad.lanes = lanes
+                for i in range(2):
+                    for j, value in labels[i][1].items():
+                        columns[i][j] = value
+                    modified[i].update(labels[i][1])
+                for c in counters:
+                    ins.Instrumentation.count(c, counters[c])
+
+    # branches only depend on the lanes of each crossroad
+    def compute_branches_in_worker(lanes, similar_direction_angle):
+        crossroad = cr.Crossroad(RegionPool.worker_graph)
+        crossroad.lanes = lanes
+        crossroad.compute_branches(similar_direction_angle)
+        index = {id(l): i for i, l in enumerate(lanes)}
+        return [[index[id(l)] for l in branch] for branch in crossroad.branches]
+
+    def compute_branches(self, crossroads, similar_direction_angle):
+        if len(crossroads) == 0:
+            return
+        results = self.map(RegionPool.compute_branches_in_worker, [c.lanes for c in crossroads], [similar_direction_angle] * len(crossroads))
+        for crossroad, branches in zip(crossroads, results):
+            crossroad.branches = [[crossroad.lanes[i] for i in branch] for branch in branches]
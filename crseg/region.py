@@ -1,12 +1,16 @@
 import networkx as nx
-import osmnx as ox
-import pandas as pd
 import random
 import math
+import heapq
+import itertools
+import numpy as np
 
 
 from . import utils as u
 from . import reliability as r
+from . import geometry as geo
+from . import attribute_store as st
+from . import instrumentation as ins
 
 
 
@@ -21,6 +25,14 @@ class Region:
         self.G = G
         self.edges = []
         self.nodes = []
+        # sets used for membership tests (edges are stored in both directions)
+        self.node_set = set()
+        self.edge_set = set()
+        # for each node, the edges of the region adjacent to this node
+        self.node_edges = {}
+        # derived properties (diameter, geometric center, etc.), cleared each time
+        # a node or an edge is added
+        self.cache = {}
         if target_id == -1:
             self.id = Region.id_region
             Region.id_region += 1
@@ -38,28 +50,57 @@ class Region:
     def clear_region(self):
         # remove edges
         for e in self.edges:
-            self.G[e[0]][e[1]][0][Region.label_region] = -1
+            Region.set_edge_region(self.G, e, -1)
         
         # then remove nodes
         for n in self.nodes:
-            self.G.nodes[n][Region.label_region] = -1
+            Region.set_node_region(self.G, n, -1)
+
+        self.set_nodes_and_edges([], [])
+
+    # set the nodes and edges of the region, without modifying the labels in the graph
+    def set_nodes_and_edges(self, nodes, edges):
+        self.edges = []
+        self.nodes = []
+        self.node_set = set()
+        self.edge_set = set()
+        self.node_edges = {}
+        self.cache = {}
+        for n in nodes:
+            self.insert_node(n)
+        for e in edges:
+            self.insert_edge(e)
     
     # return true if all the nodes of the given region are part of the current region
     def contains(self, region):
         for n in region.nodes:
-            if not n in self.nodes:
+            if not n in self.node_set:
                 return False
         return True
 
     def init_attr(G):
-        nx.set_edge_attributes(G, values=-1, name=Region.label_region)
-        nx.set_node_attributes(G, values=-1, name=Region.label_region)
+        store = st.AttributeStore.get(G)
+        store.init_edge_column(Region.label_region, -1, np.int32)
+        store.init_node_column(Region.label_region, -1, np.int32)
+
+    # region labels are stored in the attribute store of the graph
+    def get_node_region(G, n):
+        return st.AttributeStore.get(G).get_node(Region.label_region, n)
+
+    def set_node_region(G, n, value):
+        st.AttributeStore.get(G).set_node(Region.label_region, n, value)
+
+    def get_edge_region(G, e):
+        return st.AttributeStore.get(G).get_edge(Region.label_region, e)
+
+    def set_edge_region(G, e, value):
+        st.AttributeStore.get(G).set_edge(Region.label_region, e, value)
 
     def unknown_region_node_in_graph(G, n):
-        return G.nodes[n][Region.label_region] == -1
+        return Region.get_node_region(G, n) == -1
 
     def unknown_region_edge_in_graph(G, e):
-        return G[e[0]][e[1]][0][Region.label_region] == -1
+        return Region.get_edge_region(G, e) == -1
 
     def unknown_region_node(self, n):
         return Region.unknown_region_node_in_graph(self.G, n)
@@ -68,7 +109,7 @@ class Region:
         return Region.unknown_region_edge_in_graph(self.G, e)
 
     def clear_node_region_in_grah(G, n):
-        G.nodes[n][Region.label_region] = -1
+        Region.set_node_region(G, n, -1)
 
     def add_path(self, path):
         for n in path:
@@ -80,15 +121,30 @@ class Region:
         for path in paths:
             self.add_path(path)
 
-    def add_node(self, n):
-        if n not in self.nodes:
+    def insert_node(self, n):
+        if n not in self.node_set:
             self.nodes.append(n)
-        self.G.nodes[n][Region.label_region] = self.id
+            self.node_set.add(n)
+            self.cache.clear()
 
-    def add_edge(self, e):
+    def insert_edge(self, e):
         if not self.has_edge(e):
+            self.cache.clear()
             self.edges.append(e)
-        self.G[e[0]][e[1]][0][Region.label_region] = self.id
+            self.edge_set.add((e[0], e[1]))
+            self.edge_set.add((e[1], e[0]))
+            for n in set([e[0], e[1]]):
+                if not n in self.node_edges:
+                    self.node_edges[n] = []
+                self.node_edges[n].append(e)
+
+    def add_node(self, n):
+        self.insert_node(n)
+        Region.set_node_region(self.G, n, self.id)
+
+    def add_edge(self, e):
+        self.insert_edge(e)
+        Region.set_edge_region(self.G, e, self.id)
 
     def add_path(self, path):
         for p in path:
@@ -97,31 +153,32 @@ class Region:
             self.add_edge((p1, p2))
 
     def has_edge(self, e):
-        return (e[0], e[1]) in self.edges or (e[1], e[0]) in self.edges
+        return (e[0], e[1]) in self.edge_set
 
     def has_node(self, n):
-        return n in self.nodes
+        return n in self.node_set
 
     def edges_with_node(self, n):
-        return [ e for e in self.edges if e[0] == n or e[1] == n]
+        return list(self.node_edges.get(n, []))
 
     def is_boundary_node(self, n):
-        nbnb = len(list(self.G.neighbors(n)))
-        nbEdgesInside = len([e for e in self.edges if e[0] == n or e[1] == n])
+        nbnb = u.Util.degree(self.G, n)
+        nbEdgesInside = len(self.node_edges.get(n, []))
         return nbnb != nbEdgesInside
 
+    # return the given derived property of the region, computed using the given function
+    # if it is not in the cache
+    def get_cached(self, name, function):
+        if not name in self.cache:
+            self.cache[name] = function()
+        return self.cache[name]
+
     def get_geometric_center(self):
-        bn = self.boundary_nodes()
-        return [sum([self.G.nodes[i]["x"] for i in bn])/ len(bn), sum([self.G.nodes[i]["y"] for i in bn])/ len(bn)]
+        return list(self.get_cached("geometric_center", lambda: geo.Geometry.get(self.G).centroid(self.boundary_nodes())))
 
     def get_geometric_radius(self):
         center = self.get_geometric_center()
-        result = 0
-        for node in self.nodes:
-                d = u.Util.coords_distance(center, (self.G.nodes[node]["x"], self.G.nodes[node]["y"]))
-                if d > result:
-                    result = d
-        return result
+        return geo.Geometry.get(self.G).max_distance_to(self.nodes, center)
 
 
     def centroid(self):
@@ -135,34 +192,70 @@ class Region:
         return result
 
     def distance_to(self, latitude, longitude):
-        return min([ox.distance.great_circle_vec(lat1=self.G.nodes[k]["y"], lng1=self.G.nodes[k]["x"], lat2=latitude, lng2=longitude) for k in self.nodes])
+        return geo.Geometry.get(self.G).min_distance_to(self.nodes, (longitude, latitude))
 
     def diameter(self):
-        # TODO: not optimized
-        result = 0
-        for n1 in self.nodes:
-            for n2 in self.nodes:
-                d = u.Util.distance(self.G, n1, n2)
-                if d > result:
-                    result = d
-        return result
+        return self.get_cached("diameter", lambda: geo.Geometry.get(self.G).max_distance(self.nodes))
+
+    # weighted adjacency of the region: for each node, the list of (neighbour, weight) of the edges
+    # of the region, in the order of the graph
+    def get_adjacency(self, weight_function = None):
+        def build():
+            adjacency = {}
+            for n in self.node_edges:
+                adjacency[n] = [(nb, weight_function(self.G, n, nb) if weight_function != None else u.Util.distance(self.G, n, nb)) \
+                                for nb in u.Util.neighbors(self.G, n) if self.has_edge((n, nb))]
+            return adjacency
+        return self.get_cached(("adjacency", weight_function), build)
+
+    # multi source Dijkstra on the given adjacency, with the same exploration order as networkx
+    # (thus the same paths in case of equality). Return the distances and the paths from the sources
+    def shortest_paths(adjacency, sources, cutoff):
+        distances = {}
+        paths = {s: [s] for s in sources}
+        seen = {}
+        c = itertools.count()
+        fringe = []
+        for s in sources:
+            seen[s] = 0
+            heapq.heappush(fringe, (0, next(c), s))
+        while fringe:
+            d, _, n = heapq.heappop(fringe)
+            if n in distances:
+                continue
+            distances[n] = d
+            for nb, w in adjacency.get(n, []):
+                dnb = d + w
+                if dnb > cutoff or nb in distances:
+                    continue
+                if not nb in seen or dnb < seen[nb]:
+                    seen[nb] = dnb
+                    heapq.heappush(fringe, (dnb, next(c), nb))
+                    paths[nb] = paths[n] + [nb]
+        return distances, paths
 
     # return a shortest path inside the current region that connects a node from nodes1 and a node from nodes2
-    # if no such path exists, it returns an empty path
+    # if no such path exists, it returns an empty path. Paths are computed on the adjacency of the region,
+    # and stored in the cache of the region.
     def get_path(self, nodes1, nodes2, weight_function = None):
         if len(nodes1) == 0 or len(nodes2) == 0:
             return []
 
-        cutoff = 3 * self.diameter() # large number in case of non straight paths
-        # get all possible paths in the current region from the input nodes
-        distances, paths = nx.multi_source_dijkstra(self.G, nodes1, 
-            weight = lambda n1, n2, d: (weight_function(self.G, n1, n2) if weight_function != None else u.Util.distance(self.G, n1, n2)) if self.has_edge((n1, n2)) else None, 
-            cutoff = cutoff)
-
-        # keep paths that reach one of the given nodes
-        distances = {k: v for k, v in distances.items() if k in nodes2}
-        if len(distances) == 0:
-            return None
-        # keep the best one
-        best_target = min(distances, key=distances.get)
-        return paths[best_target], distances[best_target]
+        key = ("path", weight_function, tuple(nodes1), tuple(nodes2))
+        if not key in self.cache:
+            ins.Instrumentation.count("dijkstra_calls")
+            cutoff = 3 * self.diameter() # large number in case of non straight paths
+            # get all possible paths in the current region from the input nodes
+            distances, paths = Region.shortest_paths(self.get_adjacency(weight_function), nodes1, cutoff)
+
+            # keep paths that reach one of the given nodes
+            distances = {k: v for k, v in distances.items() if k in nodes2}
+            if len(distances) == 0:
+                self.cache[key] = None
+            else:
+                # keep the best one
+                best_target = min(distances, key=distances.get)
+                self.cache[key] = (paths[best_target], distances[best_target])
+
+        result = self.cache[key]
+        return None if result == None else (list(result[0]), result[1])
@@ -14,8 +14,7 @@ class RegionFactory:
             result.filled = region.filled
         else:
             result = rg.Region(region.G)
-        result.nodes = region.nodes.copy()
-        result.edges = region.edges.copy()
+        result.set_nodes_and_edges(region.nodes, region.edges)
 
         result.lanes = region.lanes.copy()
         result.center = region.center
@@ -29,15 +28,15 @@ class RegionFactory:
 
         regions = {}
         for n in G.nodes:
-            if G.nodes[n][rg.Region.label_region] != -1:
-                id = G.nodes[n][rg.Region.label_region]
+            if not rg.Region.unknown_region_node_in_graph(G, n):
+                id = rg.Region.get_node_region(G, n)
                 if not id in regions:
                     regions[id] = cr.Crossroad(G, target_id = int(id)) if G.graph[rg.Region.regiontag_prefix + str(id)] == "crossroad" else rg.Region(G, target_id = id)
                 regions[id].add_node(n)
 
         for e in G.edges:
-            if G[e[0]][e[1]][0][rg.Region.label_region] != -1:
-                id = G[e[0]][e[1]][0][rg.Region.label_region]
+            if not rg.Region.unknown_region_edge_in_graph(G, (e[0], e[1])):
+                id = rg.Region.get_edge_region(G, (e[0], e[1]))
                 if not id in regions:
                     regions[id] = cr.Crossroad(G, target_id = id) if G.graph[rg.Region.regiontag_prefix + str(id)] == "crossroad" else rg.Region(G, target_id = id)
 
@@ -53,23 +52,26 @@ class RegionFactory:
 
     def build_links_between_crossings(G, crossings):
         links = {}
+        # nodes contained in a link
+        link_nodes = set()
 
         for rid in crossings:
             for b in crossings[rid].boundary_nodes():
                 # if some edges are not in a region                    
                 if u.Util.has_non_labeled_adjacent_edge(G, b):
                     # for each edge outside of a region, create a link region
-                    for nb in G.neighbors(b):
-                        if G[b][nb][0][rg.Region.label_region] == -1:
+                    for nb in u.Util.neighbors(G, b):
+                        if rg.Region.unknown_region_edge_in_graph(G, (b, nb)):
                             l = lk.Link(G, b, nb)
                             l.propagate()
                             links[l.id] = l
+                            link_nodes.update(l.nodes)
                 else:
                     # create a link region with a single node (if not yet created)
-                    exists = len([idl for idl in links if links[idl].has_node(b)])
-                    if exists == 0:
+                    if not b in link_nodes:
                         l = lk.Link(G, b)
                         links[l.id] = l
+                        link_nodes.add(b)
                     
 
         return links
\ No newline at end of file
@@ -2,14 +2,16 @@
 
 
 import networkx as nx
-import osmnx as ox
-import pandas as pd
 import random
 import math
+import numpy as np
 
 
 from . import region as r
 from . import utils as u
+from . import chain_index as ci
+from . import attribute_store as st
+from . import graph_core as gc
 
 
 
@@ -40,70 +42,104 @@ class Reliability:
 
 
     def init_attr(G):
-        nx.set_node_attributes(G, values=Reliability.uncertain, name=Reliability.boundary_reliability)
-        nx.set_node_attributes(G, values=Reliability.uncertain, name=Reliability.crossroad_reliability)
-        Reliability.compute_nodes_reliability(G)
+        # boundaries stored in the chain index are computed from the reliability
+        ci.ChainIndex.get(G).clear_boundaries()
 
-        nx.set_edge_attributes(G, values=Reliability.uncertain, name=Reliability.crossroad_reliability)
+        Reliability.compute_nodes_reliability(G)
         Reliability.compute_edges_reliability(G)
 
+    # reliability scores are stored in the attribute store of the graph
+    def get_node_reliability(G, n, name):
+        return st.AttributeStore.get(G).get_node(name, n)
+
+    def set_node_reliability(G, n, name, value):
+        st.AttributeStore.get(G).set_node(name, n, value)
+
+    def get_edge_reliability(G, e, name):
+        return st.AttributeStore.get(G).get_edge(name, e)
+
+    def set_edge_reliability(G, e, name, value):
+        st.AttributeStore.get(G).set_edge(name, e, value)
+
+    # reliability scores are computed on the columns of the graph core
     def compute_edges_reliability(G):
+        store = st.AttributeStore.get(G)
+        core = gc.GraphCore.get(G)
 
-        for e in G.edges():
-            length = u.Util.distance(G, e[0], e[1])
-            if "junction" in G[e[0]][e[1]][0]:
-                G[e[0]][e[1]][0][Reliability.crossroad_reliability] = Reliability.strongly_yes
+        junction = np.not_equal(core.get_edge_tags("junction"), None)
 
-    def compute_nodes_reliability(G):
+        crossroad = np.full(len(store.edges), Reliability.uncertain, dtype=np.float32)
+        crossroad[junction] = Reliability.strongly_yes
+        store.set_edge_column(Reliability.crossroad_reliability, crossroad)
 
-        for n in G.nodes:
-            nb_neighbors = len(list(G.neighbors(n)))
-
-            if "highway" in G.nodes[n]:
-                if nb_neighbors == 2:
-                    G.nodes[n][Reliability.crossroad_reliability] = Reliability.strongly_no
-                
-                
-
-
-                if G.nodes[n]["highway"] in Reliability.strongly_no_boundary_attr:
-                    G.nodes[n][Reliability.boundary_reliability] = Reliability.moderate_no
-                elif G.nodes[n]["highway"] in Reliability.possible_boundary and nb_neighbors <= 3:
-                    G.nodes[n][Reliability.boundary_reliability] = Reliability.strongly_yes
-                elif G.nodes[n]["highway"] in Reliability.moderate_boundary and nb_neighbors <= 3:
-                    G.nodes[n][Reliability.boundary_reliability] = Reliability.moderate_yes
-                    G.nodes[n][Reliability.crossroad_reliability] = Reliability.moderate_yes
-                
-                if nb_neighbors >= 3:
-                    G.nodes[n][Reliability.crossroad_reliability] = Reliability.strongly_yes
-            else:
-                if nb_neighbors == 2:
-                    G.nodes[n][Reliability.boundary_reliability] = Reliability.strongly_no
-                    G.nodes[n][Reliability.crossroad_reliability] = Reliability.strongly_no
-                elif nb_neighbors >= 4:
-                        G.nodes[n][Reliability.crossroad_reliability] = Reliability.strongly_yes
-                elif nb_neighbors == 3:
-                        adj_streetnames = u.Util.get_adjacent_streetnames(G, n)
-
-                        if len(adj_streetnames) > 1:
-                            # more than one street name, it is probably part of a crossroad
-                            G.nodes[n][Reliability.crossroad_reliability] = Reliability.moderate_yes
-                        else:
-                            # only one name
-                            if u.Util.is_part_of_local_triangle(G, n) or u.Util.is_street_separation(G, n):
-                                G.nodes[n][Reliability.crossroad_reliability] = Reliability.moderate_no
-                            else:
-                                G.nodes[n][Reliability.crossroad_reliability] = Reliability.moderate_yes
-
-            if nb_neighbors > 2:
-                # if all adjacent edges are service=parking_aisle, then it is not an intersection
-                if u.Util.is_inside_parking(G, n):
-                    G.nodes[n][Reliability.crossroad_reliability] = Reliability.strongly_no
+    def compute_nodes_reliability(G):
+        store = st.AttributeStore.get(G)
+        core = gc.GraphCore.get(G)
+        nodes = core.nodes
+        ends1, ends2 = store.get_edge_ends()
+
+        # columns describing the nodes
+        degree = core.degrees
+        highway = core.get_node_tags("highway")
+        has_highway = np.not_equal(highway, None)
+
+        boundary = np.full(len(nodes), Reliability.uncertain, dtype=np.float32)
+        crossroad = np.full(len(nodes), Reliability.uncertain, dtype=np.float32)
+
+        # nodes with a highway tag
+        no_boundary = has_highway & np.isin(highway, Reliability.strongly_no_boundary_attr)
+        possible = has_highway & ~no_boundary & np.isin(highway, Reliability.possible_boundary) & (degree <= 3)
+        moderate = has_highway & ~no_boundary & ~possible & np.isin(highway, Reliability.moderate_boundary) & (degree <= 3)
+
+        crossroad[has_highway & (degree == 2)] = Reliability.strongly_no
+        boundary[no_boundary] = Reliability.moderate_no
+        boundary[possible] = Reliability.strongly_yes
+        boundary[moderate] = Reliability.moderate_yes
+        crossroad[moderate] = Reliability.moderate_yes
+        crossroad[has_highway & (degree >= 3)] = Reliability.strongly_yes
+
+        # nodes without highway tag
+        boundary[~has_highway & (degree == 2)] = Reliability.strongly_no
+        crossroad[~has_highway & (degree == 2)] = Reliability.strongly_no
+        crossroad[~has_highway & (degree >= 4)] = Reliability.strongly_yes
+
+        candidates = np.flatnonzero(~has_highway & (degree == 3))
+        if len(candidates) != 0:
+            # street name (or ref) of each edge, as a categorical column
+            streetnames = core.get_edge_tags("name").copy()
+            no_name = np.equal(streetnames, None)
+            streetnames[no_name] = core.get_edge_tags("ref")[no_name]
+            names = {}
+            name_codes = np.fromiter((names.setdefault(name, len(names)) for name in streetnames), dtype=np.int32, count=len(streetnames))
+            # the three edges of each candidate, from the adjacency
+            adjacent = core.slot_edges[core.indptr[candidates][:, np.newaxis] + np.arange(3)]
+            codes = name_codes[adjacent]
+            several_names = (codes[:, 0] != codes[:, 1]) | (codes[:, 1] != codes[:, 2])
+
+            # more than one street name, it is probably part of a crossroad
+            crossroad[candidates[several_names]] = Reliability.moderate_yes
+            # only one name
+            for i in candidates[~several_names]:
+                n = nodes[i]
+                if u.Util.is_part_of_local_triangle(G, n) or u.Util.is_street_separation(G, n):
+                    crossroad[i] = Reliability.moderate_no
+                else:
+                    crossroad[i] = Reliability.moderate_yes
+
+        # if all adjacent edges are service=parking_aisle, then it is not an intersection
+        not_parking = np.not_equal(core.get_edge_tags("service"), "parking_aisle")
+        nb_not_parking = np.zeros(len(nodes), dtype=np.int32)
+        np.add.at(nb_not_parking, ends1[not_parking], 1)
+        np.add.at(nb_not_parking, ends2[not_parking], 1)
+        crossroad[(degree > 2) & (nb_not_parking == 0)] = Reliability.strongly_no
+
+        store.set_node_column(Reliability.boundary_reliability, boundary)
+        store.set_node_column(Reliability.crossroad_reliability, crossroad)
 
 
     def get_best_reliability_node(G, n):
         
-        if G.nodes[n][Reliability.crossroad_reliability] > G.nodes[n][Reliability.boundary_reliability]:
+        if Reliability.get_node_reliability(G, n, Reliability.crossroad_reliability) > Reliability.get_node_reliability(G, n, Reliability.boundary_reliability):
             return Reliability.crossroad_reliability
         else:
             return Reliability.boundary_reliability
@@ -121,47 +157,35 @@ class Reliability:
         return False
 
     def is_strong_boundary(G, n):
-        return G.nodes[n][Reliability.boundary_reliability] == Reliability.strongly_yes
+        return Reliability.get_node_reliability(G, n, Reliability.boundary_reliability) == Reliability.strongly_yes
 
     def is_weakly_boundary(G, n):
-        return G.nodes[n][Reliability.boundary_reliability] >= Reliability.weakly_yes
+        return Reliability.get_node_reliability(G, n, Reliability.boundary_reliability) >= Reliability.weakly_yes
 
     def is_weakly_no_boundary(G, n):
-        return G.nodes[n][Reliability.boundary_reliability] <= Reliability.weakly_no
+        return Reliability.get_node_reliability(G, n, Reliability.boundary_reliability) <= Reliability.weakly_no
 
     def is_strong_no_boundary(G, n):
-        return G.nodes[n][Reliability.boundary_reliability] == Reliability.strongly_no
+        return Reliability.get_node_reliability(G, n, Reliability.boundary_reliability) == Reliability.strongly_no
 
     def is_strong_in_crossroad(G, n):
-        return G.nodes[n][Reliability.crossroad_reliability] == Reliability.strongly_yes
+        return Reliability.get_node_reliability(G, n, Reliability.crossroad_reliability) == Reliability.strongly_yes
 
     def is_weakly_in_crossroad(G, n):
-        return G.nodes[n][Reliability.crossroad_reliability] >= Reliability.weakly_yes
+        return Reliability.get_node_reliability(G, n, Reliability.crossroad_reliability) >= Reliability.weakly_yes
 
     def is_weakly_not_in_crossroad(G, n):
-        return G.nodes[n][Reliability.crossroad_reliability] <= Reliability.weakly_no
+        return Reliability.get_node_reliability(G, n, Reliability.crossroad_reliability) <= Reliability.weakly_no
 
     def is_strong_not_in_crossroad(G, n):
-        return G.nodes[n][Reliability.crossroad_reliability] == Reliability.strongly_no
+        return Reliability.get_node_reliability(G, n, Reliability.crossroad_reliability) == Reliability.strongly_no
 
     def is_weakly_in_crossroad_edge(G, e):
-        return G[e[0]][e[1]][0][Reliability.crossroad_reliability] >= Reliability.weakly_yes
+        return Reliability.get_edge_reliability(G, e, Reliability.crossroad_reliability) >= Reliability.weakly_yes
 
     def is_strong_in_crossroad_edge(G, e):
-        return G[e[0]][e[1]][0][Reliability.crossroad_reliability] == Reliability.strongly_yes
+        return Reliability.get_edge_reliability(G, e, Reliability.crossroad_reliability) == Reliability.strongly_yes
 
 
     def get_path_to_boundary(G, n1, n2, max = -1):
-        path = [n1, n2]
-        length = u.Util.distance(G, n1, n2)
-
-
-        while (max < 0 or length < max) and u.Util.is_middle_polyline(G, path[len(path) - 1]):
-            last = path[len(path) - 1]
-            if Reliability.is_weakly_boundary(G, last):
-                return path
-            path.append(u.Util.get_opposite_node(G, path[len(path) - 1], path[len(path) - 2]))
-            length += u.Util.distance(G, path[len(path) - 2], path[len(path) - 1])
-        # we reach a split node without reaching a boundary node
-        return []
-        
+        return ci.ChainIndex.get(G).get_path_to_boundary(G, n1, n2, Reliability.is_weakly_boundary, max)
@@ -1,7 +1,6 @@
 
 import networkx as nx
-import osmnx as ox
-import pandas as pd
+import numpy as np
 import random
 import math
 import json
@@ -12,45 +11,67 @@ from . import region as rg
 from . import regionfactory as rf
 from . import reliability as rel
 from . import crossroad_connections as cc
+from . import tiling as tl
+from . import spatial_index as si
+from . import utils as u
+from . import geometry as geo
+from . import attribute_store as st
+from . import instrumentation as ins
+from . import disjoint_set as ds
+from . import parallel as pl
+from . import snapshot as sn
+from . import simple_graph as sg
+from . import graph_core as gc
 
 class Segmentation:
 
-    def __init__(self, G, init=True, selection=None, C0 = 2, C1 = 2.5, C2 = 4, max_cycle_elements = 10, similar_direction_angle = 60):
-        self.G = G
+    # G is an undirected graph (simple graph, or MultiGraph as built by OSMnx, converted in a simple graph
+    # sharing its attributes). If init is False, the regions are rebuilt from the region labels of the graph,
+    # unless rebuild_regions is False (the regions are then set by the caller)
+    def __init__(self, G, init=True, selection=None, C0 = 2, C1 = 2.5, C2 = 4, max_cycle_elements = 10, similar_direction_angle = 60, max_cycle_work = None, executor = "serial", workers = None, rebuild_regions = True):
+        self.G = sg.SimpleGraph.from_graph(G)
         self.regions = {}
         self.C0 = C0
         self.C1 = C1
         self.C2 = C2
         self.max_cycle_elements = max_cycle_elements
+        # maximum number of steps of the cycle search from each crossroad
+        self.max_cycle_work = max_cycle_work
         self.selection = selection
         self.similar_direction_angle = similar_direction_angle
+        self.crossroads_index = None
+        # per-crossroad stages are run by a pool of processes if executor is "process"
+        self.executor = executor
+        self.workers = workers
+        self.pool = None
+        # stage timers and counters of the processing
+        self.instrumentation = ins.Instrumentation()
         random.seed()
         if init:
-            rel.Reliability.init_attr(self.G)
-        else:
+            # the graph may have been modified since a previous use of its caches
+            gc.GraphCore.invalidate(self.G)
+            self.instrumentation.stage("reliability", rel.Reliability.init_attr, self.G)
+        elif rebuild_regions:
             self.regions = rf.RegionFactory.rebuild_regions_from_tags(self.G)
 
 
     def set_tags_only_regions(self):
         # clear tags
-        for n in self.G.nodes:
-            self.G.nodes[n][rg.Region.label_region] = -1
-        for u, v, a in self.G.edges(data = True):
-            self.G[u][v][0][rg.Region.label_region] = -1
+        rg.Region.init_attr(self.G)
 
         # set tags wrt crossroad regions
         for rid in self.regions:
             region = self.regions[rid]
             if region.is_crossroad():
                 for n in region.nodes:
-                    self.G.nodes[n][rg.Region.label_region] = rid
+                    rg.Region.set_node_region(self.G, n, rid)
                 for e in region.edges:
-                    self.G[e[0]][e[1]][0][rg.Region.label_region] = rid
+                    rg.Region.set_edge_region(self.G, e, rid)
                 
 
     def set_tags_from_selection(self):
         import geopandas as gp
-        from shapely.geometry import Point, Polygon
+        import pandas as pd
 
         # init flags
         rg.Region.init_attr(self.G)
@@ -58,34 +79,61 @@ class Segmentation:
         # load polygons
         file = open(self.selection)
         df = gp.read_file(file)
+        for idPoly in df.index:
+            self.G.graph[rg.Region.regiontag_prefix + str(idPoly)] = "crossroad"
 
-        # create point geoseries
-        points = gp.GeoSeries([Point(self.G.nodes[n]["x"], self.G.nodes[n]["y"]) for n in self.G.nodes])
-        pointIds = [n for n in self.G.nodes]
+        # polygons containing each node, using a single spatial join
+        geometry = geo.Geometry.get(self.G)
+        points = gp.GeoDataFrame(geometry=gp.points_from_xy(geometry.x, geometry.y), crs=df.crs)
+        polygons = gp.GeoDataFrame(geometry=df.geometry.values, crs=df.crs)
+        joined = gp.sjoin(points, polygons, how="inner", predicate="intersects")
 
-        # for each polygon in the selection
-        for idPoly, polygon in df.iterrows():
-            self.G.graph[rg.Region.regiontag_prefix + str(idPoly)] = "crossroad"
+        pairs = pd.DataFrame({"node": joined.index.to_numpy(), "polygon": joined["index_right"].to_numpy()})
 
-            poly = gp.GeoSeries(polygon)
-            intersections = points.intersects(poly[0]) # TODO: improve this double conversion
+        # a node inside several polygons is part of the last one
+        last = np.full(len(points), -1, dtype=np.int64)
+        np.maximum.at(last, pairs["node"].to_numpy(), pairs["polygon"].to_numpy())
+        node_labels = np.where(last >= 0, df.index.to_numpy()[last], -1)
 
-            # set point flags
-            for idPoint, inside in intersections.items():
-                if inside:
-                    self.G.nodes[pointIds[idPoint]][rg.Region.label_region] = idPoly
+        # set point flags
+        store = st.AttributeStore.get(self.G)
+        store.node_columns[rg.Region.label_region][:] = node_labels
 
-            # set segment flags according to segments
-            for n in self.G.nodes:
-                if self.G.nodes[n][rg.Region.label_region] >= 0:
-                    for nb in self.G.neighbors(n):
-                        if self.G.nodes[nb][rg.Region.label_region] == self.G.nodes[n][rg.Region.label_region]:
-                            self.G[n][nb][0][rg.Region.label_region] = self.G.nodes[n][rg.Region.label_region]
+        # set segment flags: an edge is part of the last polygon containing both its extremities
+        ends1, ends2 = store.get_edge_ends()
+        edges = pd.DataFrame({"edge": np.arange(len(ends1)), "node": ends1, "end": ends2})
+        edges = edges.merge(pairs, on="node").merge(pairs.rename(columns={"node": "end"}), on=["end", "polygon"])
+        shared = edges.groupby("edge")["polygon"].max()
+        store.edge_columns[rg.Region.label_region][shared.index.to_numpy()] = df.index.to_numpy()[shared.to_numpy()]
 
 
-        
+    # observers are notified of the beginning and the end of each stage, and of each count
+    def add_observer(self, observer):
+        self.instrumentation.add_observer(observer)
+
+    # return the stage timers (in seconds) and the counters of the processing
+    def get_stats(self):
+        return self.instrumentation.to_dict()
+
+    # the pool of processes is created on first use, and kept until the end of the processing
+    def get_pool(self):
+        if self.pool == None:
+            self.pool = self.instrumentation.stage("start_pool", pl.RegionPool, self.G, self.workers)
+        return self.pool
+
+    def close_pool(self):
+        if self.pool != None:
+            self.pool.close()
+            self.pool = None
 
     def process(self):
+        try:
+            self.process_stages()
+        finally:
+            self.close_pool()
+
+    def process_stages(self):
+        self.crossroads_index = None
 
         if self.selection != None:
             self.set_tags_from_selection()
@@ -93,9 +141,12 @@ class Segmentation:
             self.inner_regions = {}
             self.regions = rf.RegionFactory.rebuild_regions_from_tags(self.G)
 
+            if self.executor == "process":
+                self.get_pool().run([r for r in self.regions.values() if r.is_crossroad()], "build_lanes_description")
             for rid in self.regions:
                 region = self.regions[rid]
-                region.build_lanes_description()
+                if self.executor != "process" or not region.is_crossroad():
+                    region.build_lanes_description()
         else:
             # init flags
             rg.Region.init_attr(self.G)
@@ -103,111 +154,148 @@ class Segmentation:
             self.regions = {}
 
             # first build crossroads
-            crossroads = cr.Crossroad.build_crossroads(self.G, self.C0)
+            crossroads = self.instrumentation.stage("build_crossroads", cr.Crossroad.build_crossroads, self.G, self.C0)
             for c in crossroads:
                 self.regions[c.id] = c
+            self.instrumentation.add("crossroads_built", len(crossroads))
 
             # group subparts of crossroads together if they are part of the same crossing (using street names)
-            clusters = cr.Crossroad.get_clusters(crossroads, self.C1)
-
-            # for each cluster
-            for cluster in clusters:
-                # merge them
-                if len(cluster) > 1:
-                    cluster[0].merge(cluster[1:])
-                for o in cluster[1:]:
-                    del self.regions[o.id]
+            clusters = self.instrumentation.stage("get_clusters", cr.Crossroad.get_clusters, crossroads, self.C1)
+            self.instrumentation.stage("merge_clusters", self.merge_clusters, clusters)
 
             # maximum length for missing maths
             scale_missing = self.C0
             # add inner paths and missing boundaries
-            self.add_missing_paths(scale = scale_missing)
+            self.instrumentation.stage("add_missing_paths", self.add_missing_paths, scale = scale_missing)
             
             # build links between regions
-            links = rf.RegionFactory.build_links_between_crossings(self.G, self.regions)
+            links = self.instrumentation.stage("build_links", rf.RegionFactory.build_links_between_crossings, self.G, self.regions)
             self.regions.update(links)
             self.set_tags_only_regions()
 
             # merge crossings
-            self.merge_linked_crossroads()
+            self.instrumentation.stage("merge_linked_crossroads", self.merge_linked_crossroads)
 
             # add inner paths and missing boundaries (again)
-            self.add_missing_paths(scale = scale_missing, boundaries = False)
+            self.instrumentation.stage("add_inner_paths", self.add_missing_paths, scale = scale_missing, boundaries = False)
 
         # create branch regions
-        for rid in self.regions:
-            if self.regions[rid].is_crossroad():
-                self.regions[rid].compute_branches(self.similar_direction_angle)
-        
-        for rid in self.inner_regions:
-            self.inner_regions[rid].compute_branches(self.similar_direction_angle)
-            
+        self.instrumentation.stage("compute_branches", self.compute_branches)
+
+    def merge_clusters(self, clusters):
+        # for each cluster
+        for cluster in clusters:
+            # merge them
+            if len(cluster) > 1:
+                cluster[0].merge(cluster[1:])
+                self.instrumentation.add("clusters_merged")
+            for o in cluster[1:]:
+                del self.regions[o.id]
+
+    def compute_branches(self):
+        crossroads = [self.regions[rid] for rid in self.regions if self.regions[rid].is_crossroad()]
+        crossroads += [self.inner_regions[rid] for rid in self.inner_regions]
+        if self.executor == "process":
+            self.get_pool().compute_branches(crossroads, self.similar_direction_angle)
+        else:
+            for c in crossroads:
+                c.compute_branches(self.similar_direction_angle)
+
+    def get_parameters(self):
+        return { "C0": self.C0, "C1": self.C1, "C2": self.C2,
+                 "max_cycle_elements": self.max_cycle_elements,
+                 "max_cycle_work": self.max_cycle_work,
+                 "similar_direction_angle": self.similar_direction_angle }
+
+    # run the segmentation on spatial tiles (with a halo margin) using a pool of processes,
+    # then stitch the crossroads crossing the tile borders.
+    def process_by_tiles(self, tile_size = 1000, halo = 300, workers = None):
+        if self.selection != None:
+            # a selection describes the crossroads, no need for a parallel processing
+            self.process()
+            return
+
+        self.crossroads_index = None
+        tiling = self.instrumentation.stage("build_tiles", tl.Tiling, self.G, tile_size, halo)
+        self.regions, self.inner_regions = self.instrumentation.stage("process_tiles", tiling.process, self.get_parameters(), workers)
+        self.set_tags_only_regions()
+
+        # create branch regions
+        try:
+            self.instrumentation.stage("compute_branches", self.compute_branches)
+        finally:
+            self.close_pool()
+
 
     def merge_linked_crossroads(self):
         self.inner_regions = {}
-        newIDs = {}
+        # for each inner region, the merge step (0 for cycles, 1 for pairs) and the first node of the
+        # crossroad that started the merge. Inner regions are created in this order (see Tiling.stitch)
+        self.inner_regions_origin = {}
+        seeds = {rid: self.regions[rid].nodes[0] for rid in self.regions if self.regions[rid].is_crossroad()}
+        # the id of the region that contains each merged region
+        newIDs = ds.DisjointSet()
 
-        cconnections = cc.CrossroadConnections(self.regions, self.C2)
+        cconnections = self.instrumentation.stage("crossroad_connections", cc.CrossroadConnections, self.regions, self.C2)
 
         # merge multi crossings (triangles, rings, etc)
-        for cycle in cconnections.get_cycles(self.max_cycle_elements):
-            cWithIDs = [cr if cr[0] in self.regions else (newIDs[cr[0]], cr[1]) for cr in cycle][:-1]
+        for cycle in self.instrumentation.stage("get_cycles", cconnections.get_cycles, self.max_cycle_elements, self.max_cycle_work):
+            cWithIDs = [(newIDs.find(cr[0]), cr[1]) for cr in cycle][:-1]
             ids = [x[0] for x in cWithIDs]
             
             if len(set(ids)) > 1:
                 firstID = ids[0]
                 # add all regions as inner regions (of a bigger one)
                 for id in ids:
-                    self.add_inner_region(self.regions[id])
+                    self.add_inner_region(self.regions[id], (0, seeds[cycle[0][0]]))
 
                 for cr1, cr2 in zip(cWithIDs, cWithIDs[1:]):
-                    id2 = newIDs[cr2[0]] if cr2[0] in newIDs else cr2[0]
+                    id2 = newIDs.find(cr2[0])
 
                     # add paths that connects cr1 and cr2
                     self.regions[firstID].add_paths([x[0] for x in cr2[1]])
                     if id2 != firstID:
                         self.regions[firstID].merge([self.regions[id2]])
+                        self.instrumentation.add("crossroads_merged_in_cycles")
                         del self.regions[id2]
-                        newIDs[id2] = firstID
-                        for nid in newIDs:
-                            if newIDs[nid] == id2:
-                                newIDs[nid] = firstID
+                        newIDs.union(firstID, id2)
 
         # merge bi-connected crossings
         for pairs in cconnections.get_pairs():
-            id1 = pairs[0] if pairs[0] in self.regions else newIDs[pairs[0]]
-            id2 = pairs[1] if pairs[1] in self.regions else newIDs[pairs[1]]
+            id1 = newIDs.find(pairs[0])
+            id2 = newIDs.find(pairs[1])
             if id1 != id2:
                 # add the two regions to the inner regions (of a bigger one)
-                self.add_inner_region(self.regions[id1])
-                self.add_inner_region(self.regions[id2])
+                self.add_inner_region(self.regions[id1], (1, seeds[pairs[0]]))
+                self.add_inner_region(self.regions[id2], (1, seeds[pairs[0]]))
                 # add paths that are connecting these two regions
                 self.regions[id1].add_paths([x[0] for x in pairs[2]])
                 # merge the two regions
                 self.regions[id1].merge([self.regions[id2]])
+                self.instrumentation.add("crossroads_merged_in_pairs")
                 # remove the old one
                 del self.regions[id2]
                 # update IDs
-                newIDs[id2] = id1
-                for nid in newIDs:
-                    if newIDs[nid] == id2:
-                        newIDs[nid] = id1
+                newIDs.union(id1, id2)
 
 
-    def add_inner_region(self, region):
+    def add_inner_region(self, region, origin):
         # clone the given region and add it to the inner_regions structure
         newRegion = rf.RegionFactory.clone(region)
         self.inner_regions[newRegion.id] = newRegion
+        self.inner_regions_origin[newRegion.id] = origin
 
     def add_missing_paths(self, boundaries = True, scale = 2):
-        for rid in self.regions:
-            region = self.regions[rid]
-            if region.is_crossroad():
-                region.add_missing_paths(boundaries = boundaries, scale = scale)
+        crossroads = [self.regions[rid] for rid in self.regions if self.regions[rid].is_crossroad()]
+        if self.executor == "process":
+            self.get_pool().run(crossroads, "add_missing_paths", boundaries = boundaries, scale = scale)
+        else:
+            for c in crossroads:
+                c.add_missing_paths(boundaries = boundaries, scale = scale)
 
 
     def in_crossroad_region(self, e):
-        tag = self.G[e[0]][e[1]][0][rg.Region.label_region]
+        tag = rg.Region.get_edge_region(self.G, e)
         if tag == -1:
             False
         else: 
@@ -216,9 +304,9 @@ class Segmentation:
 
     def get_adjacent_crossroad_regions(self, n):
         result = []
-        for nb in self.G.neighbors(n):
+        for nb in u.Util.neighbors(self.G, n):
             e = (n, nb)
-            tag = self.G[e[0]][e[1]][0][rg.Region.label_region]
+            tag = rg.Region.get_edge_region(self.G, e)
             if tag != -1 and self.regions[tag].is_crossroad():
                 result.append(self.regions[tag].id)
             else:
@@ -226,7 +314,7 @@ class Segmentation:
         return result
 
     def is_crossroad_node(self, n):
-        tag = self.G.nodes[n][rg.Region.label_region]
+        tag = rg.Region.get_node_region(self.G, n)
         if tag == -1:
             False
         else: 
@@ -234,40 +322,31 @@ class Segmentation:
 
     ######################### Functions used to prepare the graph ########################
 
-    def prepare_network_remove_non_highway(G):
-        to_remove = []
-        for u, v, k, a in G.edges(data=True, keys=True):
-            if not "highway" in a:
-                # remove a specific edge. If k==0, it will remove the first edge, and it might remain supplementary edge with a key != 0.
-                # To solve this issue, at the end of this function, we use a trick by transforming data to a DiGraph, then to a MutliDiGraph (the original
-                # data structure used by the program)
-                to_remove.append((u, v, k))
-        G.remove_edges_from(to_remove)
-
-    def prepare_network_remove_small_ways(G, remove_parking_aisle=True, remove_footways=True, remove_cycleways=True):
-        to_remove = []
-        # remove footways and parkings
-        for u, v, a in G.edges(data=True):
-            if remove_footways:
-                if "footway" in a or ("highway" in a and a["highway"] in ["footway"]):
-                    if not ("psv" in a and a["psv"] in ["yes"]):
-                        to_remove.append((u, v))
-                if ("highway" in a and a["highway"] in ["path", "pedestrian", "steps"]) and not ("psv" in a and a["psv"] in ["yes"]):
-                    to_remove.append((u, v))
-            if remove_cycleways and "highway" in a and a["highway"] in ["cycleway"]:
-                to_remove.append((u, v))
-            if remove_parking_aisle:
-                if "service" in a and a["service"] in ["parking_aisle"]:
-                    to_remove.append((u, v))
-        G.remove_edges_from(to_remove)
-
-    def prepare_network_remove_construction(G):
-        to_remove = []
-        for u, v, a in G.edges(data=True):
-            if "highway" in a and a["highway"] in ["construction"]:
-                # remove construction ways
-                to_remove.append((u, v))
-        G.remove_edges_from(to_remove)
+    # values of the given tag for each edge of the table (None if missing)
+    def get_tag_column(edges, tag):
+        return np.fromiter((e[3].get(tag) for e in edges), dtype=object, count=len(edges))
+
+    # true for the values that are one of the given values
+    def tag_in(column, values):
+        result = np.zeros(len(column), dtype=bool)
+        for v in values:
+            result |= column == v
+        return result
+
+    # a mask of the edges (table of (u, v, key, data)) that are not ways used by cars
+    def get_small_ways(edges, remove_parking_aisle=True, remove_footways=True, remove_cycleways=True):
+        highway = Segmentation.get_tag_column(edges, "highway")
+        result = np.zeros(len(edges), dtype=bool)
+        if remove_footways:
+            # footways and paths, except the ones for public transport
+            footway = np.fromiter(("footway" in e[3] for e in edges), dtype=bool, count=len(edges))
+            psv = Segmentation.get_tag_column(edges, "psv") == "yes"
+            result |= (footway | (highway == "footway") | Segmentation.tag_in(highway, ["path", "pedestrian", "steps"])) & ~psv
+        if remove_cycleways:
+            result |= highway == "cycleway"
+        if remove_parking_aisle:
+            result |= Segmentation.get_tag_column(edges, "service") == "parking_aisle"
+        return result
 
     def get_score_from_tags(tags):
         score = len(tags)
@@ -285,52 +364,106 @@ class Segmentation:
                 best = w
         return best
 
+    # a mask of the highways (of the table of edges (u, v, key, data)) that are supplementary ways
+    # between two nodes: for each direction, only the best way is kept among the ways in this direction
+    # and the ways in the other direction that do not have the same osmid
+    def get_supplementary_highways(edges, node_index):
+        result = np.zeros(len(edges), dtype=bool)
+        has_highway = np.fromiter(("highway" in e[3] for e in edges), dtype=bool, count=len(edges))
+
+        # only the pairs of nodes with at least two highways are considered
+        ends1 = np.fromiter((node_index[e[0]] for e in edges), dtype=np.int64, count=len(edges))
+        ends2 = np.fromiter((node_index[e[1]] for e in edges), dtype=np.int64, count=len(edges))
+        pairs = np.minimum(ends1, ends2) * len(node_index) + np.maximum(ends1, ends2)
+        values, counts = np.unique(pairs[has_highway], return_counts=True)
+        candidates = np.flatnonzero(np.isin(pairs, values[counts > 1]))
+
+        # ways in each direction, in the order of the keys
+        directions = {}
+        for i in candidates:
+            directions.setdefault((edges[i][0], edges[i][1]), []).append(i)
+        for (u, v), forward in directions.items():
+            ways = [(i, 0, edges[i][3]) for i in forward if has_highway[i]]
+            osmids = [w[2]["osmid"] for w in ways]
+            if u != v and (v, u) in directions:
+                ways += [(i, 1, edges[i][3]) for i in directions[(v, u)] if has_highway[i] and edges[i][3]["osmid"] not in osmids]
+            if len(ways) > 1:
+                best_way = Segmentation.identify_best_way(None, u, v, ways)
+                for w in ways:
+                    if w[0] != best_way[0]:
+                        result[w[0]] = True
+        return result
 
-    def prepare_network_remove_supplementary_highways(G):
-        to_remove = []
-
-        for u in G:
-            for v in G[u]:
-                ways = [(w, 0, G[u][v][w]) for w in G[u][v] if "highway" in G[u][v][w]]
-                osmids = [w[2]["osmid"] for w in ways]
-
-                if u in G[v]:
-                    ways += [(w, 1, G[v][u][w]) for w in G[v][u] if "highway" in G[v][u][w] and G[v][u][w]["osmid"] not in osmids]
-                if len(ways) > 1:
-                    best_way_id = Segmentation.identify_best_way(G, u, v, ways)
-                    to_remove += [(u, v, wid[0]) if wid[1] == 0 else (v, u, wid[0]) for wid in ways if not (wid[0] == best_way_id[0] and wid[1] == best_way_id[1])]
-        G.remove_edges_from(to_remove)
-                    
-
+    # return the largest (weakly) connected component, the first one in the order of the nodes if several
+    # components have the same size
+    def get_largest_component(nodes, edges):
+        components = ds.DisjointSet()
+        for n in nodes:
+            components.add(n)
+        for e in edges:
+            components.union(e[0], e[1])
+        sizes = {}
+        for n in nodes:
+            root = components.find(n)
+            sizes[root] = sizes.get(root, 0) + 1
+        largest = max(sizes, key=sizes.get)
+        return set(components.get_elements(largest))
+
+    # remove the ways that are not used by cars, the supplementary highways between two nodes and the ways
+    # in construction, then the isolated nodes (and the nodes outside of the largest component). The filters are
+    # computed on a table of the edges in a single pass, and the result is built directly, with a single edge
+    # (merging the attributes of the kept ways) for each pair of nodes and direction. The given graph is not modified.
     def prepare_network(G, keep_all_components=False, remove_non_highway=True,
                         remove_parking_aisle=True,
                         remove_footways=True, remove_cycleways=True):
+        edges = list(G.edges(keys=True, data=True))
+        node_index = {n: i for i, n in enumerate(G.nodes)}
 
+        removed = np.zeros(len(edges), dtype=bool)
         if remove_non_highway:
-            Segmentation.prepare_network_remove_non_highway(G)
-
+            removed |= np.fromiter(("highway" not in e[3] for e in edges), dtype=bool, count=len(edges))
         if remove_footways or remove_cycleways or remove_parking_aisle:
-            Segmentation.prepare_network_remove_small_ways(G, remove_parking_aisle, remove_footways, remove_cycleways)
-
-        Segmentation.prepare_network_remove_supplementary_highways(G)
-
-        Segmentation.prepare_network_remove_construction(G)
-
-        G = ox.utils_graph.remove_isolated_nodes(G)
-        if not keep_all_components and len(G.nodes) != 0:
-            G = ox.utils_graph.get_largest_component(G)
-        # double transformation to fix keys != 0
-        return nx.MultiDiGraph(nx.DiGraph(G))
+            removed |= Segmentation.get_small_ways(edges, remove_parking_aisle, remove_footways, remove_cycleways)
+
+        # supplementary highways are identified before removing the constructions
+        kept = [e for e, r in zip(edges, removed) if not r]
+        removed = Segmentation.get_supplementary_highways(kept, node_index)
+        removed |= Segmentation.get_tag_column(kept, "highway") == "construction"
+        kept = [e for e, r in zip(kept, removed) if not r]
+
+        # remove isolated nodes
+        connected = set([e[0] for e in kept] + [e[1] for e in kept])
+        nodes = [n for n in G.nodes if n in connected]
+        if not keep_all_components and len(nodes) != 0:
+            component = Segmentation.get_largest_component(nodes, kept)
+            if len(component) != len(nodes):
+                nodes = [n for n in nodes if n in component]
+                kept = [e for e in kept if e[0] in component]
+
+        # a single edge (with key 0) for each pair of nodes and direction
+        merged = {}
+        for u, v, k, data in kept:
+            if not (u, v) in merged:
+                merged[(u, v)] = {}
+            merged[(u, v)].update(data)
+
+        result = nx.MultiDiGraph()
+        result.graph.update(G.graph)
+        result.add_nodes_from((n, G.nodes[n]) for n in nodes)
+        result.add_edges_from((u, v, 0, data) for (u, v), data in merged.items())
+        return result
 
         
     ######################### Functions related to graph rendering (colors) ########################
 
     # return edge colors according to the region label
     def get_regions_colors(self):
+        import pandas as pd
+
         result = {}
         color = {}
         for e in self.G.edges:
-            tag = self.G[e[0]][e[1]][e[2]][rg.Region.label_region]
+            tag = rg.Region.get_edge_region(self.G, e)
             if tag == -1:
                 result[e] = (0.5, 0.5, 0.5, 0.5)
             else:
@@ -341,9 +474,11 @@ class Segmentation:
 
     # return edge colors according to the region class label
     def get_regions_class_colors(self):
+        import pandas as pd
+
         result = {}
         for e in self.G.edges:
-            tag = self.G[e[0]][e[1]][e[2]][rg.Region.label_region]
+            tag = rg.Region.get_edge_region(self.G, e)
             if tag == -1:
                 result[e] = (0.5, 0.5, 0.5, 0.5)
             elif self.regions[tag].is_crossroad():
@@ -386,10 +521,12 @@ class Segmentation:
 
     # return edge colors using one random color per label
     def get_edge_random_colors_by_attr(G, label, values = {}):
+        import pandas as pd
+
         result = {}
         i = 0
         for e in G.edges:
-            tag = G[e[0]][e[1]][e[2]][label]
+            tag = st.AttributeStore.get(G).get_edge(label, e)
             if not tag in values:
                 if tag == -1:
                     values[tag] = (0.5, 0.5, 0.5, 0.5)
@@ -400,11 +537,13 @@ class Segmentation:
         return pd.Series(result)
         
     def get_nodes_reliability_on_regions_colors(self):
+        import pandas as pd
+
 
         result = {}
         for n in self.G.nodes:
             r_class = rel.Reliability.get_best_reliability_node(self.G, n)
-            r_value = self.G.nodes[n][r_class]
+            r_value = rel.Reliability.get_node_reliability(self.G, n, r_class)
             coef = (r_value - rel.Reliability.strongly_no) / (rel.Reliability.strongly_yes - rel.Reliability.strongly_no)
             coef = math.pow(coef, 2)
             if r_class == rel.Reliability.crossroad_reliability:
@@ -429,20 +568,24 @@ class Segmentation:
 
 
     def get_edges_reliability_colors(self):
+        import pandas as pd
+
         result = {}
         for e in self.G.edges:
-            r_value = self.G[e[0]][e[1]][e[2]][rel.Reliability.crossroad_reliability]
+            r_value = rel.Reliability.get_edge_reliability(self.G, e, rel.Reliability.crossroad_reliability)
             coef = (r_value - rel.Reliability.strongly_no) / (rel.Reliability.strongly_yes - rel.Reliability.strongly_no)
             coef = math.pow(coef, 2)
             result[e] = (1, 1, 1, coef)
         return pd.Series(result)
 
     def get_nodes_reliability_colors(self):
+        import pandas as pd
+
 
         result = {}
         for n in self.G.nodes:
             r_class = rel.Reliability.get_best_reliability_node(self.G, n)
-            r_value = self.G.nodes[n][r_class]
+            r_value = rel.Reliability.get_node_reliability(self.G, n, r_class)
             coef = (r_value - rel.Reliability.strongly_no) / (rel.Reliability.strongly_yes - rel.Reliability.strongly_no)
             coef = math.pow(coef, 2)
             if r_class == rel.Reliability.boundary_reliability:
@@ -454,12 +597,14 @@ class Segmentation:
         return pd.Series(result)
 
     def get_boundary_node_colors(self):
+        import pandas as pd
+
 
         result = {}
         for n in self.G.nodes:
             nb_adj_crossings = len(list(set([r for r in self.get_adjacent_crossroad_regions(n) if r != -1])))
-            nbnb = len(list(self.G.neighbors(n)))
-            nbAdj = len([ nb for nb in self.G.neighbors(n) if rg.Region.unknown_region_edge_in_graph(self.G, (n, nb))])
+            nbnb = u.Util.degree(self.G, n)
+            nbAdj = len([ nb for nb in u.Util.neighbors(self.G, n) if rg.Region.unknown_region_edge_in_graph(self.G, (n, nb))])
             if nbnb == nbAdj:
                 if nbnb == 1: # dead end
                     result[n] = (0.5, 0.5, 0.5, 0.1)
@@ -482,17 +627,19 @@ class Segmentation:
         return pd.Series(result)
 
     def get_nodes_regions_colors(self):
+        import pandas as pd
+
         result = {}
         i = 0
         for n in self.G.nodes:
-            if len(list(self.G.neighbors(n))) <= 2:
+            if u.Util.degree(self.G, n) <= 2:
                 result[n] = (0, 0, 0, 0)
             else:
-                label = self.G.nodes[n][rg.Region.label_region]
+                label = rg.Region.get_node_region(self.G, n)
                 if label < 0:
                     result[n] = (0, 0, 0, 0)
                 else:
-                    nb_edge_in_region = len([nb for nb in self.G[n] if self.G[n][nb][0][rg.Region.label_region] == label])
+                    nb_edge_in_region = len([nb for nb in u.Util.neighbors(self.G, n) if rg.Region.get_edge_region(self.G, (n, nb)) == label])
                     if nb_edge_in_region == 0:
                         result[n] = Segmentation.predefined_color(i)
                     else:
@@ -502,13 +649,15 @@ class Segmentation:
 
     # input: a list of crossroads (main crossroad and possibly contained crossroads)
     def get_regions_colors_from_crossroad(self, cr):
+        import pandas as pd
+
         crids = [ c.id for c in cr ]
         mainCR = max(cr, key=lambda x: len(x.nodes))
         maxID = max(crids)
         result = {}
         color = {}
         for e in self.G.edges:
-            tag = self.G[e[0]][e[1]][e[2]][rg.Region.label_region]
+            tag = rg.Region.get_edge_region(self.G, e)
             if not tag in crids:
                 # check if it's a branch of the main crossroad
                 bid = mainCR.get_branch_id(e)
@@ -526,14 +675,16 @@ class Segmentation:
 
     # input: a list of crossroads (main crossroad and possibly contained crossroads)
     def get_nodes_regions_colors_from_crossroad(self, cr):
+        import pandas as pd
+
         crids = [ c.id for c in cr ]
         mainCR = max(cr, key=lambda x: len(x.nodes))
         result = {}
         for n in self.G.nodes:
-            if len(list(self.G.neighbors(n))) <= 2:
+            if u.Util.degree(self.G, n) <= 2:
                 result[n] = (0, 0, 0, 0)
             else:
-                label = self.G.nodes[n][rg.Region.label_region]
+                label = rg.Region.get_node_region(self.G, n)
                 if not label in crids:
                     result[n] = (0, 0, 0, 0)
                 else:
@@ -548,9 +699,24 @@ class Segmentation:
 
     ######################### text descriptions ########################
 
+    # build a spatial index of the nodes of the crossroad regions, using the position
+    # of the region in the list of crossroad ids as key
+    def build_crossroads_index(self):
+        rids = [rid for rid in self.regions.keys() if self.regions[rid].is_crossroad()]
+        geometry = geo.Geometry.get(self.G)
+        index = si.SpatialIndex(geometry.coordinates(self.regions[rids[0]].nodes[0])[1])
+        for i, rid in enumerate(rids):
+            for n in self.regions[rid].nodes:
+                index.insert(i, geometry.coordinates(n))
+        return rids, index
+
     # return a list of crossroads (main crossroad and possibly contained crossroads)
     def get_crossroad(self, longitude, latitude, multiscale = False):
-        middle_id = min([rid for rid in self.regions.keys() if self.regions[rid].is_crossroad()], key=lambda k: self.regions[k].distance_to(latitude, longitude))
+        # the index is built once, and reused for the next queries
+        if self.crossroads_index == None:
+            self.crossroads_index = self.build_crossroads_index()
+        rids, index = self.crossroads_index
+        middle_id = rids[index.nearest((longitude, latitude), u.Util.coords_distance)]
 
         if multiscale:
             return [self.inner_regions[rid] for rid in self.inner_regions if rid == middle_id or self.regions[middle_id].contains(self.inner_regions[rid])]
@@ -610,22 +776,30 @@ class Segmentation:
     
     ######################### geopackage description ########################
 
+    # reliability scores and region labels are only stored in the graph attributes for the exports
+    def write_attributes_to_graph(self):
+        st.AttributeStore.get(self.G).write_to_graph(self.G)
+
+    # save the nodes and edges (with the ids of their regions), and the crossroads, sub-crossroads
+    # and branches as separated layers. The graph is not modified.
     def to_geopackage(self, filename):
-        # add new attributes
-        nx.set_node_attributes(self.G, values = "", name = "crossroad")
-        nx.set_node_attributes(self.G, values = "", name = "sub_crossroad")
-        nx.set_edge_attributes(self.G, values = "", name = "crossroad")
-        nx.set_edge_attributes(self.G, values = "", name = "sub_crossroad")
-        nx.set_edge_attributes(self.G, values = "", name = "branch")
-
-        # fill attributes according to the computed regions
-        for rid in self.regions:
-            if self.regions[rid].is_crossroad():
-                self.regions[rid].set_graph_attributes("crossroad", "branch")
+        # loaded only for this export (pandas and geopandas are long to import)
+        from . import geopackage as gpkg
+
+        gpkg.GeoPackage(self.G, self.regions, self.inner_regions).save(filename)
 
-        for rid in self.inner_regions:
-            self.inner_regions[rid].set_graph_attributes("sub_crossroad")
 
-        # save graph
-        ox.io.save_graph_geopackage(self.G, filename)
 
+    ######################### snapshot ########################
+
+    # save the graph, the regions and the parameters in a compact binary file
+    def to_snapshot(self, filename):
+        sn.Snapshot.save(filename, self.G, self.regions, getattr(self, "inner_regions", {}), self.get_parameters())
+
+    # restore a segmentation saved by to_snapshot, without processing it again
+    def from_snapshot(filename):
+        G, regions, inner_regions, parameters = sn.Snapshot.load(filename)
+        result = Segmentation(G, init = False, rebuild_regions = False, **parameters)
+        result.regions = regions
+        result.inner_regions = inner_regions
+        return result
@@ -0,0 +1,41 @@
+import networkx as nx
+
+
+class SimpleGraph:
+
+    # the segmentation runs on an undirected simple graph (networkx Graph), with a single edge between two
+    # nodes. The graphs produced by OSMnx (undirected MultiGraph, see get_undirected) are converted when given
+    # to the segmentation, and converted back for the OSMnx functions (rendering, GraphML export). Both graphs
+    # share the same attribute dictionaries, thus the attributes written in one graph are visible in the other.
+
+    # attributes of the edge between u and v
+    def edge(G, u, v):
+        return G._adj[u][v]
+
+    # a simple graph with the nodes, the (first) edges and the attributes of the given undirected graph,
+    # in the same order (nodes, neighbours and edges). The given graph is returned if it is already a simple graph
+    def from_graph(G):
+        if G.is_directed():
+            raise ValueError("an undirected graph is expected (see osmnx.utils_graph.get_undirected)")
+        if not G.is_multigraph():
+            return G
+        result = nx.Graph()
+        result.graph = G.graph
+        # the adjacency is built directly, since adding the edges would change the order of the neighbours
+        for n in G._node:
+            result._node[n] = G._node[n]
+            result._adj[n] = {nb: next(iter(keys.values())) for nb, keys in G._adj[n].items()}
+        return result
+
+    # an undirected MultiGraph (with key 0 for all the edges) sharing the nodes, the edges and the attributes of the given simple graph
+    def to_multigraph(G):
+        if G.is_multigraph():
+            return G
+        result = nx.MultiGraph()
+        result.graph = G.graph
+        # the two directions of an edge share the same attributes, and the same dictionary of keys
+        keys = {}
+        for n in G._node:
+            result._node[n] = G._node[n]
+            result._adj[n] = {nb: keys.setdefault(id(data), {0: data}) for nb, data in G._adj[n].items()}
+        return result
@@ -0,0 +1,150 @@
+import json
+import numpy as np
+
+
+from . import attribute_store as st
+from . import crossroad as cr
+from . import link as lk
+from . import region as rg
+from . import lane_description as ld
+from . import parallel as pl
+
+
+class Snapshot:
+
+    # version 2: edges without key (simple graph)
+    version = 2
+
+    kinds = ["region", "crossroad", "link"]
+
+    # a segmented graph saved in a single uncompressed .npz file: the graph (node coordinates,
+    # adjacency, tags, columns of the attribute store such as the reliability scores and the region labels),
+    # the regions and the inner regions (nodes, edges, center, lanes and branches), and the parameters
+    # of the segmentation. Nodes are stored by index, lane names in JSON, and lanes of a branch by index
+    # in the lanes of the crossroad.
+    def save(filename, G, regions, inner_regions, parameters = {}):
+        store = st.AttributeStore.get(G)
+        arrays, node_tables, edge_tables, graph_attributes = pl.GraphSnapshot.get_arrays(G)
+
+        # kind of each region, as used by the GraphML export
+        for rid in regions:
+            graph_attributes[rg.Region.regiontag_prefix + str(rid)] = "crossroad" if regions[rid].is_crossroad() else "branch"
+
+        arrays.update(Snapshot.regions_to_arrays("regions.", regions, store.node_index))
+        arrays.update(Snapshot.regions_to_arrays("inner_regions.", inner_regions, store.node_index))
+        arrays["metadata"] = np.array(json.dumps({ "version": Snapshot.version,
+                                                   "node_tables": node_tables, "edge_tables": edge_tables,
+                                                   "graph": graph_attributes, "parameters": parameters }))
+        with open(filename, "wb") as f:
+            np.savez(f, **arrays)
+
+    # return the graph, the regions, the inner regions and the parameters saved in the given file
+    def load(filename):
+        with np.load(filename) as data:
+            arrays = {name: data[name] for name in data.files}
+        metadata = json.loads(str(arrays["metadata"]))
+        if metadata["version"] > Snapshot.version:
+            raise ValueError("Unsupported snapshot version: %s" % metadata["version"])
+
+        G = pl.GraphSnapshot.build_graph(arrays, metadata["node_tables"], metadata["edge_tables"], metadata["graph"])
+        store = st.AttributeStore.get(G)
+        for name in arrays:
+            if name.startswith("node:"):
+                store.set_node_column(name[5:], arrays[name])
+            elif name.startswith("edge:"):
+                store.set_edge_column(name[5:], arrays[name])
+
+        regions = Snapshot.regions_from_arrays("regions.", arrays, G, store.nodes)
+        inner_regions = Snapshot.regions_from_arrays("inner_regions.", arrays, G, store.nodes)
+        return G, regions, inner_regions, metadata["parameters"]
+
+    def get_kind(region):
+        if region.is_crossroad():
+            return Snapshot.kinds.index("crossroad")
+        elif region.is_link():
+            return Snapshot.kinds.index("link")
+        else:
+            return Snapshot.kinds.index("region")
+
+    # pointers of a list of lists in a flattened array
+    def get_pointers(sizes):
+        return np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+
+    def regions_to_arrays(prefix, regions, node_index):
+        regions = [regions[rid] for rid in regions]
+        crossroads = [r for r in regions if r.is_crossroad()]
+        described = [r for r in crossroads if hasattr(r, "lanes")]
+        with_branches = [r for r in described if hasattr(r, "branches")]
+
+        arrays = {}
+        arrays["id"] = np.array([r.id for r in regions], dtype=np.int64)
+        arrays["kind"] = np.array([Snapshot.get_kind(r) for r in regions], dtype=np.int8)
+        arrays["filled"] = np.array([r.is_link() and getattr(r, "filled", False) for r in regions], dtype=np.bool_)
+        arrays["nodes_ptr"] = Snapshot.get_pointers([len(r.nodes) for r in regions])
+        arrays["nodes"] = np.array([node_index[n] for r in regions for n in r.nodes], dtype=np.int64)
+        arrays["edges_ptr"] = Snapshot.get_pointers([len(r.edges) for r in regions])
+        arrays["edges"] = np.array([(node_index[e[0]], node_index[e[1]]) for r in regions for e in r.edges], dtype=np.int64).reshape(-1, 2)
+
+        # parameters, center, lanes and branches of the crossroads (if computed)
+        arrays["crossroad.ratio_boundary"] = np.array([c.ratio_boundary for c in crossroads], dtype=np.float64)
+        arrays["crossroad.large_radius"] = np.array([c.large_radius for c in crossroads], dtype=np.float64)
+        arrays["crossroad.center"] = np.array([node_index[c.center] if hasattr(c, "center") else -1 for c in crossroads], dtype=np.int64)
+        arrays["crossroad.described"] = np.array([hasattr(c, "lanes") for c in crossroads], dtype=np.bool_)
+        arrays["crossroad.with_branches"] = np.array([hasattr(c, "branches") for c in described], dtype=np.bool_)
+
+        lanes = [l for c in described for l in c.lanes]
+        arrays["lanes_ptr"] = Snapshot.get_pointers([len(c.lanes) for c in described])
+        arrays["lanes.angle"] = np.array([l.angle for l in lanes], dtype=np.float64)
+        arrays["lanes.name"] = np.array([json.dumps(l.name) for l in lanes], dtype=np.str_)
+        arrays["lanes.edge"] = np.array([(node_index[l.edge[0]], node_index[l.edge[1]]) for l in lanes], dtype=np.int64).reshape(-1, 2)
+
+        branches = []
+        for c in with_branches:
+            index = {id(l): i for i, l in enumerate(c.lanes)}
+            branches.append([[index[id(l)] for l in b] for b in c.branches])
+        arrays["branches_ptr"] = Snapshot.get_pointers([len(b) for b in branches])
+        arrays["branches.lanes_ptr"] = Snapshot.get_pointers([len(b) for bs in branches for b in bs])
+        arrays["branches.lanes"] = np.array([i for bs in branches for b in bs for i in b], dtype=np.int64)
+
+        return {prefix + name: arrays[name] for name in arrays}
+
+    def regions_from_arrays(prefix, arrays, G, nodes):
+        a = {name[len(prefix):]: arrays[name].tolist() for name in arrays if name.startswith(prefix)}
+
+        regions = {}
+        crossroads = []
+        for i, (rid, kind, filled) in enumerate(zip(a["id"], a["kind"], a["filled"])):
+            if Snapshot.kinds[kind] == "crossroad":
+                region = cr.Crossroad(G, target_id = rid)
+                crossroads.append(region)
+            elif Snapshot.kinds[kind] == "link":
+                region = lk.Link(G, target_id = rid)
+                region.filled = filled
+            else:
+                region = rg.Region(G, target_id = rid)
+            region.set_nodes_and_edges([nodes[j] for j in a["nodes"][a["nodes_ptr"][i]:a["nodes_ptr"][i + 1]]],
+                                       [(nodes[j], nodes[k]) for j, k in a["edges"][a["edges_ptr"][i]:a["edges_ptr"][i + 1]]])
+            regions[rid] = region
+
+        described = []
+        for c, ratio_boundary, large_radius, center, is_described in zip(crossroads, a["crossroad.ratio_boundary"], a["crossroad.large_radius"], a["crossroad.center"], a["crossroad.described"]):
+            c.ratio_boundary = ratio_boundary
+            c.large_radius = large_radius
+            if center != -1:
+                c.center = nodes[center]
+            if is_described:
+                described.append(c)
+
+        lanes = [ld.LaneDescription(angle, json.loads(name), (nodes[j], nodes[k])) for angle, name, (j, k) in zip(a["lanes.angle"], a["lanes.name"], a["lanes.edge"])]
+        with_branches = []
+        for i, c in enumerate(described):
+            c.lanes = lanes[a["lanes_ptr"][i]:a["lanes_ptr"][i + 1]]
+            if a["crossroad.with_branches"][i]:
+                with_branches.append(c)
+
+        branches_ptr = a["branches_ptr"]
+        lanes_ptr = a["branches.lanes_ptr"]
+        for i, c in enumerate(with_branches):
+            c.branches = [[c.lanes[j] for j in a["branches.lanes"][lanes_ptr[b]:lanes_ptr[b + 1]]] for b in range(branches_ptr[i], branches_ptr[i + 1])]
+
+        return regions
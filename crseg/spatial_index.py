@@ -0,0 +1,95 @@
+import math
+
+
+class SpatialIndex:
+
+    # approximated length of a degree of latitude (in meters)
+    meters_by_degree = 111320
+
+    # relative error accepted between the local projection and the great circle distance
+    projection_margin = 0.01
+
+    # latitude used to bound the scale of the longitudes (the scale is not defined at the poles)
+    max_latitude = 89.0
+
+    # a regular grid of cells (in a local metric projection) containing the indexed elements.
+    # The projection uses the scale of the longitudes at the given latitude: the queries
+    # are widened along the longitudes using the latitude of the elements (see get_x_factor).
+    def __init__(self, latitude, cell_size = 50):
+        self.cell_size = cell_size
+        self.cos_latitude = math.cos(math.radians(latitude))
+        self.scale_x = SpatialIndex.meters_by_degree * self.cos_latitude
+        self.scale_y = SpatialIndex.meters_by_degree
+        self.cells = {}
+        # the largest absolute latitude of the indexed elements
+        self.poleward_latitude = abs(latitude)
+
+    def project(self, point):
+        return (point[0] * self.scale_x, point[1] * self.scale_y)
+
+    def get_cell(self, point):
+        x, y = self.project(point)
+        return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+    # point is given as (longitude, latitude)
+    def insert(self, key, point):
+        cell = self.get_cell(point)
+        if not cell in self.cells:
+            self.cells[cell] = []
+        self.cells[cell].append((key, point))
+        self.poleward_latitude = max(self.poleward_latitude, abs(point[1]))
+
+    # ratio between a distance along the longitudes in the projection and the same distance on the
+    # ground at the given latitude (larger than 1 poleward of the latitude of the projection)
+    def get_x_factor(self, latitude):
+        latitude = min(abs(latitude), SpatialIndex.max_latitude)
+        return self.cos_latitude / math.cos(math.radians(latitude))
+
+    # return the elements (key, point) contained in the cells at the given ring around the given cell
+    def get_ring(self, cell, ring):
+        if ring == 0:
+            return self.cells.get(cell, [])
+        result = []
+        for i in range(cell[0] - ring, cell[0] + ring + 1):
+            for j in [cell[1] - ring, cell[1] + ring]:
+                result += self.cells.get((i, j), [])
+        for j in range(cell[1] - ring + 1, cell[1] + ring):
+            for i in [cell[0] - ring, cell[0] + ring]:
+                result += self.cells.get((i, j), [])
+        return result
+
+    # return the keys of the elements possibly at a distance smaller than radius from the given point
+    # (a superset, the exact distance has to be checked by the caller)
+    def query(self, point, radius):
+        cell = self.get_cell(point)
+        margin = radius * (1 + SpatialIndex.projection_margin)
+        # the elements within the radius are at most at this latitude
+        latitude = abs(point[1]) + margin / SpatialIndex.meters_by_degree
+        nb_x = int(math.ceil(margin * self.get_x_factor(latitude) / self.cell_size))
+        nb_y = int(math.ceil(margin / self.cell_size))
+        result = []
+        for i in range(cell[0] - nb_x, cell[0] + nb_x + 1):
+            for j in range(cell[1] - nb_y, cell[1] + nb_y + 1):
+                result += [e[0] for e in self.cells.get((i, j), [])]
+        return result
+
+    # return the key of the element closest to the given point, using the given distance function
+    # between two points. If several elements are at the same distance, the smallest key is returned.
+    def nearest(self, point, distance_function):
+        if len(self.cells) == 0:
+            return None
+        cell = self.get_cell(point)
+        best = None
+        max_ring = max([max(abs(c[0] - cell[0]), abs(c[1] - cell[1])) for c in self.cells])
+        # the distances along the longitudes are overestimated by the projection poleward of its latitude
+        x_factor = max(1, self.get_x_factor(max(self.poleward_latitude, abs(point[1]))))
+        for ring in range(0, max_ring + 1):
+            for key, p in self.get_ring(cell, ring):
+                d = distance_function(point, p)
+                if best == None or d < best[0] or (d == best[0] and key < best[1]):
+                    best = (d, key)
+            # all the elements closer than this distance have been visited
+            visited = ring * self.cell_size * (1 - SpatialIndex.projection_margin) / x_factor
+            if best != None and best[0] < visited:
+                break
+        return best[1]
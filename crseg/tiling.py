@@ -0,0 +1,205 @@
+import math
+import concurrent.futures
+import numpy as np
+
+
+from . import crossroad as cr
+from . import region as rg
+from . import regionfactory as rf
+from . import geometry as geo
+from . import attribute_store as st
+from . import parallel as pl
+
+
+class Tiling:
+
+    # snapshot of the graph in a worker process
+    worker_snapshot = None
+
+    # a segmentation is computed on each tile extended by a halo margin. The halo has to be larger
+    # than the largest crossroad (including its ring) to obtain the same result as a single-process run.
+    # Workers build the graph of each tile from a shared snapshot of the graph, with the same order
+    # of nodes and neighbours, and the stitched regions are numbered and ordered as in a single-process run.
+    def __init__(self, G, tile_size = 1000, halo = 300):
+        self.G = G
+        self.tile_size = tile_size
+        self.halo = halo
+
+        self.init_projection()
+        self.build_tiles()
+
+    def init_projection(self):
+        self.geometry = geo.Geometry.get(self.G)
+        px, py = self.geometry.projected()
+        self.width = float(px.max())
+        self.height = float(py.max())
+
+    # local metric coordinates of a node
+    def project(self, n):
+        px, py = self.geometry.projected()
+        i = self.geometry.index[n]
+        return (px[i], py[i])
+
+    def get_tile_id(self, n):
+        x, y = self.project(n)
+        return (int(x // self.tile_size), int(y // self.tile_size))
+
+    def build_tiles(self):
+        nb_x = int(self.width // self.tile_size) + 1
+        nb_y = int(self.height // self.tile_size) + 1
+        halo_tiles = int(math.ceil(self.halo / self.tile_size))
+
+        # core nodes of each tile
+        self.cores = {}
+        for n in self.G.nodes:
+            tid = self.get_tile_id(n)
+            if not tid in self.cores:
+                self.cores[tid] = []
+            self.cores[tid].append(n)
+
+        # nodes of each tile including the halo margin (as increasing indices of the nodes in the graph)
+        self.tiles = {}
+        for tid in sorted(self.cores):
+            xmin = tid[0] * self.tile_size - self.halo
+            xmax = (tid[0] + 1) * self.tile_size + self.halo
+            ymin = tid[1] * self.tile_size - self.halo
+            ymax = (tid[1] + 1) * self.tile_size + self.halo
+            nodes = []
+            for i in range(max(0, tid[0] - halo_tiles), min(nb_x, tid[0] + halo_tiles + 1)):
+                for j in range(max(0, tid[1] - halo_tiles), min(nb_y, tid[1] + halo_tiles + 1)):
+                    if (i, j) in self.cores:
+                        for n in self.cores[(i, j)]:
+                            x, y = self.project(n)
+                            if x >= xmin and x < xmax and y >= ymin and y < ymax:
+                                nodes.append(self.geometry.index[n])
+            self.tiles[tid] = np.sort(np.array(nodes, dtype=np.int64))
+
+    def init_worker(description):
+        Tiling.worker_snapshot = pl.GraphSnapshot.attach(description)
+
+    # graph of a tile (given by the indices of its nodes), with the reliability computed on the full graph
+    def get_tile_graph(nodes):
+        snapshot = Tiling.worker_snapshot
+        arrays = snapshot.arrays
+        G = pl.GraphSnapshot.build_graph(arrays, snapshot.node_tables, snapshot.edge_tables, snapshot.graph_attributes, nodes)
+
+        # the edges of the tile are in the same order as in the full graph
+        kept = np.zeros(len(arrays["nodes"]), dtype=bool)
+        kept[nodes] = True
+        edges = np.flatnonzero(kept[arrays["edge_u"]] & kept[arrays["edge_v"]])
+        store = st.AttributeStore.get(G)
+        for name in [n[5:] for n in snapshot.layout if n.startswith("node:")]:
+            store.set_node_column(name, arrays["node:" + name][nodes])
+        for name in [n[5:] for n in snapshot.layout if n.startswith("edge:")]:
+            store.set_edge_column(name, arrays["edge:" + name][edges])
+        return G
+
+    # run the segmentation pipeline on a tile (in a worker process), and return
+    # a description of the computed crossroads that can be sent back to the main process.
+    # Inner regions are given with their lanes (copied from the merged crossroads when they have been
+    # created) and the key of their creation (see Segmentation.merge_linked_crossroads)
+    def process_tile(nodes, parameters):
+        from . import segmentation as cs
+
+        G = Tiling.get_tile_graph(nodes)
+        # reliability has been computed on the full graph, only initialize regions
+        rg.Region.init_attr(G)
+        seg = cs.Segmentation(G, init = False, rebuild_regions = False, **parameters)
+        seg.process()
+
+        crossroads = [Tiling.region_to_data(seg.regions[rid]) for rid in seg.regions if seg.regions[rid].is_crossroad()]
+        inner_regions = [(Tiling.region_to_data(seg.inner_regions[rid]), seg.inner_regions[rid].lanes, seg.inner_regions_origin[rid]) \
+                         for rid in seg.inner_regions]
+        return crossroads, inner_regions
+
+    def region_to_data(region):
+        return (region.nodes, region.edges, region.center, region.ratio_boundary, region.large_radius)
+
+    def region_from_data(G, data, set_labels = True):
+        nodes, edges, center, ratio_boundary, large_radius = data
+        result = cr.Crossroad(G, scale = ratio_boundary, large_radius = large_radius)
+        if set_labels:
+            for n in nodes:
+                result.add_node(n)
+            for e in edges:
+                result.add_edge(e)
+        else:
+            result.set_nodes_and_edges(nodes, edges)
+        result.center = center
+        return result
+
+    def process(self, parameters, workers = None):
+        tids = sorted(self.tiles)
+
+        # the reliability computed on the full graph is sent to the tiles with the snapshot
+        snapshot = pl.GraphSnapshot(self.G)
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = Tiling.init_worker, initargs = (snapshot.get_description(),)) as executor:
+                results = list(executor.map(Tiling.process_tile, [self.tiles[tid] for tid in tids], [parameters] * len(tids)))
+        finally:
+            snapshot.close(True)
+
+        return self.stitch(tids, results)
+
+    # build a consistent set of regions from the crossroads computed in each tile.
+    # Only the crossroads with a center inside the core of their tile are kept, and crossroads
+    # computed in two tiles and sharing edges are merged.
+    def stitch(self, tids, results):
+        rg.Region.init_attr(self.G)
+
+        crossroads = {}
+        inner_regions = []
+        owners = {}
+        for tid, (tile_crossroads, inners) in zip(tids, results):
+            core_nodes = set(self.cores[tid])
+            kept = []
+            for data in tile_crossroads:
+                if not data[2] in core_nodes:
+                    continue
+                kept.append(data)
+                # crossroads can share boundary nodes, but not edges
+                existing = []
+                for e in data[1]:
+                    key = frozenset(e)
+                    if key in owners and not owners[key] in existing:
+                        existing.append(owners[key])
+                if len(existing) == 0:
+                    c = Tiling.region_from_data(self.G, data)
+                    crossroads[c.id] = c
+                else:
+                    c = crossroads[existing[0]]
+                    c.merge([Tiling.region_from_data(self.G, data, False)] + [crossroads[o] for o in existing[1:]])
+                    for o in existing[1:]:
+                        del crossroads[o]
+                for e in c.edges:
+                    owners[frozenset(e)] = c.id
+
+            # inner regions are kept if they are part of a kept crossroad
+            for data, lanes, origin in inners:
+                if len([k for k in kept if set(data[0]).issubset(k[0])]) != 0:
+                    inner_regions.append((data, lanes, origin))
+
+        # in a single-process run, crossroads are built (thus numbered) following the order of the
+        # nodes, and the first node of a crossroad is the one it has been built from
+        index = self.geometry.index
+        rg.Region.init_attr(self.G)
+        regions = {}
+        for c in sorted(crossroads.values(), key = lambda c: index[c.nodes[0]]):
+            c = Tiling.region_from_data(self.G, Tiling.region_to_data(c))
+            regions[c.id] = c
+
+        # branches are rebuilt on the complete graph
+        for rid in regions:
+            regions[rid].build_lanes_description()
+
+        links = rf.RegionFactory.build_links_between_crossings(self.G, regions)
+        regions.update(links)
+
+        # then the inner regions are created by the merges, in the order of the crossroads they come from
+        result = {}
+        for data, lanes, origin in sorted(inner_regions, key = lambda x: (x[2][0], index[x[2][1]])):
+            inner = Tiling.region_from_data(self.G, data, False)
+            inner.lanes = lanes
+            result[inner.id] = inner
+
+        return regions, result
@@ -1,39 +1,30 @@
-import osmnx as ox
-import requests
+import os
 import tempfile
-import geopandas as gp
-from shapely.geometry import Point
 
 from . import region as r
+from . import geometry as geo
+from . import chain_index as ci
+from . import osm_cache as oc
+from . import simple_graph as sg
+from . import graph_core as gc
 
 class Util:
 
+    # OpenStreetMap API endpoint used to download data (can be replaced, for example by a local server)
+    osm_api_url = "https://www.openstreetmap.org/api/0.6/map"
 
     def centroid(G, points):
-        x = 0.0
-        y = 0.0
-        for p in points:
-            x += G.nodes[p]["x"]
-            y += G.nodes[p]["y"]
-        return (x / len(points), y / len(points))
+        return geo.Geometry.get(G).centroid(points)
 
     def coords_distance(point1, point2):
-        x1 = point1[0]
-        y1 = point1[1]
-        x2 = point2[0]
-        y2 = point2[1]
-        return ox.distance.great_circle_vec(lat1=y1, lng1=x1, lat2=y2, lng2=x2)
+        return geo.Geometry.haversine(point1, point2)
 
     def distance_to(G, node, point):
-        x1 = G.nodes[node]["x"]
-        y1 = G.nodes[node]["y"]
-        x2 = point[0]
-        y2 = point[1]
-        return ox.distance.great_circle_vec(lat1=y1, lng1=x1, lat2=y2, lng2=x2)
+        return geo.Geometry.get(G).distance_to(node, point)
 
     # links are shorter than real paths
     def distance_with_shortcut(G, node1, node2):
-        gEdge = G[node1][node2][0]
+        gEdge = sg.SimpleGraph.edge(G, node1, node2)
         coef = 1
         if "highway" in gEdge and gEdge["highway"] in ["primary_link", "secondary_link", "tertiary_link", "trunk_link", "motorway_link"]:
             coef = 0.5
@@ -42,29 +33,14 @@ class Util:
         return Util.distance(G, node1, node2) * coef
 
     def distance(G, node1, node2):
-        x1 = G.nodes[node1]["x"]
-        y1 = G.nodes[node1]["y"]
-        x2 = G.nodes[node2]["x"]
-        y2 = G.nodes[node2]["y"]
-        return ox.distance.great_circle_vec(lat1=y1, lng1=x1, lat2=y2, lng2=x2)
+        return geo.Geometry.get(G).distance(node1, node2)
 
+    # nodes are given by their id, or by their coordinates
     def bearing(G, node1, node2):
-        if isinstance(node1, int):
-            x1 = G.nodes[node1]["x"]
-            y1 = G.nodes[node1]["y"]
-        else:
-            x1 = node1[0]
-            y1 = node1[1]
-        if isinstance(node2, int):
-            x2 = G.nodes[node2]["x"]
-            y2 = G.nodes[node2]["y"]
-        else:
-            x2 = node2[0]
-            y2 = node2[1]
-        return ox.bearing.calculate_bearing(y1, x1, y2, x2)
+        return geo.Geometry.get(G).bearing(node1, node2)
 
     def length(G, path):
-        return sum([Util.distance(G, p1, p2) for p1, p2 in zip(path, path[1:])])
+        return geo.Geometry.get(G).length(path)
 
     def length_with_shortcut(G, path):
         return sum([Util.distance_with_shortcut(G, p1, p2) for p1, p2 in zip(path, path[1:])])
@@ -77,31 +53,40 @@ class Util:
             a += 360 
         return abs(a)
 
+    # neighbours (ids) and degree of a node, given by the graph core
+    def neighbors(G, n):
+        return gc.GraphCore.get(G).neighbors(n)
+
+    def degree(G, n):
+        return gc.GraphCore.get(G).degree(n)
+
     def is_inside_parking(G, node):
-        for nb in G.neighbors(node):
-            if (not "service" in G[node][nb][0]) or (G[node][nb][0]["service"] != "parking_aisle"):
+        for nb in Util.neighbors(G, node):
+            gEdge = sg.SimpleGraph.edge(G, node, nb)
+            if (not "service" in gEdge) or (gEdge["service"] != "parking_aisle"):
                 return False
         return True
 
     def get_adjacent_streetnames(G, node):
         streetnames = set()
-        for nb in G.neighbors(node):
-            if "name" in G[node][nb][0]:
-                streetnames.add(G[node][nb][0]["name"])
-            elif "ref" in G[node][nb][0]:
-                streetnames.add(G[node][nb][0]["ref"])
+        for nb in Util.neighbors(G, node):
+            gEdge = sg.SimpleGraph.edge(G, node, nb)
+            if "name" in gEdge:
+                streetnames.add(gEdge["name"])
+            elif "ref" in gEdge:
+                streetnames.add(gEdge["ref"])
             else:
                 streetnames.add(None)
         return list(streetnames)
 
     def is_biffurcation(G, n):
-        return len(list(G.neighbors(n))) > 2
+        return Util.degree(G, n) > 2
 
     def is_middle_polyline(G, n):
-        return len(list(G.neighbors(n))) == 2
+        return Util.degree(G, n) == 2
 
     def get_opposite_node(G, n, other):
-        for nb in G.neighbors(n):
+        for nb in Util.neighbors(G, n):
             if nb != other:
                 return nb
         # will not append
@@ -109,52 +94,46 @@ class Util:
 
 
     def get_path_to_biffurcation(G, n1, n2, max = -1):
-        path = [n1, n2]
-        length = Util.distance(G, n1, n2)
-
-        while (max < 0 or length < max) and Util.is_middle_polyline(G, path[len(path) - 1]):
-            path.append(Util.get_opposite_node(G, path[len(path) - 1], path[len(path) - 2]))
-            length += Util.distance(G, path[len(path) - 2], path[len(path) - 1])
-        
-        return path
+        return ci.ChainIndex.get(G).get_path(G, n1, n2, max)
 
     # return true if two the node is part of 3 edges, and
     # if two of them are one-way
     def is_street_separation(G, n):
-        if len(G[n]) != 3:
+        if Util.degree(G, n) != 3:
             return False
         
-        return len([nb for nb in G.neighbors(n) if "oneway" in G[n][nb][0] and G[n][nb][0]["oneway"]]) >= 2
+        return len([nb for nb in Util.neighbors(G, n) if sg.SimpleGraph.edge(G, n, nb).get("oneway", False)]) >= 2
 
     def is_part_of_local_triangle(G, n, max_perimeter = 150):
+        index = ci.ChainIndex.get(G)
 
-        paths = [ Util.get_path_to_biffurcation(G, n, nb) for nb in G.neighbors(n)]
+        paths = [ index.get_chain(G, n, nb) for nb in Util.neighbors(G, n)]
 
         for i1, p1 in enumerate(paths):
 
-            p1_end = p1[len(p1) - 1]
-            p1_end_paths = [ Util.get_path_to_biffurcation(G, p1_end, nb) for nb in G.neighbors(p1_end)]
-            p1_end_neighbors = [ p[len(p) - 1] for p in p1_end_paths]
+            p1_end = p1.end()
+            p1_end_paths = [ index.get_chain(G, p1_end, nb) for nb in Util.neighbors(G, p1_end)]
+            p1_end_neighbors = [ p.end() for p in p1_end_paths]
 
             for i2 in range(i1, len(paths)):
                 p2 = paths[i2]
-                p2_end = p2[len(p2) - 1]
+                p2_end = p2.end()
                 if p2_end in p1_end_neighbors:
-                    p = [ path for path in p1_end_paths if path[len(path) - 1] == p2_end][0]
-                    l = Util.length(G, p1) + Util.length(G, p2) + Util.length(G, p)
+                    p = [ path for path in p1_end_paths if path.end() == p2_end][0]
+                    l = p1.length() + p2.length() + p.length()
                     if l < max_perimeter:
                         return True
 
         return False
 
     def has_non_labeled_adjacent_edge(G, n):
-        for nb in G.neighbors(n):
-            if G[n][nb][0][r.Region.label_region] == -1:
+        for nb in Util.neighbors(G, n):
+            if r.Region.unknown_region_edge_in_graph(G, (n, nb)):
                 return True
         return False
 
     def estimate_edge_width(G, edge):
-        gEdge = G[edge[0]][edge[1]][0]
+        gEdge = sg.SimpleGraph.edge(G, edge[0], edge[1])
         import re
         if "width" in gEdge and not re.match(r'^-?\d+(?:\.\d+)$', gEdge["width"]) is None:
             return float(gEdge["width"])
@@ -192,40 +171,102 @@ class Util:
         return result
 
 
+    # OSM tags kept in the graphs built by OSMnx
+    def get_useful_tags():
+        import osmnx as ox
+
+        return ["way:" + t for t in ox.settings.useful_tags_way] + ["node:" + t for t in ox.settings.useful_tags_node]
+
+    # bounding box (west, south, east, north) of the square of half size radius around the given point
+    def get_bbox(latitude, longitude, radius):
+        import geopandas as gp
+        from shapely.geometry import Point
+
+        p = Point(longitude, latitude)
+        gdf_p = gp.GeoDataFrame(geometry=[p]).set_crs('EPSG:4326').to_crs('EPSG:3857')
+        pb = gdf_p.buffer(distance=radius).envelope
+        gdf_l = gp.GeoDataFrame(geometry=pb).to_crs('EPSG:4326')
+        poly = gdf_l['geometry'][0]
+        long1 = poly.exterior.coords.xy[0][0]
+        long2 = poly.exterior.coords.xy[0][1]
+        lat1 = poly.exterior.coords.xy[1][0]
+        lat2 = poly.exterior.coords.xy[1][2]
+        return (long1, lat1, long2, lat2)
+
     def get_osm_data(latitude, longitude, radius, overpass,
                      useful_tags_way = [], useful_tags_node = [],
-                     tmpfile = None):
+                     tmpfile = None, cache = None):
+        import osmnx as ox
+
         if overpass:
-            G = ox.graph_from_point((latitude, longitude), dist=radius, network_type="all", retain_all=False, truncate_by_edge=True, simplify=False)
+            key = oc.OSMCache.get_key(ox.utils_geo.bbox_from_point((latitude, longitude), dist=radius), Util.get_useful_tags(), "overpass")
+            G = cache.get_graph(key) if cache != None else None
+            if G == None:
+                G = ox.graph_from_point((latitude, longitude), dist=radius, network_type="all", retain_all=False, truncate_by_edge=True, simplify=False)
+                if cache != None:
+                    cache.put_graph(key, G)
+            return G
+        else:
+            return Util.get_osm_data_by_bbox(Util.get_bbox(latitude, longitude, radius), overpass, useful_tags_way, useful_tags_node, tmpfile, cache)
+
+    # bbox is given as (west, south, east, north)
+    def get_osm_data_by_bbox(bbox, overpass,
+                     useful_tags_way = [], useful_tags_node = [],
+                     tmpfile = None, cache = None):
+        import osmnx as ox
+        from . import osm_reader as osm
+
+        long1, lat1, long2, lat2 = bbox
+        if overpass:
+            key = oc.OSMCache.get_key(bbox, Util.get_useful_tags(), "overpass-bbox")
+            G = cache.get_graph(key) if cache != None else None
+            if G == None:
+                G = ox.graph_from_bbox(lat2, lat1, long2, long1, network_type="all", retain_all=True, truncate_by_edge=True, simplify=False)
+                if cache != None:
+                    cache.put_graph(key, G)
         else:
             # add information about cycleways
-            ox.settings.useful_tags_way = ox.settings.useful_tags_way + useful_tags_way
-            ox.settings.useful_tags_node = ox.settings.useful_tags_node + useful_tags_node
-
-            p = Point(longitude, latitude)
-            gdf_p = gp.GeoDataFrame(geometry=[p]).set_crs('EPSG:4326').to_crs('EPSG:3857')
-            pb = gdf_p.buffer(distance=radius).envelope
-            gdf_l = gp.GeoDataFrame(geometry=pb).to_crs('EPSG:4326')
-            poly = gdf_l['geometry'][0]
-            long1 = poly.exterior.coords.xy[0][0]
-            long2 = poly.exterior.coords.xy[0][1]
-            lat1 = poly.exterior.coords.xy[1][0]
-            lat2 = poly.exterior.coords.xy[1][2]
-            r = requests.get("https://www.openstreetmap.org/api/0.6/map?bbox=%s,%s,%s,%s"%(long1, lat1, long2, lat2), 
+            ox.settings.useful_tags_way = ox.settings.useful_tags_way + [t for t in useful_tags_way if not t in ox.settings.useful_tags_way]
+            ox.settings.useful_tags_node = ox.settings.useful_tags_node + [t for t in useful_tags_node if not t in ox.settings.useful_tags_node]
+
+            key = oc.OSMCache.get_key(bbox, Util.get_useful_tags(), Util.osm_api_url)
+            filename = cache.get(key) if cache != None else None
+            if filename != None:
+                try:
+                    return osm.OSMReader.read_graph(filename, ox.settings.useful_tags_way, ox.settings.useful_tags_node)
+                except OSError:
+                    # the entry has been evicted by a concurrent job: it is downloaded again
+                    pass
+
+            import requests
+            r = requests.get("%s?bbox=%s,%s,%s,%s"%(Util.osm_api_url, long1, lat1, long2, lat2), 
                             allow_redirects=True)
             if r.status_code != 200:
                 print("Error from OpenStreetMap API. You should try using overpass.")
                 return None
-            if tmpfile:
-                tmp = tmpfile
-            else:
-                tmp = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=".xml")
-            open(tmp.name, 'wb').write(r.content)
-            G = ox.graph_from_xml(tmp.name, simplify=False, retain_all=True)
+            if cache != None:
+                filename = cache.put(key, r.content, ".osm")
+                try:
+                    return osm.OSMReader.read_graph(filename, ox.settings.useful_tags_way, ox.settings.useful_tags_node)
+                except OSError:
+                    # the entry has been evicted by a concurrent job: the downloaded data is read from a temporary file
+                    pass
+            elif tmpfile:
+                filename = tmpfile.name
+                open(filename, 'wb').write(r.content)
+                return osm.OSMReader.read_graph(filename, ox.settings.useful_tags_way, ox.settings.useful_tags_node)
+
+            # the temporary file is removed once the graph has been built
+            with tempfile.TemporaryDirectory() as tmpdir:
+                filename = os.path.join(tmpdir, "data.osm")
+                open(filename, 'wb').write(r.content)
+                G = osm.OSMReader.read_graph(filename, ox.settings.useful_tags_way, ox.settings.useful_tags_node)
         return G
 
 
     def get_surrouding_region(filename):
+        import geopandas as gp
+
         file = open(filename)
         df = gp.read_file(file)
         minx, miny, maxx, maxy = df.total_bounds
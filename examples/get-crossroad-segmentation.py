@@ -25,6 +25,9 @@ import crseg.segmentation as cs
 import crseg.reliability as r
 import crseg.region as rg
 import crseg.utils as u
+import crseg.osm_cache as oc
+import crseg.osm_reader as osm
+import crseg.simple_graph as sg
 import json
 
 # load predefined crossroad coordinates
@@ -42,16 +45,32 @@ input_params.add_argument('--by-coordinates', nargs=2, help='Load input from OSM
 input_params.add_argument('--by-selection', help='Load an input file (geoJSON) that contains predefined regions (polylines) corresponding to the inner part of the intersection, and use it to load the corresponding OSM data.', type=argparse.FileType('r'))
 input_params.add_argument('--by-name', help='Load input from OSM using a predefined region', choices=[n for n in coordsByName])
 input_params.add_argument('--from-graphml', help='Load road graph from a GraphML file', type=argparse.FileType('r'))
-input_params.add_argument('--from-osmxml', help='Load road graph from an OSM XML file', type=argparse.FileType('r'))
+input_params.add_argument('--from-osmxml', help='Load road graph from an OSM file (XML: .osm or .osm.bz2, or PBF: .osm.pbf, using pyosmium)', type=argparse.FileType('r'))
+input_params.add_argument('--from-snapshot', help='Load a segmented road graph from a snapshot (.npz) generated by --to-snapshot, without processing it again', type=argparse.FileType('rb'))
 group_input.add_argument('--overpass', help='Use Overpass to download data instead of the OSM api', action='store_true')
+group_input.add_argument('--osm-api-url', help='URL of the OSM api used to download data. Default: %s' % u.Util.osm_api_url, type=str)
+
+group_cache = parser.add_argument_group("Cache", "Downloaded OSM data are stored in a local cache, reused by the next runs on the same region")
+group_cache.add_argument('--no-cache', help='Do not use the local cache', action='store_true')
+group_cache.add_argument('--cache-dir', help='Directory of the cache. Default: %s' % oc.OSMCache.default_directory, type=str)
+group_cache.add_argument('--cache-max-size', help='Maximum size of the cache (in MB). Default: %d.' % (oc.OSMCache.default_max_size // (1024 * 1024)), type=float)
+group_cache.add_argument('--cache-max-age', help='Maximum age of the cached data (in hours). Default: no limit.', type=float)
 
 parser.add_argument('-r', '--radius', help='Radius (in meter) where the crossroads will be reconstructed. Default: 150m', type=float, default=150)
 parser.add_argument('--C0', help='First parameter to drive the boundary detection. Length distance is computed by multiplying this parameter by the width of the streets. Default: 2.', type=float, default=2)
 parser.add_argument('--C1', help='Second parameter to drive the first merge. Length distance is computed by multiplying this parameter by the width of the streets. Default: 2.', type=float, default=2)
 parser.add_argument('--C2', help='Third parameter to drive the final merge (2: small intensiy, 7: strong intensity). Default: 4.', type=float, default=4)
 parser.add_argument('--max-cycle-elements', help='Maximum number of small crossroads to be combined as a ring in a large crossroad. Default: 10.', type=int, default=10)
+parser.add_argument('--max-cycle-work', help='Maximum number of steps of the search for rings starting from each crossroad, to bound the processing time with a large --max-cycle-elements. Default: no limit.', type=int)
 parser.add_argument('--similar-direction-angle', help='Maximum angle for lanes to be considered inside the same branch (in degree). Default: 60.', type=int, default=60)
 parser.add_argument('-v', '--verbose', help='Verbose messages', action='store_true')
+parser.add_argument('--stats', help='Print the time spent in each stage of the processing, and some counters (crossroads, merges, cycles, shortest paths, etc.)', action='store_true')
+
+group_parallel = parser.add_argument_group("Parallel processing", "Split large regions into tiles processed by a pool of processes, or process the crossroads in a pool of processes")
+group_parallel.add_argument('--tile-size', help='Size (in meter) of the tiles used to process the region in parallel. Default: no tiling.', type=float)
+group_parallel.add_argument('--halo', help='Margin (in meter) added around each tile. It should be larger than the largest crossroad. Default: 300m.', type=float, default=300)
+group_parallel.add_argument('--executor', help='Run the per-crossroad stages (lanes, missing paths, branches) in the main process (serial) or in a pool of processes (process), with the same result. Default: serial.', choices=["serial", "process"], default="serial")
+group_parallel.add_argument('--workers', help='Number of worker processes. Default: number of processors.', type=int)
 
 parser.add_argument('--skip-processing', help="Do not compute segmentation (can be useful to store OSM data without modification, or to use result of a previous run by loading a GraphML.", action='store_true')
 
@@ -71,6 +90,7 @@ group_output.add_argument('--to-graphml', help='Generate a GraphML file with the
 group_output.add_argument('--to-json-all', help='Generate a json description of the crossings', type=argparse.FileType('w'))
 group_output.add_argument('--to-json', help='Generate a json description of the crossing in the middle of the map', type=argparse.FileType('w'))
 group_output.add_argument('--to-geopackage', help='Generate a geopackage of the complete region (.gpkg)', type=FileOpener('w'))
+group_output.add_argument('--to-snapshot', help='Generate a compact binary snapshot (.npz) of the segmented graph, that can be loaded by --from-snapshot', type=argparse.FileType('wb'))
 
 # handle bash autocomplete
 argcomplete.autocomplete(parser)
@@ -89,7 +109,16 @@ if byname in coordsByName:
 
 from_graphml = args.from_graphml
 from_osmxml = args.from_osmxml
+from_snapshot = args.from_snapshot
 overpass = args.overpass
+if args.osm_api_url:
+    u.Util.osm_api_url = args.osm_api_url
+if args.no_cache:
+    cache = None
+else:
+    cache = oc.OSMCache(args.cache_dir,
+                        None if args.cache_max_size == None else int(args.cache_max_size * 1024 * 1024),
+                        None if args.cache_max_age == None else args.cache_max_age * 3600)
 
 # set input parameters
 radius = args.radius
@@ -101,6 +130,7 @@ if args.by_selection:
 byselection = args.by_selection
 
 verbose = args.verbose
+stats = args.stats
 
 display = args.display
 display_reliability = args.display_reliability
@@ -113,20 +143,34 @@ to_graphml = args.to_graphml
 to_json = args.to_json
 to_json_all = args.to_json_all
 to_geopackage = args.to_geopackage
+to_snapshot = args.to_snapshot
 skip_processing = args.skip_processing
 multiscale = args.multiscale
 C0 = args.C0
 C1 = args.C1
 C2 = args.C2
 max_cycle_elements = args.max_cycle_elements
+max_cycle_work = args.max_cycle_work
 similar_direction_angle = args.similar_direction_angle
+tile_size = args.tile_size
+halo = args.halo
+workers = args.workers
+executor = args.executor
 
 # load data
 
 if verbose:
     print("=== DOWNLOADING DATA ===")
 
-if from_graphml:
+if from_snapshot:
+    seg = cs.Segmentation.from_snapshot(from_snapshot.name)
+    # graph used by the OSMnx functions (rendering, GraphML export)
+    G = sg.SimpleGraph.to_multigraph(seg.G)
+    # load parameters
+    latitude = G.graph["cr.latitude"]
+    longitude = G.graph["cr.longitude"]
+    radius = G.graph["cr.radius"]
+elif from_graphml:
     G = ox.io.load_graphml(from_graphml.name, 
                                 node_dtypes={r.Reliability.boundary_reliability: float, 
                                         r.Reliability.crossroad_reliability: float,
@@ -144,9 +188,9 @@ else:
         # load parameters from filename (lat_lon_date.osm)
         latitude = float(os.path.basename(from_osmxml.name).split('_')[0])
         longitude = float(os.path.basename(from_osmxml.name).split('_')[1])
-        G = ox.graph_from_xml(from_osmxml.name, simplify=False)
+        G = osm.OSMReader.read_graph(from_osmxml.name)
     else:
-        G = u.Util.get_osm_data(latitude, longitude, radius, overpass, ["cycleway", "cycleway:right", "cycleway:left", "psv"])
+        G = u.Util.get_osm_data(latitude, longitude, radius, overpass, ["cycleway", "cycleway:right", "cycleway:left", "psv"], cache = cache)
 
     if G is None:
         exit(2)
@@ -180,15 +224,18 @@ if verbose:
 if skip_processing:
     print("=== SKIP INITIALISATION ===")
     seg = cs.Segmentation(G, False)
+elif from_snapshot:
+    if verbose:
+        print("=== SKIP INITIALISATION (SNAPSHOT) ===")
 else:
     if verbose:
         print("=== INITIALISATION ===")
 
     # segment it using topology and semantic
     if byselection:
-        seg = cs.Segmentation(G, C0 = C0, C1 = C1, C2 = C2, max_cycle_elements = max_cycle_elements, selection = byselection.name, similar_direction_angle=similar_direction_angle)
+        seg = cs.Segmentation(G, C0 = C0, C1 = C1, C2 = C2, max_cycle_elements = max_cycle_elements, max_cycle_work = max_cycle_work, executor = executor, workers = workers, selection = byselection.name, similar_direction_angle=similar_direction_angle)
     else:
-        seg = cs.Segmentation(G, C0 = C0, C1 = C1, C2 = C2, max_cycle_elements = max_cycle_elements, similar_direction_angle=similar_direction_angle)
+        seg = cs.Segmentation(G, C0 = C0, C1 = C1, C2 = C2, max_cycle_elements = max_cycle_elements, max_cycle_work = max_cycle_work, executor = executor, workers = workers, similar_direction_angle=similar_direction_angle)
 
 if display_reliability:
     print("=== RENDERING RELIABILITY ===")
@@ -205,13 +252,23 @@ if display_reliability:
 
 if skip_processing:
     print("=== SKIP SEGMENTATION ===")
+elif from_snapshot:
+    if verbose:
+        print("=== SKIP SEGMENTATION (SNAPSHOT) ===")
 else:
     if display or display_segmentation or to_text or to_text_all or to_gexf or \
-     to_json or to_json_all or to_graphml or display_main_crossroad or to_geopackage: # or any other next step
+     to_json or to_json_all or to_graphml or display_main_crossroad or to_geopackage or to_snapshot or stats: # or any other next step
         if verbose:
             print("=== SEGMENTATION ===")
-        seg.process()
+        if tile_size:
+            seg.process_by_tiles(tile_size, halo, workers)
+        else:
+            seg.process()
+
 
+if stats:
+    print("=== STATISTICS ===")
+    print(seg.instrumentation.to_text())
 
 if to_text_all:
     if verbose:
@@ -285,12 +342,16 @@ if to_gexf:
         for att in att_list:
             d.pop(att, None)
 
+    seg.write_attributes_to_graph()
+
     # Simplify after removing attribute
     nx.write_gexf(G, to_gexf.name)
 
 if to_graphml:
     if verbose:
         print("=== EXPORT IN GraphML ===")
+    seg.write_attributes_to_graph()
+
     # Store parameters
     G.graph["cr.latitude"] = latitude
     G.graph["cr.longitude"] = longitude
@@ -300,4 +361,14 @@ if to_graphml:
     # TODO: store for each region id its kind (crossing or branch)
     ox.io.save_graphml(G, to_graphml.name)
 
+if to_snapshot:
+    if verbose:
+        print("=== EXPORT IN SNAPSHOT ===")
+
+    # Store parameters
+    G.graph["cr.latitude"] = latitude
+    G.graph["cr.longitude"] = longitude
+    G.graph["cr.radius"] = radius
+    seg.to_snapshot(to_snapshot.name)
+
 
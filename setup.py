@@ -32,6 +32,7 @@ setup(
     entry_points={
         'console_scripts': [
             'get_crossroad_segmentation = crseg.cmd:get_crossroad_segmentation_command',
+            'get_crossroad_segmentation_batch = crseg.cmd:get_crossroad_segmentation_batch_command',
         ],
     },
 )
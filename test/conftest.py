@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# the tests use the package and the synthetic networks of the benchmark from the source tree
+root_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_directory)
+sys.path.insert(0, os.path.join(root_directory, "benchmark"))
+
+
+# a function building the prepared undirected graph of a synthetic network (kind, radius), as the command line tool
+@pytest.fixture
+def synthetic_network(tmp_path):
+    import osmnx as ox
+    import crseg.segmentation as cs
+    import crseg.osm_reader as osm
+    from synthetic import SyntheticNetwork
+
+    def load(kind, radius):
+        filename = str(tmp_path / ("%s-%d.osm" % (kind, radius)))
+        SyntheticNetwork(kind, radius).to_osm_xml(filename)
+        G = osm.OSMReader.read_graph(filename)
+        G = cs.Segmentation.prepare_network(G)
+        return ox.utils_graph.get_undirected(G)
+    return load
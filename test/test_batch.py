@@ -0,0 +1,47 @@
+import copy
+import json
+
+import pytest
+import osmnx as ox
+
+import crseg.segmentation as cs
+import crseg.osm_reader as osm
+import crseg.region as rg
+import crseg.batch as bt
+import crseg.utils as u
+from synthetic import SyntheticNetwork
+
+
+# the data given by the OSM API for a bounding box: the ways with a node inside, with all their nodes
+def get_api_extract(network, G, bbox):
+    inside = set([n for n in G.nodes if bbox[0] <= G.nodes[n]["x"] <= bbox[2] and bbox[1] <= G.nodes[n]["y"] <= bbox[3]])
+    result = copy.copy(network)
+    result.ways = [w for w in network.ways if len(inside.intersection(w[0])) != 0]
+    needed = set([n for w in result.ways for n in w[0]])
+    result.nodes = {n: network.nodes[n] for n in network.nodes if n in needed}
+    return result
+
+
+# each query gives the same crossroads as a single run on the data downloaded for its region
+@pytest.mark.parametrize("kind", SyntheticNetwork.kinds)
+def test_queries_match_single_runs(kind, tmp_path):
+    network = SyntheticNetwork(kind, 500)
+    filename = str(tmp_path / "network.osm")
+    network.to_osm_xml(filename)
+    G = osm.OSMReader.read_graph(filename)
+
+    queries = [(str(i), network.latitude + dy, network.longitude + dx) for i, (dx, dy) in enumerate([(0, 0), (0.003, 0.001), (-0.002, -0.002)])]
+    batch = bt.Batch(queries, 150)
+    batch.load_graph(G)
+    id_region = rg.Region.id_region
+    results = batch.process()
+    assert rg.Region.id_region == id_region
+
+    for (name, latitude, longitude), result in zip(queries, results):
+        get_api_extract(network, G, u.Util.get_bbox(latitude, longitude, 150)).to_osm_xml(filename)
+        H = ox.utils_graph.get_undirected(cs.Segmentation.prepare_network(osm.OSMReader.read_graph(filename)))
+        rg.Region.id_region = 0
+        seg = cs.Segmentation(H)
+        seg.process()
+        expected = [x.to_json_data() for x in seg.get_crossroad(longitude, latitude, False)]
+        assert json.dumps(result["crossroads"], sort_keys=True) == json.dumps(expected, sort_keys=True)
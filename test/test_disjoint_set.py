@@ -0,0 +1,45 @@
+import crseg.disjoint_set as ds
+
+
+# union(x, y) keeps the representative of the set of x, and its elements first
+def test_order_and_representatives():
+    sets = ds.DisjointSet()
+    for x in range(8):
+        sets.add(x)
+    sets.union(0, 1)
+    sets.union(2, 3)
+    sets.union(3, 4)
+    # the set of 2 is the largest one, but the representative and the first elements are the ones of 0
+    sets.union(1, 4)
+    assert sets.find(4) == 0 and sets.find(2) == 0
+    assert sets.get_elements(3) == [0, 1, 2, 3, 4]
+
+    sets.union(7, 6)
+    sets.union(5, 3)
+    assert sets.find(0) == 5
+    assert sets.get_elements(0) == [5, 0, 1, 2, 3, 4]
+    assert sets.get_elements(6) == [7, 6]
+    assert sets.same(6, 7) and not sets.same(6, 0)
+
+    # merging two elements of the same set changes nothing
+    sets.union(2, 4)
+    assert sets.find(2) == 5 and sets.get_elements(2) == [5, 0, 1, 2, 3, 4]
+
+
+# elements never added are a set on their own
+def test_missing_elements():
+    sets = ds.DisjointSet()
+    assert sets.find("a") == "a"
+    assert sets.get_elements("a") == ["a"]
+    assert not "a" in sets
+    sets.union("a", "b")
+    assert "a" in sets and sets.get_elements("b") == ["a", "b"]
+
+
+# merging elements one by one in a single set
+def test_chain():
+    sets = ds.DisjointSet()
+    for x in range(1, 10000):
+        sets.union(x, x - 1)
+    assert sets.find(0) == 9999
+    assert sets.get_elements(0) == list(range(9999, -1, -1))
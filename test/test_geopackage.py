@@ -0,0 +1,30 @@
+import geopandas as gp
+import pyogrio
+import pytest
+
+import crseg.segmentation as cs
+
+
+# each crossroad (including the ones without edge) has a non empty geometry, with a single geometry type by layer
+@pytest.mark.parametrize("kind", ["grid", "roundabouts"])
+def test_region_layers(kind, tmp_path, synthetic_network):
+    seg = cs.Segmentation(synthetic_network(kind, 500))
+    seg.process()
+    filename = str(tmp_path / "segmentation.gpkg")
+    seg.to_geopackage(filename)
+
+    crossroads = [r for r in seg.regions.values() if r.is_crossroad()]
+    assert any([len(c.edges) == 0 for c in crossroads])
+    for layer, nb, geometry_type in [("crossroads", len(crossroads), "GeometryCollection"),
+                                     ("sub_crossroads", len(seg.inner_regions), "GeometryCollection"),
+                                     ("branches", sum([len(c.branches) for c in crossroads]), "MultiLineString")]:
+        if nb == 0:
+            continue
+        assert pyogrio.read_info(filename, layer=layer)["geometry_type"] == geometry_type
+        df = gp.read_file(filename, layer=layer)
+        assert len(df) == nb
+        assert not df.geometry.is_empty.any()
+
+    df = gp.read_file(filename, layer="crossroads").set_index("id")
+    for c in crossroads:
+        assert len(df.geometry[c.id].geoms) == len(c.edges) + len(c.nodes)
@@ -0,0 +1,66 @@
+import json
+
+import networkx as nx
+
+import crseg.segmentation as cs
+import crseg.graph_core as gc
+import crseg.attribute_store as st
+import crseg.geometry as geo
+
+
+def get_square():
+    G = nx.Graph()
+    for n, (x, y) in enumerate([(3.0, 45.0), (3.001, 45.0), (3.001, 45.001), (3.0, 45.001)]):
+        G.add_node(n, x=x, y=y)
+    G.add_edges_from([(0, 1), (1, 2), (2, 3)])
+    return G
+
+
+# the caches built on a graph are built again after a modification of the graph and a call to invalidate
+def test_invalidate():
+    G = get_square()
+    assert gc.GraphCore.get(G).neighbors(0) == (1,)
+    assert (2, 3) in st.AttributeStore.get(G).edge_index
+    assert geo.Geometry.get(G).coords[3][0] == 3.0
+
+    # same number of nodes
+    G.remove_edge(2, 3)
+    G.add_edge(3, 0)
+    G.nodes[3]["x"] = 2.999
+    gc.GraphCore.invalidate(G)
+
+    assert gc.GraphCore.get(G).neighbors(0) == (1, 3)
+    assert gc.GraphCore.get(G).degree(2) == 1
+    assert not (2, 3) in st.AttributeStore.get(G).edge_index and (3, 0) in st.AttributeStore.get(G).edge_index
+    assert geo.Geometry.get(G).coords[3][0] == 2.999
+
+
+def to_json(seg, filename):
+    seg.to_json_all(filename, False)
+    with open(filename) as f:
+        return json.load(f)
+
+
+# replace an edge by another one (the number of nodes does not change)
+def modify(G):
+    u, v = list(G.edges())[len(G.edges) // 2]
+    G.remove_edge(u, v)
+    nodes = list(G.nodes)
+    G.add_edge(nodes[0], nodes[-1], highway="residential", osmid=0, length=100.0, oneway=False, reversed=False)
+
+
+# a graph modified after a first segmentation is segmented as a new graph
+def test_segmentation_of_a_modified_graph(tmp_path, synthetic_network):
+    G = nx.Graph(synthetic_network("grid", 300))
+    # modified without a first segmentation (the copy keeps the order of the nodes and of the neighbours)
+    H = G.copy()
+    modify(H)
+
+    cs.Segmentation(G).process()
+    modify(G)
+
+    seg = cs.Segmentation(G)
+    seg.process()
+    expected = cs.Segmentation(H)
+    expected.process()
+    assert to_json(seg, tmp_path / "seg.json") == to_json(expected, tmp_path / "expected.json")
@@ -0,0 +1,105 @@
+import os
+import json
+import threading
+import http.server
+import multiprocessing
+
+import crseg.osm_cache as oc
+import crseg.utils as u
+from synthetic import SyntheticNetwork
+
+
+def put_entries(directory, job):
+    cache = oc.OSMCache(directory, max_size = 10000)
+    for i in range(30):
+        cache.put("job%d-%d" % (job, i), b"x" * 1000, ".osm")
+
+
+# concurrent jobs sharing a cache keep an index consistent with the files, and the maximum size
+def test_concurrent_jobs(tmp_path):
+    jobs = [multiprocessing.Process(target=put_entries, args=(str(tmp_path), job)) for job in range(4)]
+    for job in jobs:
+        job.start()
+    for job in jobs:
+        job.join()
+        assert job.exitcode == 0
+
+    with open(tmp_path / oc.OSMCache.index_filename) as f:
+        index = json.load(f)
+    files = [f for f in os.listdir(tmp_path) if f.endswith(".osm")]
+    assert sorted([entry["file"] for entry in index.values()]) == sorted(files)
+    assert sum([entry["size"] for entry in index.values()]) <= 10000
+
+
+# a local OSM API answering all the queries with a synthetic network. Return the server and the list of the queries
+def start_stub_server(tmp_path, monkeypatch):
+    filename = str(tmp_path / "network.osm")
+    SyntheticNetwork("grid", 200).to_osm_xml(filename)
+    with open(filename, "rb") as f:
+        content = f.read()
+
+    requests = []
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(u.Util, "osm_api_url", "http://127.0.0.1:%d/api/0.6/map" % server.server_address[1])
+    return server, requests
+
+
+def stop_stub_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+# the data downloaded from the OSM API is read from the cache at the second query
+def test_download_from_stub_server(tmp_path, monkeypatch):
+    server, requests = start_stub_server(tmp_path, monkeypatch)
+    try:
+        cache = oc.OSMCache(str(tmp_path / "cache"))
+        bbox = (3.0, 45.0, 3.01, 45.01)
+        G1 = u.Util.get_osm_data_by_bbox(bbox, False, cache = cache)
+        G2 = u.Util.get_osm_data_by_bbox(bbox, False, cache = cache)
+    finally:
+        stop_stub_server(server)
+
+    assert len(requests) == 1
+    assert requests[0].startswith("/api/0.6/map?bbox=3.0,45.0,3.01,45.01")
+    assert len(G1.nodes) > 0
+    assert list(G1.nodes) == list(G2.nodes) and list(G1.edges) == list(G2.edges)
+
+
+# an entry removed by a concurrent job after get is handled as a missing entry
+def test_entry_evicted_after_get(tmp_path, monkeypatch):
+    cache = oc.OSMCache(str(tmp_path / "cache"))
+    get = cache.get
+    def get_and_evict(key):
+        path = get(key)
+        if path != None:
+            os.remove(path)
+        return path
+    monkeypatch.setattr(cache, "get", get_and_evict)
+
+    cache.put_graph("graph", {"nodes": [1, 2]})
+    assert cache.get_graph("graph") == None
+
+    server, requests = start_stub_server(tmp_path, monkeypatch)
+    try:
+        bbox = (3.0, 45.0, 3.01, 45.01)
+        G1 = u.Util.get_osm_data_by_bbox(bbox, False, cache = cache)
+        G2 = u.Util.get_osm_data_by_bbox(bbox, False, cache = cache)
+    finally:
+        stop_stub_server(server)
+
+    assert len(requests) == 2
+    assert len(G1.nodes) > 0 and list(G1.nodes) == list(G2.nodes)
@@ -0,0 +1,58 @@
+import pytest
+import osmnx as ox
+
+import crseg.segmentation as cs
+import crseg.osm_reader as osm
+from synthetic import SyntheticNetwork
+
+
+def write_osm(filename, nodes, ways):
+    with open(filename, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for nid, (lat, lon) in nodes.items():
+            f.write('  <node id="%d" lat="%.7f" lon="%.7f"/>\n' % (nid, lat, lon))
+        for wid, (way_nodes, tags) in ways.items():
+            f.write('  <way id="%d">\n' % wid)
+            for n in way_nodes:
+                f.write('    <nd ref="%d"/>\n' % n)
+            for k, v in tags.items():
+                f.write('    <tag k="%s" v="%s"/>\n' % (k, v))
+            f.write('  </way>\n')
+        f.write('</osm>\n')
+
+
+def get_edges(G):
+    return sorted([(u, v) for u, v, k in G.edges(keys=True)])
+
+
+def prepare(G):
+    return cs.Segmentation.prepare_network(G)
+
+
+# the graph read and prepared is the same as the graph built by OSMnx and prepared
+def compare_with_osmnx(filename):
+    G1 = prepare(ox.graph_from_xml(filename, simplify=False))
+    G2 = prepare(osm.OSMReader.read_graph(filename))
+    assert list(G1.nodes) == list(G2.nodes)
+    assert get_edges(G1) == get_edges(G2)
+
+
+# a way in construction overlapping another way is used to identify the supplementary highways
+# before being removed
+def test_overlapping_construction(tmp_path):
+    filename = str(tmp_path / "construction.osm")
+    nodes = {1: (45.0, 3.0), 2: (45.0, 3.001), 3: (45.0, 3.002), 4: (45.0, 3.003), 5: (45.001, 3.002)}
+    ways = {10: ([1, 2, 3, 4], {"highway": "residential"}),
+            11: ([2, 3], {"highway": "construction", "name": "Rue des Travaux"}),
+            12: ([3, 5], {"highway": "residential"})}
+    write_osm(filename, nodes, ways)
+
+    compare_with_osmnx(filename)
+    assert get_edges(prepare(osm.OSMReader.read_graph(filename))) == [(3, 4), (3, 5), (4, 3), (5, 3)]
+
+
+@pytest.mark.parametrize("kind", SyntheticNetwork.kinds)
+def test_synthetic_networks(kind, tmp_path):
+    filename = str(tmp_path / ("%s.osm" % kind))
+    SyntheticNetwork(kind, 300).to_osm_xml(filename)
+    compare_with_osmnx(filename)
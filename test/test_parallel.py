@@ -0,0 +1,24 @@
+import pytest
+
+import crseg.segmentation as cs
+from synthetic import SyntheticNetwork
+
+
+def to_json(seg, filename):
+    seg.to_json_all(filename, True)
+    with open(filename) as f:
+        return f.read()
+
+
+# the per-crossroad stages run by a pool of processes give the same result as a serial processing
+@pytest.mark.parametrize("kind", SyntheticNetwork.kinds)
+def test_process_executor_matches_serial(kind, tmp_path, synthetic_network):
+    G = synthetic_network(kind, 500)
+
+    seg = cs.Segmentation(G.copy())
+    seg.process()
+
+    parallel = cs.Segmentation(G.copy(), executor = "process", workers = 2)
+    parallel.process()
+
+    assert to_json(parallel, tmp_path / "parallel.json") == to_json(seg, tmp_path / "serial.json")
@@ -0,0 +1,45 @@
+import geopandas as gp
+from shapely.geometry import Point, box
+
+import crseg.segmentation as cs
+import crseg.region as rg
+
+
+# labels given by a polygon-by-polygon processing: each polygon labels its nodes, and the edges
+# with both extremities labelled by this polygon (or by a previous one, if not overwritten)
+def get_reference_labels(G, polygons):
+    nodes = {}
+    edges = {}
+    for idPoly, polygon in enumerate(polygons):
+        for n in G.nodes:
+            if polygon.intersects(Point(G.nodes[n]["x"], G.nodes[n]["y"])):
+                nodes[n] = idPoly
+        for u, v in G.edges():
+            if nodes.get(u, -1) >= 0 and nodes.get(u, -1) == nodes.get(v, -1):
+                edges[frozenset((u, v))] = nodes[u]
+    return nodes, edges
+
+
+# with overlapping polygons, an edge is part of the last polygon containing both its extremities
+def test_overlapping_polygons(tmp_path, synthetic_network):
+    G = synthetic_network("grid", 300)
+    xs = [G.nodes[n]["x"] for n in G.nodes]
+    ys = [G.nodes[n]["y"] for n in G.nodes]
+    minx, maxx, miny, maxy = min(xs), max(xs), min(ys), max(ys)
+    dx, dy = maxx - minx, maxy - miny
+
+    polygons = [box(minx + 0.1 * dx, miny + 0.1 * dy, minx + 0.6 * dx, miny + 0.6 * dy),
+                box(minx + 0.35 * dx, miny + 0.35 * dy, minx + 0.9 * dx, miny + 0.9 * dy),
+                box(minx + 0.2 * dx, miny + 0.45 * dy, minx + 0.5 * dx, miny + 0.75 * dy)]
+    filename = str(tmp_path / "selection.geojson")
+    gp.GeoDataFrame(geometry=polygons, crs="EPSG:4326").to_file(filename, driver="GeoJSON")
+
+    seg = cs.Segmentation(G, selection=filename)
+    seg.set_tags_from_selection()
+
+    nodes, edges = get_reference_labels(seg.G, polygons)
+    assert len(set(edges.values())) == len(polygons)
+    for n in seg.G.nodes:
+        assert rg.Region.get_node_region(seg.G, n) == nodes.get(n, -1)
+    for u, v in seg.G.edges():
+        assert rg.Region.get_edge_region(seg.G, (u, v)) == edges.get(frozenset((u, v)), -1)
@@ -0,0 +1,24 @@
+import random
+
+import pytest
+
+import crseg.spatial_index as si
+import crseg.geometry as geo
+
+
+# an index built at a given latitude finds the same elements as a brute force search at other latitudes
+@pytest.mark.parametrize("latitude", [30, 45, 47, 50, 60, -50])
+def test_queries_far_from_the_reference_latitude(latitude):
+    rd = random.Random(latitude)
+    index = si.SpatialIndex(45.0)
+    points = [(3 + rd.uniform(-0.05, 0.05), latitude + rd.uniform(-0.03, 0.03)) for k in range(1000)]
+    for k, p in enumerate(points):
+        index.insert(k, p)
+
+    for q in range(100):
+        center = (3 + rd.uniform(-0.04, 0.04), latitude + rd.uniform(-0.02, 0.02))
+        radius = rd.uniform(20, 400)
+        distances = [geo.Geometry.haversine(center, p) for p in points]
+        found = set(index.query(center, radius))
+        assert set([k for k, d in enumerate(distances) if d < radius]) <= found
+        assert index.nearest(center, geo.Geometry.haversine) == min(range(len(points)), key=lambda k: (distances[k], k))
@@ -0,0 +1,25 @@
+import pytest
+
+import crseg.segmentation as cs
+from synthetic import SyntheticNetwork
+
+
+def to_json(seg, filename):
+    seg.to_json_all(filename, True)
+    with open(filename) as f:
+        return f.read()
+
+
+# the tiled processing gives the same crossroads (in the same order) as a single-process run
+@pytest.mark.parametrize("kind", SyntheticNetwork.kinds)
+@pytest.mark.parametrize("tile_size, halo", [(300, 100), (500, 300)])
+def test_tiles_match_single_process(kind, tile_size, halo, tmp_path, synthetic_network):
+    G = synthetic_network(kind, 500)
+
+    seg = cs.Segmentation(G.copy())
+    seg.process()
+
+    tiled = cs.Segmentation(G.copy())
+    tiled.process_by_tiles(tile_size, halo, 2)
+
+    assert to_json(tiled, tmp_path / "tiled.json") == to_json(seg, tmp_path / "serial.json")